@@ -1,10 +1,22 @@
 import requests
-from bs4 import BeautifulSoup
 import json
 from datetime import datetime, timezone, timedelta
-import time
+import asyncio
 import os
 import re
+
+from advisory_extraction import (
+    GRAPH_BASE,
+    extract_advisory_stations,
+    evaluate_advisory,
+    get_message_body,
+    get_session,
+    list_messages,
+    make_rejection,
+    missing_mandatory_fields,
+)
+from mail_fetch import InlineBodyFetcher
+from mail_pipeline import run_pipeline
  
 # ===================== ENV LOADING =====================
  
@@ -49,8 +61,8 @@ headers = {
     "Prefer": 'outlook.body-content-type="html"'
 }
  
-# Base URL for Microsoft Graph
-GRAPH_BASE = "https://graph.microsoft.com/v1.0"
+# pooled Graph session (keep-alive, 429/503 Retry-After retries) for reply / archive calls
+graph = get_session()
  
 # Separate headers for JSON POST calls (like move → Archive)
 archive_headers = {
@@ -66,12 +78,6 @@ if IS_LOCAL_ENV and not os.path.exists(OUTPUT_DIR):
  
 IST_OFFSET = timezone(timedelta(hours=5, minutes=30))
  
-MONTH_MAP = {
-    "jan": 1, "feb": 2, "mar": 3, "apr": 4,
-    "may": 5, "jun": 6, "jul": 7, "aug": 8,
-    "sep": 9, "oct": 10, "nov": 11, "dec": 12
-}
- 
 # ===================== UTILS =====================
  
 def sanitize_filename(filename: str) -> str:
@@ -89,263 +95,25 @@ def convert_to_ist_format(utc_datetime_str: str) -> str:
         ist_dt = datetime.now(IST_OFFSET)
         return ist_dt.strftime("%Y-%m-%dT%H:%M:%SZ+05:30")
  
-def parse_mail_received_datetime(dt_str: str):
-    """
-    Mail ke receivedDateTime ko datetime object me convert karo (UTC aware).
-    """
-    if not dt_str:
-        return None
-    try:
-        # Graph format: 2025-11-22T13:45:10Z
-        return datetime.fromisoformat(dt_str.replace('Z', '+00:00')).astimezone(timezone.utc)
-    except Exception:
-        return None
- 
-def build_utc_from_dd_mon_hhmm(match_obj, mail_dt_utc):
-    """
-    '1500/23 Nov' jaisi string se proper UTC datetime banao.
-    Year agar missing hai to mail ke year se lo.
-    """
-    try:
-        hhmm = match_obj.group(1)   # 1500
-        day = int(match_obj.group(2))  # 23
-        mon_abbr = match_obj.group(3).lower()  # nov
- 
-        if len(hhmm) == 4:
-            hour = int(hhmm[:2])
-            minute = int(hhmm[2:])
-        elif len(hhmm) == 3:
-            hour = int(hhmm[:1])
-            minute = int(hhmm[1:])
-        else:
-            return None
- 
-        month = MONTH_MAP.get(mon_abbr)
-        if not month:
-            return None
- 
-        # 1) Default year = mail receive year
-        if mail_dt_utc is None:
-            year = datetime.now(timezone.utc).year
-        else:
-            year = mail_dt_utc.year
- 
-            # Dec mail, Jan advisory -> next year
-            if mail_dt_utc.month == 12 and month == 1:
-                year += 1
- 
-        dt_utc = datetime(year, month, day, hour, minute, 0, tzinfo=timezone.utc)
-        return dt_utc
-    except Exception:
-        return None
- 
-def parse_advisory_times(window_lines, mail_received_dt_str):
-    """
-    Extract raw Start UTC and raw End UTC from table.
-    Column mapping in text:
-      1) Start UTC
-      2) Start LT
-      3) End UTC
-      4) End LT
-    """
- 
-    pattern = re.compile(r'(\d{3,4}/\d{1,2}\s*[A-Za-z]{3})')
-    matches = []
- 
-    for line in window_lines:
-        for m in pattern.finditer(line):
-            matches.append(m.group(1).strip())
- 
-    # We need at least 3 matches (index 0 = start UTC, index 2 = end UTC)
-    if len(matches) < 3:
-        return None
- 
-    start_raw = matches[0]    # Start UTC
-    end_raw = matches[2]      # End UTC (correct column)
- 
-    return start_raw, end_raw
- 
- 
 # ===================== FIELD LABEL CHECK =====================
  
 def check_mandatory_fields_in_html(html_content: str):
-    required_keys = {
-        "station",
-        "weatherPhenomenon",
-        "operationProbability",
-        "advisoryTimePeriodStartUTC",
-        "advisoryTimePeriodEndUTC",
-    }
- 
-    if not html_content or not html_content.strip():
-        return list(required_keys)
- 
-    html_lower = html_content.lower()
-    simple = re.sub(r'[^a-z0-9]', '', html_lower)
- 
-    present = set()
- 
-    if 'station' in html_lower or 'station' in simple:
-        present.add("station")
- 
-    cond_weather = (
-        ('weather' in html_lower and ('phenomenon' in html_lower or 'phenom' in html_lower))
-        or 'weatherphenomenon' in simple
-        or 'weatherphenom' in simple
-    )
-    if cond_weather:
-        present.add("weatherPhenomenon")
- 
-    cond_op_prob = (
-        (('operation' in html_lower or 'operational' in html_lower)
-         and ('probability' in html_lower or 'probab' in html_lower))
-        or 'operationprobability' in simple
-        or 'operationalprobability' in simple
-        or 'operationprobab' in simple
-    )
-    if cond_op_prob:
-        present.add("operationProbability")
- 
-    cond_start_utc = (
-        ('advisory' in html_lower and 'start' in html_lower and 'utc' in html_lower)
-        or 'advisorytimeperiodstartutc' in simple
-        or 'timeperiodstartutc' in simple
-        or 'periodstartutc' in simple
-    )
-    if cond_start_utc:
-        present.add("advisoryTimePeriodStartUTC")
- 
-    cond_end_utc = (
-        ('advisory' in html_lower and 'end' in html_lower and 'utc' in html_lower)
-        or 'advisorytimeperiodendutc' in simple
-        or 'timeperiodendutc' in simple
-        or 'periodendutc' in simple
-    )
-    if cond_end_utc:
-        present.add("advisoryTimePeriodEndUTC")
- 
-    missing = [k for k in required_keys if k not in present]
-    return missing
+    """Returns the list of mandatory field labels missing from the body (advisory_extraction)."""
+    return missing_mandatory_fields(html_content)
  
 # ===================== NLP-STYLE EXTRACTION =====================
  
 def extract_weather_stations_nlp(html_content: str, mail_received_dt: str = None):
-    soup = BeautifulSoup(html_content, "html.parser")
-    text = soup.get_text("\n", strip=True)
-    lines = [l.strip() for l in text.splitlines() if l.strip()]
- 
-    stations = []
-    n = len(lines)
-    i = 0
- 
-    while i < n:
-        line = lines[i]
- 
-        # Station code = exactly 3 uppercase letters
-        if re.fullmatch(r"[A-Z]{3}", line):
-            station_code = line
-            entry = {"station": station_code}
- 
-            window = lines[i + 1: i + 15]
- 
-            # ---------- operationProbability (FIXED) ----------
-            prob_val = None
- 
-            # 1) Prefer numbers that are directly associated with a % sign,
-            #    e.g. "30%", " 75 %", etc.
-            for w in window:
-                m = re.search(r"(\d{1,3})\s*%", w)
-                if m:
-                    val = int(m.group(1))
-                    if 0 <= val <= 100:
-                        prob_val = val
-                        break
- 
- 
- 
- 
-            if prob_val is not None:
-                # store as integer, % sign is ignored
-                entry["operationProbability"] = prob_val
- 
-            # ---------- weatherPhenomenon ----------
-            for w in window:
-                if re.fullmatch(r"[A-Z]{2,6}", w) and w != station_code:
-                    entry["weatherPhenomenon"] = w
-                    break
- 
-            # ---------- advisory times (UTC only) ----------
-            time_result = parse_advisory_times(window, mail_received_dt)
-            if time_result:
-                start_utc_str, end_utc_str = time_result
-                entry["advisoryTimePeriodStartUTC"] = start_utc_str
-                entry["advisoryTimePeriodEndUTC"] = end_utc_str
- 
-            # Mandatory 5 fields only
-            mandatory = [
-                "station",
-                "weatherPhenomenon",
-                "operationProbability",
-                "advisoryTimePeriodStartUTC",
-                "advisoryTimePeriodEndUTC",
-            ]
-            if all(k in entry for k in mandatory):
-                stations.append(entry)
- 
-        i += 1
- 
-    return stations
+    # ADVISORY_EXTRACTOR strategy: table columns when the advisory is a table, line windows otherwise
+    return extract_advisory_stations(html_content, mail_received_dt)
  
 # ===================== GRAPH API EMAIL FUNCTIONS =====================
  
 def get_all_messages(page_size: int = 50, max_pages: int = None):
-    url = (
-        f"{GRAPH_BASE}/users/{USER_EMAIL}/messages"
-        f"?$top={page_size}"
-        "&$orderby=receivedDateTime desc"
-        "&$select=id,subject,receivedDateTime,from"
-    )
- 
-    all_messages = []
-    page_count = 0
- 
-    while url and (max_pages is None or page_count < max_pages):
-        print(f"Fetching page {page_count + 1}...")
-        resp = requests.get(url, headers=headers)
- 
-        if resp.status_code != 200:
-            print(f"Error fetching messages: {resp.status_code}")
-            print("Response:", resp.text)
-            break
- 
-        data = resp.json()
-        messages = data.get("value", [])
-        all_messages.extend(messages)
- 
-        print(f"Retrieved {len(messages)} messages from page {page_count + 1}")
+    return list_messages(USER_EMAIL, headers, folder=None, page_size=page_size, max_pages=max_pages)
  
-        url = data.get("@odata.nextLink")
-        page_count += 1
-        time.sleep(0.5)
- 
-    print(f"Total messages retrieved: {len(all_messages)}")
-    return all_messages
- 
-def get_message_body_html(message_id: str) -> str:
-    url = (
-        f"{GRAPH_BASE}/users/{USER_EMAIL}/messages/{message_id}"
-        "?$select=subject,body"
-    )
- 
-    resp = requests.get(url, headers=headers)
-    if resp.status_code != 200:
-        print(f"Error fetching message body for {message_id}: {resp.status_code}")
-        print("Response:", resp.text)
-        return ""
- 
-    data = resp.json()
-    body = data.get("body", {})
-    return body.get("content", "")
+def get_message_body_html(message_id: str) -> str | None:
+    return get_message_body(USER_EMAIL, message_id, headers)
  
 # ===================== ARCHIVE HELPERS =====================
  
@@ -355,7 +123,7 @@ def get_archive_folder_id() -> str | None:
     Uses the well-known 'Archive' folder name.
     """
     url = f"{GRAPH_BASE}/users/{USER_EMAIL}/mailFolders/Archive"
-    resp = requests.get(url, headers=archive_headers)
+    resp = graph.get(url, headers=archive_headers)
  
     if resp.status_code == 200:
         data = resp.json()
@@ -384,7 +152,7 @@ def move_message_to_archive(message_id: str) -> bool:
     url = f"{GRAPH_BASE}/users/{USER_EMAIL}/messages/{message_id}/move"
     body = {"destinationId": archive_id}
  
-    resp = requests.post(url, headers=archive_headers, json=body)
+    resp = graph.post(url, headers=archive_headers, json=body)
  
     if resp.status_code == 201:  # Created = moved successfully
         moved_msg = resp.json()
@@ -400,38 +168,40 @@ def move_message_to_archive(message_id: str) -> bool:
  
 # ===================== MAIN PROCESSING =====================
  
+def evaluate_email(message, body_html: str):
+    """(weather_advisory, None), or (None, rejection) with the reasons (advisory_extraction)."""
+    stations, rejection = evaluate_advisory(body_html, message.get("receivedDateTime", ""))
+    if rejection:
+        return None, rejection
+ 
+    weather_advisory = {
+        "createdAt": convert_to_ist_format(message.get("receivedDateTime", "")),
+        "stations": stations
+    }
+    return weather_advisory, None
+ 
+def reject_email(message, rejection) -> None:
+    """No error reply from this script: rejected emails are only reported."""
+ 
 def process_single_email(message):
+    """
+    Fetch and check one email on its own; rejected emails go through reject_email.
+    Returns weather advisory dict or None if invalid.
+    """
     try:
         body_html = get_message_body_html(message["id"])
-        if not body_html:
-            print("   ❌ No HTML body found – Skipping this email.")
+        if body_html is None:
+            print("   ⏭️  Body could not be fetched – left for the next run.")
             return None
- 
-        # 1) Check mandatory field labels
-        missing_fields = check_mandatory_fields_in_html(body_html)
-        if missing_fields:
-            print(f"   ❌ Missing mandatory field(s) in mail body: {', '.join(missing_fields)} – Skipping this email.")
-            return None
- 
-        print("   ✅ All 5 mandatory field labels found in body – running NLP extractor...")
- 
-        stations = extract_weather_stations_nlp(
-            body_html,
-            mail_received_dt=message.get("receivedDateTime", "")
-        )
- 
-        if not stations:
-            print("   ❌ NLP extractor could not find any complete stations – Skipping this email.")
+        weather_advisory, rejection = evaluate_email(message, body_html)
+        if rejection:
+            reject_email(message, rejection)
             return None
- 
-        weather_advisory = {
-            "createdAt": convert_to_ist_format(message.get("receivedDateTime", "")),
-            "stations": stations
-        }
         return weather_advisory
  
     except Exception as e:
         print(f"   ❌ Error processing email: {e}")
+        reject_email(message, make_rejection(extra_reason=f"Internal processing error: {e}"))
         return None
  
 def process_all_emails(save_files: bool | None = None):
@@ -462,12 +232,25 @@ def process_all_emails(save_files: bool | None = None):
     all_messages = get_all_messages(page_size=50)
     successful_extractions = 0
     skipped_emails = 0
- 
-    for idx, message in enumerate(all_messages):
+    deferred = 0
+ 
+    results = asyncio.run(run_pipeline(
+        all_messages,
+        fetch_bodies=InlineBodyFetcher(get_message_body_html).fetch_bodies,
+        evaluate=evaluate_email,
+        reject=reject_email,
+    ))
+ 
+    # results come back in the original message order
+    for result in results:
+        idx, message, weather_advisory = result.index, result.message, result.advisory
         subject = message.get('subject', 'No Subject')[:80]
         print(f"\nProcessing email {idx + 1}/{len(all_messages)}: {subject}...")
  
-        weather_advisory = process_single_email(message)
+        if result.error and not weather_advisory and not result.rejection:
+            print(f"   ⏭️  {result.error} – left for the next run.")
+            deferred += 1
+            continue
  
         if weather_advisory:
             if save_files:
@@ -491,16 +274,20 @@ def process_all_emails(save_files: bool | None = None):
  
             successful_extractions += 1
         else:
+            rejection = result.rejection
+            if rejection["missing_fields"] and not rejection["extra_reason"]:
+                print(f"   ❌ Missing mandatory field(s) in mail body: {', '.join(rejection['missing_fields'])} – Skipping this email.")
+            else:
+                print(f"   ❌ {rejection['extra_reason'] or 'No complete stations could be extracted'} – Skipping this email.")
             skipped_emails += 1
  
-        time.sleep(0.2)
- 
     print("\n" + "=" * 60)
     print("🎯 EMAIL PROCESSING SUMMARY")
     print("=" * 60)
     print(f"📧 Total emails processed: {len(all_messages)}")
     print(f"✅ Successful extractions: {successful_extractions}")
     print(f"⏭️  Skipped emails: {skipped_emails}")
+    print(f"⏳ Left for the next run (body fetch failed): {deferred}")
     if save_files:
         print(f"📁 Files saved in: {OUTPUT_DIR}/")
     else:
@@ -21,7 +21,7 @@ from azure.eventhub.aio import EventHubProducerClient
 # >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
 #  IMPORT YOUR EMAIL-EXTRACTOR LOGIC HERE
 # >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
-from latest_test import (
+from email_extraction import (
     get_all_messages,
     process_single_email,
     move_message_to_archive,   # 👈 NEW
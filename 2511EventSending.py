@@ -21,11 +21,18 @@ from azure.eventhub.aio import EventHubProducerClient
 # >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
 #  IMPORT YOUR EMAIL-EXTRACTOR LOGIC HERE
 # >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
-from Email_Extraction import (
+from email_extraction import (
+    MAIL_SYNC_MODE,
     get_all_messages,
-    process_single_email,
-    move_message_to_archive,   # NEW
+    get_new_messages,
+    commit_new_messages,
+    archive_messages,
+    evaluate_email,
+    reply_to_rejected_email,
+    body_fetcher,
+    get_ledger,
 )
+from mail_pipeline import run_pipeline
 # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<
 
 # ------------------ LOGGING ------------------
@@ -237,14 +244,17 @@ async def send_events_batch(num_events: int = 10) -> None:
 
 async def send_all_advisories_from_email() -> None:
     """
-    High-level pipeline (single-pass):
+    High-level pipeline (mail_pipeline.run_pipeline, several emails at a time):
 
-      - Fetch emails via Graph
-      - For each email:
-          * Extract advisory JSON using process_single_email()
+      - List emails via Graph (delta or full, MAIL_SYNC_MODE)
+      - Fetch bodies (body_fetcher) and evaluate each email (evaluate_email)
+      - Accepted advisory:
           * If ENV=local → save JSON file
-          * Immediately send that advisory as an Event to Azure Event Hub
-          * If Event send is successful → move that email to Archive
+          * Send it as an Event to Azure Event Hub
+      - Rejected email → error reply to the sender (reply_to_rejected_email)
+      - Rejected emails and sent advisories → moved to Archive, 20 per
+        Graph $batch request (archive_messages)
+      - Each stage is recorded in the ledger (get_ledger), so a rerun resumes
     """
     if not CONNECTION_STRING:
         raise ValueError(
@@ -261,14 +271,16 @@ async def send_all_advisories_from_email() -> None:
     print(f"EventHub: {EVENTHUB_NAME} | Namespace: {EVENTHUB_NAMESPACE}")
     print("=" * 60)
 
-    all_messages = get_all_messages(page_size=50)
+    # delta -> only messages new since the last completed round (mail_delta.py)
+    if MAIL_SYNC_MODE == "delta":
+        all_messages = get_new_messages(page_size=50)
+    else:
+        all_messages = get_all_messages(page_size=50)
     total_emails = len(all_messages)
 
     print(f"Total emails fetched from Graph: {total_emails}")
 
-    advisories_extracted = 0
-    advisories_sent = 0
-    advisories_skipped = 0
+    index_of = {message["id"]: idx for idx, message in enumerate(all_messages)}
 
     # Create a single producer and reuse it for all emails
     producer = EventHubProducerClient.from_connection_string(
@@ -276,67 +288,42 @@ async def send_all_advisories_from_email() -> None:
         eventhub_name=EVENTHUB_NAME,
     )
 
-    try:
-        async with producer:
-            for idx, message in enumerate(all_messages):
-                subject = message.get("subject", "No Subject")
-                short_subject = subject[:80]
-                print(f"\nProcessing email {idx + 1}/{total_emails}: {short_subject!r}")
-
-                weather_advisory = process_single_email(message)
-
-                if not weather_advisory:
-                    print("   ↳ Skipped (no valid advisory extracted).")
-                    advisories_skipped += 1
-                    continue
-
-                advisories_extracted += 1
+    async def publish(message: Dict, weather_advisory: Dict) -> bool:
+        subject = message.get("subject", "No Subject")
 
-                # If ENV=local → save JSON file per email
-                if IS_LOCAL_ENV:
-                    received_dt = message.get("receivedDateTime", "")[:10].replace("-", "_")
-                    subject_clean = sanitize_filename(subject[:30] or "No_Subject")
-                    filename = f"{idx + 1:03d}{received_dt}{subject_clean}.json"
-                    filepath = os.path.join(OUTPUT_DIR, filename)
+        # If ENV=local → save JSON file per email
+        if IS_LOCAL_ENV:
+            idx = index_of[message["id"]]
+            received_dt = message.get("receivedDateTime", "")[:10].replace("-", "_")
+            subject_clean = sanitize_filename(subject[:30] or "No_Subject")
+            filename = f"{idx + 1:03d}{received_dt}{subject_clean}.json"
+            filepath = os.path.join(OUTPUT_DIR, filename)
 
-                    try:
-                        with open(filepath, "w", encoding="utf-8") as f:
-                            json.dump(weather_advisory, f, indent=2, ensure_ascii=False)
-                        station_count = len(weather_advisory.get("stations", []))
-                        print(f"   ✓ Saved advisory JSON ({station_count} station(s)) to {filepath}")
-                    except (OSError, TypeError, ValueError) as e:
-                        logger.error("Error saving JSON file %s: %s", filepath, e)
+            try:
+                with open(filepath, "w", encoding="utf-8") as f:
+                    json.dump(weather_advisory, f, indent=2, ensure_ascii=False)
+                station_count = len(weather_advisory.get("stations", []))
+                print(f"   ✓ Saved advisory JSON ({station_count} station(s)) to {filepath}")
+            except (OSError, TypeError, ValueError) as e:
+                logger.error("Error saving JSON file %s: %s", filepath, e)
 
-                else:
-                    print("   (global ENV) Not writing JSON file, only sending to EventHub.")
+        await send_single_event_with_producer(producer, weather_advisory)
+        return True
 
-                #  Immediately send this advisory as an Event
-                try:
-                    await send_single_event_with_producer(producer, weather_advisory)
-                    advisories_sent += 1
-
-                    #  Only now (after successful send) move the email to Archive
-                    try:
-                        moved_ok = move_message_to_archive(message["id"])
-                        if moved_ok:
-                            print("     Email archived successfully after sending event.")
-                        else:
-                            print("    Email could not be archived (see logs above).")
-                    except Exception as archive_err:
-                        logger.error(
-                            "Exception while archiving email %s: %s",
-                            message.get("id"),
-                            archive_err,
-                            exc_info=True,
-                        )
-
-                except Exception as e:
-                    logger.error(
-                        "Error sending advisory event for message %s: %s",
-                        message.get("id"),
-                        e,
-                        exc_info=True,
-                    )
+    try:
+        async with producer:
+            # fetch -> parse -> send event -> archive (only after a successful send),
+            # several emails at a time; rejected emails get an error reply + archive.
+            # Archive moves go out 20 per Graph $batch request.
+            results = await run_pipeline(
+                all_messages,
+                fetch_bodies=body_fetcher.fetch_bodies,
+                evaluate=evaluate_email,
+                reject=reply_to_rejected_email,
+                publish=publish,
+                archive_many=archive_messages,
+                ledger=get_ledger(),
+            )
 
     finally:
         # async with already closes the producer; this is just defensive
@@ -345,6 +332,31 @@ async def send_all_advisories_from_email() -> None:
         except Exception:
             pass
 
+    if MAIL_SYNC_MODE == "delta":
+        # advanced only once every listed email was archived, so none is skipped by the next run
+        commit_new_messages(results)
+
+    for result in results:
+        short_subject = result.message.get("subject", "No Subject")[:80]
+        print(f"\nEmail {result.index + 1}/{total_emails}: {short_subject!r}")
+        if result.resumed_from == "archived":
+            print("   ↳ Already processed in an earlier run (ledger).")
+        elif result.error and not result.advisory and not result.rejection:
+            print("   ↳ Body could not be fetched; left for the next run.")
+        elif not result.advisory:
+            print("   ↳ Skipped (no valid advisory extracted).")
+        elif not result.published:
+            print("    Advisory extracted but event could not be sent (see logs above).")
+        elif result.archived:
+            print("     Email archived successfully after sending event.")
+        else:
+            print("    Email could not be archived (see logs above).")
+
+    advisories_extracted = sum(1 for r in results if r.advisory)
+    # events sent by this run (not by an earlier one recorded in the ledger)
+    advisories_sent = sum(1 for r in results if r.published and r.resumed_from not in ("published", "archived"))
+    advisories_skipped = total_emails - advisories_extracted
+
     print("\nSummary:")
     logger.info("Processing Summary:")
     logger.info(f"  Emails scanned: {total_emails}")
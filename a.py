@@ -1,11 +1,19 @@
 import requests
-import pandas as pd
-from bs4 import BeautifulSoup
 import json
 from datetime import datetime, timezone, timedelta
-import time
+import asyncio
 import os
 import re
+
+from advisory_extraction import (
+    evaluate_advisory,
+    get_message_body,
+    has_mandatory_fields,
+    list_messages,
+    make_rejection,
+)
+from mail_fetch import InlineBodyFetcher
+from mail_pipeline import run_pipeline
  
  
  
@@ -70,185 +78,12 @@ def convert_to_ist_format(utc_datetime_str):
  
 # ------------- HTML PARSING AND VALIDATION FUNCTIONS -------------
  
-def extract_tables_from_html_body(html_content):
-    """
-    Extract all table data from HTML body content.
-    Returns structured table data with headers and rows.
-    """
-    if not html_content or not html_content.strip():
-        return []
-       
-    soup = BeautifulSoup(html_content, "html.parser")
-    tables = soup.find_all("table")
-   
-    if not tables:
-        return []
-   
-    extracted_tables = []
-   
-    for table_idx, table in enumerate(tables):
-        table_rows = table.find_all("tr")
-       
-        if len(table_rows) < 2:  # Need at least header + 1 data row
-            continue
-           
-        # Extract header row
-        header_row = None
-        data_rows = []
-       
-        for row in table_rows:
-            cells = row.find_all(["td", "th"])
-            if not cells:
-                continue
-               
-            cell_texts = [cell.get_text(strip=True) for cell in cells]
-           
-            # First row with content becomes header
-            if header_row is None:
-                header_row = cell_texts
-            else:
-                data_rows.append(cell_texts)
-       
-        # Convert to structured format
-        if header_row and data_rows:
-            table_data = []
-            for row in data_rows:
-                # Ensure row has same number of columns as header
-                while len(row) < len(header_row):
-                    row.append("")
-               
-                # Create row dictionary
-                row_dict = {}
-                for i, header in enumerate(header_row):
-                    if i < len(row):
-                        row_dict[header.strip() if header else f"Column_{i+1}"] = row[i].strip()
-                    else:
-                        row_dict[header.strip() if header else f"Column_{i+1}"] = ""
-               
-                table_data.append(row_dict)
-           
-            if table_data:
-                extracted_tables.append({
-                    "table_index": table_idx,
-                    "headers": header_row,
-                    "data": table_data
-                })
-   
-    return extracted_tables
- 
 def check_mandatory_fields_in_html(html_content):
     """
     Check if HTML body content contains all 5 mandatory fields.
-    Returns True if all fields are present, False otherwise.
-   
-    Mandatory fields:
-    - station
-    - weatherPhenomenon
-    - operationProbability
-    - advisoryTimePeriodStartUTC
-    - advisoryTimePeriodEndUTC
+    Returns True if all fields are present, False otherwise (advisory_extraction).
     """
-    if not html_content:
-        return False
-   
-    # Convert to lowercase for case-insensitive matching
-    html_lower = html_content.lower()
-   
-    # Define field patterns to search for
-    mandatory_patterns = [
-        ["station"],
-        ["weather", "phenomenon"],
-        ["operation", "probability", "operational", "probability"],
-        ["advisory", "start", "utc", "period", "start", "utc"],
-        ["advisory", "end", "utc", "period", "end", "utc"]
-    ]
-   
-    fields_found = 0
-   
-    for pattern_group in mandatory_patterns:
-        field_found = False
-        for pattern in pattern_group:
-            if pattern in html_lower:
-                field_found = True
-                break
-        if field_found:
-            fields_found += 1
-   
-    return fields_found >= 5
- 
-def extract_weather_stations_from_tables(tables):
-    """
-    Extract weather station data from tables with exact values from HTML.
-    NO artificial defaults - only use original values from email content.
-   
-    Returns list of station dictionaries with original values.
-    """
-    stations = []
-   
-    for table in tables:
-        headers = table.get("headers", [])
-        table_data = table.get("data", [])
-       
-        if not headers or not table_data:
-            continue
-       
-        # Map headers to our field names (case-insensitive matching)
-        header_mapping = {}
-        for i, header in enumerate(headers):
-            header_lower = header.lower().strip()
-           
-            if "station" in header_lower:
-                header_mapping["station"] = i
-            elif "weather" in header_lower and "phenomenon" in header_lower:
-                header_mapping["weatherPhenomenon"] = i
-            elif "operation" in header_lower and "probability" in header_lower:
-                header_mapping["operationProbability"] = i
-            elif ("advisory" in header_lower and "start" in header_lower and "utc" in header_lower) or \
-                 ("start" in header_lower and "utc" in header_lower):
-                header_mapping["advisoryTimePeriodStartUTC"] = i
-            elif ("advisory" in header_lower and "end" in header_lower and "utc" in header_lower) or \
-                 ("end" in header_lower and "utc" in header_lower):
-                header_mapping["advisoryTimePeriodEndUTC"] = i
-            elif ("advisory" in header_lower and "start" in header_lower and ("lt" in header_lower or "local" in header_lower)) or \
-                 ("start" in header_lower and ("lt" in header_lower or "local" in header_lower)):
-                header_mapping["advisoryTimePeriodStartLT"] = i
-            elif ("advisory" in header_lower and "end" in header_lower and ("lt" in header_lower or "local" in header_lower)) or \
-                 ("end" in header_lower and ("lt" in header_lower or "local" in header_lower)):
-                header_mapping["advisoryTimePeriodEndLT"] = i
-       
-        # Extract station data from each row
-        for row_dict in table_data:
-            station_entry = {}
-           
-            # Extract values using exact positions from headers
-            for field_name, header_index in header_mapping.items():
-                if header_index < len(headers):
-                    header_name = headers[header_index]
-                    value = row_dict.get(header_name, "").strip()
-                   
-                    if value:  # Only add non-empty values
-                        if field_name == "station":
-                            # Validate station code (3 letters, uppercase)
-                            if len(value) == 3 and value.isalpha() and value.isupper():
-                                station_entry[field_name] = value
-                        elif field_name == "operationProbability":
-                            # Convert to integer
-                            try:
-                                station_entry[field_name] = int(float(value))
-                            except (ValueError, TypeError):
-                                continue  # Skip if conversion fails
-                        else:
-                            # Use exact value for other fields
-                            station_entry[field_name] = value
-           
-            # Only add station if it has ALL 5 mandatory fields
-            mandatory_fields = ["station", "weatherPhenomenon", "operationProbability",
-                              "advisoryTimePeriodStartUTC", "advisoryTimePeriodEndUTC"]
-           
-            if all(field in station_entry for field in mandatory_fields):
-                stations.append(station_entry)
-   
-    return stations
+    return has_mandatory_fields(html_content)
  
 # ------------- EMAIL PROCESSING FUNCTIONS -------------
  
@@ -257,99 +92,48 @@ def get_all_messages(page_size: int = 50, max_pages: int = None):
     Get all messages from the mailbox with pagination.
     Returns a list of message objects with basic info.
     """
-    url = (
-        f"https://graph.microsoft.com/v1.0/users/{USER_EMAIL}/messages"
-        f"?$top={page_size}"
-        "&$orderby=receivedDateTime desc"
-        "&$select=id,subject,receivedDateTime,from"
-    )
-   
-    all_messages = []
-    page_count = 0
-   
-    while url and (max_pages is None or page_count < max_pages):
-        print(f"Fetching page {page_count + 1}...")
-        resp = requests.get(url, headers=headers)
-       
-        if resp.status_code != 200:
-            print(f"Error fetching messages: {resp.status_code}")
-            print("Response:", resp.text)
-            break
-           
-        data = resp.json()
-        messages = data.get("value", [])
-        all_messages.extend(messages)
-       
-        print(f"Retrieved {len(messages)} messages from page {page_count + 1}")
-       
-        # Check for next page
-        url = data.get("@odata.nextLink")
-        page_count += 1
-       
-        # Add small delay to avoid rate limiting
-        time.sleep(0.5)
-   
-    print(f"Total messages retrieved: {len(all_messages)}")
-    return all_messages
+    return list_messages(USER_EMAIL, headers, folder=None, page_size=page_size, max_pages=max_pages)
  
-def get_message_body_html(message_id: str) -> str:
+def get_message_body_html(message_id: str) -> str | None:
     """
     Fetch full message body (HTML) for given message_id.
     """
-    url = (
-        f"https://graph.microsoft.com/v1.0/users/{USER_EMAIL}/messages/{message_id}"
-        "?$select=subject,body"
-    )
+    return get_message_body(USER_EMAIL, message_id, headers)
+ 
+def evaluate_email(message, body_html: str):
+    """(weather_advisory, None), or (None, rejection) with the reasons (advisory_extraction)."""
+    stations, rejection = evaluate_advisory(body_html, message.get("receivedDateTime", ""), strategy="table")
+    if rejection:
+        return None, rejection
  
-    resp = requests.get(url, headers=headers)
-    if resp.status_code != 200:
-        print(f"Error fetching message body for {message_id}: {resp.status_code}")
-        return ""
+    weather_advisory = {
+        "createdAt": convert_to_ist_format(message.get("receivedDateTime", "")),
+        "stations": stations
+    }
+    return weather_advisory, None
  
-    data = resp.json()
-    body = data.get("body", {})
-    return body.get("content", "")
+def reject_email(message, rejection) -> None:
+    """No error reply from this script: rejected emails are only reported."""
  
 def process_single_email(message):
     """
-    Process a single email and extract weather advisory data if valid.
+    Fetch and check one email on its own; rejected emails go through reject_email.
     Returns weather advisory dict or None if invalid.
     """
     try:
-        # Get email HTML body
         body_html = get_message_body_html(message["id"])
-        if not body_html:
+        if body_html is None:
+            print("   ⏭️  Body could not be fetched – left for the next run.")
             return None
-       
-        # Check if HTML contains mandatory fields
-        if not check_mandatory_fields_in_html(body_html):
-            print("   ❌ Missing mandatory fields in HTML body - Skipping")
+        weather_advisory, rejection = evaluate_email(message, body_html)
+        if rejection:
+            reject_email(message, rejection)
             return None
-       
-        print("   ✅ All mandatory fields found in HTML - Processing...")
-       
-        # Extract tables from HTML
-        tables = extract_tables_from_html_body(body_html)
-        if not tables:
-            print("   ❌ No tables found in HTML - Skipping")
-            return None
-       
-        # Extract weather stations with original values
-        stations = extract_weather_stations_from_tables(tables)
-        if not stations:
-            print("   ❌ No valid weather stations extracted - Skipping")
-            return None
-       
-        # Create weather advisory with original values
-        weather_advisory = {
-            "createdAt": convert_to_ist_format(message.get("receivedDateTime", "")),
-            "stations": stations
-        }
-       
         return weather_advisory
-       
+ 
     except Exception as e:
         print(f"   ❌ Error processing email: {e}")
+        reject_email(message, make_rejection(extra_reason=f"Internal processing error: {e}"))
         return None
  
 def process_all_emails():
@@ -369,14 +153,26 @@ def process_all_emails():
     all_messages = get_all_messages(page_size=50)
     successful_extractions = 0
     skipped_emails = 0
-   
-    for idx, message in enumerate(all_messages):
+    deferred = 0
+   
+    results = asyncio.run(run_pipeline(
+        all_messages,
+        fetch_bodies=InlineBodyFetcher(get_message_body_html).fetch_bodies,
+        evaluate=evaluate_email,
+        reject=reject_email,
+    ))
+ 
+    # results come back in the original message order
+    for result in results:
+        idx, message, weather_advisory = result.index, result.message, result.advisory
         subject = message.get('subject', 'No Subject')[:50]
         print(f"\nProcessing email {idx + 1}/{len(all_messages)}: {subject}...")
-       
-        # Process the email
-        weather_advisory = process_single_email(message)
-       
+ 
+        if result.error and not weather_advisory and not result.rejection:
+            print(f"   ⏭️  {result.error} – left for the next run.")
+            deferred += 1
+            continue
+ 
         if weather_advisory:
             # Save to JSON file in local environment
             if IS_LOCAL_ENV:
@@ -395,10 +191,12 @@ def process_all_emails():
            
             successful_extractions += 1
         else:
+            rejection = result.rejection
+            if rejection["missing_fields"] and not rejection["extra_reason"]:
+                print(f"   ❌ Missing mandatory field(s) in mail body: {', '.join(rejection['missing_fields'])} – Skipping this email.")
+            else:
+                print(f"   ❌ {rejection['extra_reason'] or 'No complete stations could be extracted'} – Skipping this email.")
             skipped_emails += 1
-       
-        # Add small delay to avoid rate limiting
-        time.sleep(0.2)
    
     print(f"\n" + "="*60)
     print("🎯 EMAIL PROCESSING SUMMARY")
@@ -406,6 +204,7 @@ def process_all_emails():
     print(f"📧 Total emails processed: {len(all_messages)}")
     print(f"✅ Successful extractions: {successful_extractions}")
     print(f"⏭️  Skipped emails: {skipped_emails}")
+    print(f"⏳ Left for the next run (body fetch failed): {deferred}")
     print(f"📁 Files saved in: {OUTPUT_DIR}/")
    
     return len(all_messages), successful_extractions
@@ -0,0 +1,71 @@
+"""
+Weather advisory extraction, shared by every advisory / EventHub script.
+
+    from advisory_extraction import missing_mandatory_fields, extract_advisory_stations
+
+    missing = missing_mandatory_fields(html)              # labels not found in the body
+    stations = extract_advisory_stations(html, received)  # ADVISORY_EXTRACTOR strategy
+
+Modules:
+    patterns    compiled patterns and constants used by every strategy
+    document    parse-once AdvisoryDocument (lines, tables, tokens), cached per body
+    parser      line-window strategy and the advisory time parsers
+    tables      header-mapped table strategy
+    strategies  strategy registry, hybrid fallback, per-path metrics
+    fields      mandatory-label check
+    evaluate    accept / reject decision (and reply reasons) for one email body
+    graph       Graph client (pooling, Retry-After retries, timing, record/replay),
+                message listing and body reads
+
+advisory_golden.py runs the golden corpus (advisory_golden/) through every
+registered strategy as a regression check and benchmark.
+"""
+from .document import AdvisoryDocument, available_backends, html_to_lines, prepare_document
+from .evaluate import evaluate_advisory, make_rejection
+from .fields import has_mandatory_fields, missing_mandatory_fields
+from .graph import GRAPH_BASE, LIST_SELECT, GraphSession, get_message_body, get_session, list_messages
+from .parser import advisory_datetime, extract_stations, format_advisory_time, parse_mail_received_datetime
+from .patterns import MANDATORY_FIELDS, MONTH_MAP
+from .strategies import (
+    STRATEGIES,
+    ExtractionResult,
+    ExtractionStrategy,
+    FallbackStrategy,
+    extract_advisory,
+    extract_advisory_stations,
+    extraction_metrics,
+    get_strategy,
+    register_strategy,
+)
+
+__all__ = [
+    "AdvisoryDocument",
+    "ExtractionResult",
+    "ExtractionStrategy",
+    "FallbackStrategy",
+    "GRAPH_BASE",
+    "GraphSession",
+    "LIST_SELECT",
+    "MANDATORY_FIELDS",
+    "MONTH_MAP",
+    "STRATEGIES",
+    "advisory_datetime",
+    "available_backends",
+    "evaluate_advisory",
+    "extract_advisory",
+    "extract_advisory_stations",
+    "extract_stations",
+    "extraction_metrics",
+    "format_advisory_time",
+    "get_message_body",
+    "get_session",
+    "get_strategy",
+    "has_mandatory_fields",
+    "html_to_lines",
+    "list_messages",
+    "make_rejection",
+    "missing_mandatory_fields",
+    "parse_mail_received_datetime",
+    "prepare_document",
+    "register_strategy",
+]
@@ -0,0 +1,252 @@
+"""
+Parse-once text representation of an advisory email body.
+
+Each HTML body is parsed a single time into an `AdvisoryDocument` that holds
+the visible text, its non-empty lines, a lower-cased copy and an
+alphanumeric-only copy (for the mandatory-label check), plus the tokenised
+lines used by the line-window parser and the cell text of its HTML tables
+(for the table strategy); lines and tables come out of the same parse.
+Those are computed lazily and shared by the label check and the extraction
+strategies. `prepare_document` keeps recent documents in a small LRU cache
+keyed by the body, so several callers on the same body share one parse.
+
+Parser backend (ADVISORY_HTML_PARSER): "auto" (default) picks selectolax,
+then lxml, then the standard library's html.parser. All produce the same
+lines as BeautifulSoup's get_text("\\n", strip=True): one entry per text
+node, script/style/comments skipped, entities decoded. `available_backends()`
+lists the installed ones, and AdvisoryDocument(body, backend) forces one.
+"""
+import logging
+import os
+from functools import cached_property, lru_cache
+from html.parser import HTMLParser
+from typing import Callable, List, Optional, Tuple
+
+from . import parser
+from .patterns import NON_ALNUM_RE
+
+logger = logging.getLogger(__name__)
+
+ADVISORY_HTML_PARSER = os.environ.get("ADVISORY_HTML_PARSER", "auto").lower()
+DOCUMENT_CACHE_SIZE = int(os.environ.get("ADVISORY_DOCUMENT_CACHE_SIZE", "64"))
+
+_SKIP_TAGS = ("script", "style", "template")
+
+
+Table = List[List[str]]  # rows -> cell text, one line per text node (like `lines`)
+
+
+class _TextCollector(HTMLParser):
+    """Text nodes, and the cell text of every <table>, in one pass."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.chunks: List[str] = []
+        self.tables: List[Table] = []
+        self._open_tables: List[Table] = []
+        self._row: Optional[List[str]] = None
+        self._cell: Optional[List[str]] = None
+        self._skip = 0
+
+    def _close_cell(self):
+        if self._cell is not None and self._row is not None:
+            self._row.append("\n".join(self._cell))
+        self._cell = None
+
+    def _close_row(self):
+        self._close_cell()
+        if self._row and self._open_tables:
+            self._open_tables[-1].append(self._row)
+        self._row = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+        elif tag == "table":
+            self._close_row()
+            table: Table = []
+            self.tables.append(table)
+            self._open_tables.append(table)
+        elif not self._open_tables:
+            return
+        elif tag == "tr":
+            self._close_row()
+            self._row = []
+        elif tag in ("td", "th"):
+            self._close_cell()
+            if self._row is None:
+                self._row = []
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS and self._skip:
+            self._skip -= 1
+        elif tag in ("td", "th"):
+            self._close_cell()
+        elif tag == "tr":
+            self._close_row()
+        elif tag == "table" and self._open_tables:
+            self._close_row()
+            self._open_tables.pop()
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        self.chunks.append(data)
+        if self._cell is not None:
+            data = data.strip()
+            if data:
+                self._cell.append(data)
+
+    def close(self):
+        super().close()
+        self._close_row()
+
+
+def _parse_stdlib(body: str) -> Tuple[List[str], List[Table]]:
+    collector = _TextCollector()
+    collector.feed(body)
+    collector.close()
+    return collector.chunks, collector.tables
+
+
+def _parse_lxml(body: str) -> Tuple[List[str], List[Table]]:
+    import lxml.html
+    from lxml.etree import ParserError
+    try:
+        root = lxml.html.fromstring(body)
+    except ParserError:
+        # "Document is empty": no element at all (only comments / whitespace)
+        return [], []
+    visible = "text()[not(ancestor::script) and not(ancestor::style) and not(ancestor::template)]"
+    tables = []
+    for table in root.iter("table"):
+        rows = []
+        for row in table.xpath("./tr|./thead/tr|./tbody/tr|./tfoot/tr"):
+            cells = ["\n".join(t.strip() for t in cell.xpath(".//" + visible) if t.strip())
+                     for cell in row.xpath("./th|./td")]
+            if cells:
+                rows.append(cells)
+        tables.append(rows)
+    return root.xpath("//" + visible), tables
+
+
+def _parse_selectolax(body: str) -> Tuple[List[str], List[Table]]:
+    from selectolax.parser import HTMLParser as FastHTMLParser
+    tree = FastHTMLParser(body)
+    tree.strip_tags(list(_SKIP_TAGS))
+    root = tree.root
+    if root is None:
+        return [], []
+    tables = []
+    for table in tree.css("table"):
+        rows = []
+        for row in table.css("tr"):
+            cells = ["\n".join(line for line in cell.text(deep=True, separator="\n", strip=True).split("\n") if line)
+                     for cell in row.css("th, td")]
+            if cells:
+                rows.append(cells)
+        tables.append(rows)
+    nodes = [node.text(deep=False) for node in root.traverse(include_text=True) if node.tag == "-text"]
+    return nodes, tables
+
+
+_PARSERS = {"selectolax": _parse_selectolax, "lxml": _parse_lxml, "html.parser": _parse_stdlib}
+# selectolax 1.0 dropped the selectolax.parser (Modest) module: importing it is the real check
+_BACKEND_MODULES = {"selectolax": "selectolax.parser", "lxml": "lxml.html"}
+
+
+def available_backends() -> List[str]:
+    """Installed parser backends, in "auto" order; html.parser is always there."""
+    names = []
+    for name in ("selectolax", "lxml"):
+        try:
+            __import__(_BACKEND_MODULES[name])
+        except ImportError:
+            continue
+        names.append(name)
+    return names + ["html.parser"]
+
+
+def _select_backend(name: str) -> Callable[[str], Tuple[List[str], List[Table]]]:
+    candidates = {
+        "selectolax": (_BACKEND_MODULES["selectolax"], _parse_selectolax),
+        "lxml": (_BACKEND_MODULES["lxml"], _parse_lxml),
+    }
+    order = ["selectolax", "lxml"] if name == "auto" else [name]
+    for choice in order:
+        if choice in candidates:
+            module, fn = candidates[choice]
+            try:
+                __import__(module)
+            except ImportError:
+                logger.debug("HTML parser backend %s not installed", choice)
+                continue
+            logger.info("Advisory HTML parser backend: %s", choice)
+            return fn
+    logger.info("Advisory HTML parser backend: html.parser")
+    return _parse_stdlib
+
+
+_parse = _select_backend(ADVISORY_HTML_PARSER)
+
+
+def _node_lines(nodes: List[str]) -> List[str]:
+    lines = []
+    for node in nodes:
+        node = node.strip()
+        if not node:
+            continue
+        for line in node.splitlines():
+            line = line.strip()
+            if line:
+                lines.append(line)
+    return lines
+
+
+def html_to_lines(body: str) -> List[str]:
+    """Non-empty, stripped text lines of an HTML body."""
+    return _node_lines(_parse(body)[0])
+
+
+class AdvisoryDocument:
+    def __init__(self, body: str, backend: Optional[str] = None):
+        """`backend` forces one parser (see available_backends); default is ADVISORY_HTML_PARSER's."""
+        self.html = body or ""
+        self._parser = _PARSERS[backend] if backend else _parse
+
+    @cached_property
+    def _parsed(self) -> Tuple[List[str], List[Table]]:
+        return self._parser(self.html) if self.html.strip() else ([], [])
+
+    @cached_property
+    def lines(self) -> List[str]:
+        return _node_lines(self._parsed[0])
+
+    @cached_property
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+    @cached_property
+    def lower(self) -> str:
+        return self.text.lower()
+
+    @cached_property
+    def compact(self) -> str:
+        """Lower-cased text with everything but a-z0-9 removed ("Weather Phenomenon" -> "weatherphenomenon")."""
+        return NON_ALNUM_RE.sub("", self.lower)
+
+    @cached_property
+    def tables(self) -> List[Table]:
+        """Cell text per row of every <table>, in document order (same parse as `lines`)."""
+        return self._parsed[1]
+
+    @cached_property
+    def tokens(self) -> List[parser.LineTokens]:
+        return parser.tokenize(self.lines)
+
+
+@lru_cache(maxsize=DOCUMENT_CACHE_SIZE)
+def prepare_document(body: str) -> AdvisoryDocument:
+    """Shared, cached AdvisoryDocument for an HTML body."""
+    return AdvisoryDocument(body)
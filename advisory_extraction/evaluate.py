@@ -0,0 +1,41 @@
+"""
+Accept / reject decision for one advisory email body.
+
+Every mailbox script makes the same three checks - a readable body, all
+mandatory labels, at least one complete station - and replies with the
+same reasons, so the decision lives here and the scripts only add their
+own `createdAt` and reply handling.
+"""
+from typing import Dict, List, Optional, Tuple, Union
+
+from .document import AdvisoryDocument, prepare_document
+from .fields import missing_mandatory_fields
+from .patterns import MANDATORY_FIELDS
+from .strategies import ADVISORY_EXTRACTOR, extract_advisory
+
+NO_BODY_REASON = "Email body did not contain any HTML content or could not be read."
+INVALID_VALUES_REASON = "Field labels are present, but values are missing or not in the expected format."
+
+
+def make_rejection(missing_fields: List[str] = (), invalid_fields: List[str] = (),
+                   extra_reason: Optional[str] = None) -> Dict:
+    """Rejection in the shape the error reply is built from."""
+    return {"missing_fields": list(missing_fields), "invalid_fields": list(invalid_fields),
+            "extra_reason": extra_reason}
+
+
+def evaluate_advisory(body: Union[str, AdvisoryDocument, None], mail_received_dt: Optional[str] = None,
+                      strategy: str = ADVISORY_EXTRACTOR) -> Tuple[Optional[List[Dict]], Optional[Dict]]:
+    """(stations, None) for an accepted body, (None, rejection) otherwise."""
+    doc = body if isinstance(body, AdvisoryDocument) else prepare_document(body or "")
+    if not doc.html.strip():
+        return None, make_rejection(missing_fields=MANDATORY_FIELDS, extra_reason=NO_BODY_REASON)
+
+    missing = missing_mandatory_fields(doc)
+    if missing:
+        return None, make_rejection(missing_fields=missing)
+
+    stations = extract_advisory(doc, mail_received_dt, strategy).stations
+    if not stations:
+        return None, make_rejection(invalid_fields=MANDATORY_FIELDS, extra_reason=INVALID_VALUES_REASON)
+    return stations, None
@@ -0,0 +1,39 @@
+"""
+Mandatory-label check: does an advisory body name all the required columns?
+"""
+import logging
+from typing import List, Union
+
+from .document import AdvisoryDocument, prepare_document
+from .patterns import LABEL_RULES, MANDATORY_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+def missing_mandatory_fields(body: Union[str, AdvisoryDocument]) -> List[str]:
+    """MANDATORY_FIELDS whose label is not found in the body's visible text (all of them for an empty body)."""
+    doc = body if isinstance(body, AdvisoryDocument) else prepare_document(body or "")
+    if not doc.html.strip():
+        logger.warning("HTML content empty while checking mandatory fields.")
+        return list(MANDATORY_FIELDS)
+
+    text, compact = doc.lower, doc.compact
+    missing = []
+    for field in MANDATORY_FIELDS:
+        word_rules, spellings = LABEL_RULES[field]
+        found = (
+            any(all(word in text for word in words) for words in word_rules)
+            or any(spelling in compact for spelling in spellings)
+        )
+        if not found:
+            missing.append(field)
+
+    if missing:
+        logger.info("Mandatory fields missing in HTML: %s", missing)
+    else:
+        logger.debug("All mandatory fields present in HTML.")
+    return missing
+
+
+def has_mandatory_fields(body: Union[str, AdvisoryDocument]) -> bool:
+    return not missing_mandatory_fields(body)
@@ -0,0 +1,323 @@
+"""
+Shared Microsoft Graph access for the advisory scripts.
+
+`GraphSession` is the Graph client: a requests.Session with
+
+  - a keep-alive connection pool (GRAPH_POOL_SIZE connections per host)
+  - gzip / deflate responses
+  - a default timeout (GRAPH_TIMEOUT)
+  - 429/503 retries after the response's Retry-After, up to GRAPH_MAX_RETRIES
+  - per-endpoint request timing in `metrics` (requests, errors, throttled,
+    avg/max ms)
+  - record / replay: with GRAPH_RECORD=<file> every response is appended to
+    the file (JSON lines, the fake_graph_server.py format); with
+    GRAPH_REPLAY=<file> responses are served from such a file and nothing
+    goes over the network, so a whole pipeline run can be benchmarked
+    offline (GRAPH_REPLAY_LATENCY=1 also replays the recorded latency)
+
+`get_session()` is the process-wide instance, so listing, body, reply and
+move calls reuse connections instead of opening a new TLS connection each.
+Callers that retry through their own throttle (mail_pipeline.ThrottledHttp)
+use a GraphSession(max_retries=0) so a 429 pauses every caller there.
+`list_messages` / `get_message_body` are the single copies of the mailbox
+reads every extraction script used to carry.
+
+`headers` arguments take either a dict or a function returning one (tokens
+expire, so long runs should pass a function).
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+GRAPH_BASE = os.environ.get("GRAPH_BASE", "https://graph.microsoft.com/v1.0")
+GRAPH_POOL_SIZE = int(os.environ.get("GRAPH_POOL_SIZE", "16"))
+GRAPH_TIMEOUT = float(os.environ.get("GRAPH_TIMEOUT", "30"))
+GRAPH_MAX_RETRIES = int(os.environ.get("GRAPH_MAX_RETRIES", "5"))
+GRAPH_RECORD = os.environ.get("GRAPH_RECORD", "")
+GRAPH_REPLAY = os.environ.get("GRAPH_REPLAY", "")
+GRAPH_REPLAY_LATENCY = os.environ.get("GRAPH_REPLAY_LATENCY", "0").lower() in ("1", "true", "yes")
+THROTTLED_STATUSES = (429, 503)
+GRAPH_BATCH_LIMIT = 20  # Graph's maximum requests per $batch
+LIST_SELECT = "id,subject,receivedDateTime,from,internetMessageId"
+HTML_BODY_PREFER = 'outlook.body-content-type="html"'
+
+Headers = Union[Dict[str, str], Callable[[], Dict[str, str]]]
+
+def retry_after_seconds(headers, default: float = 5.0) -> float:
+    """Seconds from a Retry-After header (delta-seconds or HTTP date)."""
+    value = (headers or {}).get("Retry-After")
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+# ---- recordings ----
+
+RequestKey = Tuple[str, str, str]
+
+
+def request_key(method: str, url: str) -> RequestKey:
+    """Recording key of a request: method + path + sorted query (the host is ignored)."""
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return method.upper(), parts.path, query
+
+
+def load_recording(path: str) -> Dict[RequestKey, List[Dict]]:
+    """{request key: [recorded responses, in order]} from a JSON-lines recording."""
+    responses: Dict[RequestKey, List[Dict]] = defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entry = json.loads(line)
+                responses[request_key(entry["method"], entry["url"])].append(entry)
+    return responses
+
+
+def recording_entry(method: str, url: str, resp: requests.Response, seconds: float = 0.0) -> Dict:
+    try:
+        body = resp.json()
+    except ValueError:
+        body = resp.text
+    entry = {"method": method.upper(), "url": url, "status": resp.status_code, "body": body,
+             "elapsed_ms": round(seconds * 1000, 1)}
+    if resp.headers.get("Retry-After"):
+        entry["headers"] = {"Retry-After": resp.headers["Retry-After"]}
+    return entry
+
+
+def replayed_response(method: str, url: str, entry: Optional[Dict]) -> requests.Response:
+    """A requests.Response built from a recorded entry (404 NotRecorded when there is none)."""
+    if entry is None:
+        entry = {"status": 404, "body": {"error": {"code": "NotRecorded", "message": f"{method.upper()} {url}"}}}
+    body = entry.get("body")
+    resp = requests.Response()
+    resp.status_code = entry.get("status", 200)
+    resp.url = url
+    resp.encoding = "utf-8"
+    resp.headers = CaseInsensitiveDict(entry.get("headers") or {})
+    if isinstance(body, (dict, list)):
+        resp._content = json.dumps(body).encode("utf-8")
+        resp.headers.setdefault("Content-Type", "application/json")
+    else:
+        resp._content = (body or "").encode("utf-8")
+        resp.headers.setdefault("Content-Type", "text/plain")
+    return resp
+
+
+# ---- client ----
+
+def endpoint_name(url: str) -> str:
+    """Short endpoint label for metrics: the last path segment that isn't an ID or address."""
+    segments = [s for s in urlsplit(url).path.split("/") if s]
+    for segment in reversed(segments):
+        if len(segment) < 40 and "@" not in segment and "=" not in segment:
+            return segment
+    return "/"
+
+
+class GraphMetrics:
+    """Per-endpoint request counts and latency."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Dict[str, int] = defaultdict(int)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.throttled: Dict[str, int] = defaultdict(int)
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.max_seconds: Dict[str, float] = defaultdict(float)
+
+    def record(self, method: str, url: str, status: Optional[int], seconds: float) -> None:
+        key = f"{method.upper()} {endpoint_name(url)}"
+        with self._lock:
+            self.requests[key] += 1
+            self.seconds[key] += seconds
+            self.max_seconds[key] = max(self.max_seconds[key], seconds)
+            if status in THROTTLED_STATUSES:
+                self.throttled[key] += 1
+            elif status is None or status >= 400:
+                self.errors[key] += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                key: {
+                    "requests": count,
+                    "errors": self.errors[key],
+                    "throttled": self.throttled[key],
+                    "avg_ms": round(self.seconds[key] * 1000 / count, 1),
+                    "max_ms": round(self.max_seconds[key] * 1000, 1),
+                }
+                for key, count in self.requests.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            for counter in (self.requests, self.errors, self.throttled, self.seconds, self.max_seconds):
+                counter.clear()
+
+
+class GraphSession(requests.Session):
+    def __init__(
+        self,
+        max_retries: int = GRAPH_MAX_RETRIES,
+        timeout: float = GRAPH_TIMEOUT,
+        pool_size: int = GRAPH_POOL_SIZE,
+        record: Optional[str] = GRAPH_RECORD or None,
+        replay: Optional[str] = GRAPH_REPLAY or None,
+        replay_latency: bool = GRAPH_REPLAY_LATENCY,
+    ):
+        super().__init__()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self.headers["Accept-Encoding"] = "gzip, deflate"
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.metrics = GraphMetrics()
+        self.record_path = record
+        self.replay_latency = replay_latency
+        self._replay = load_recording(replay) if replay else None
+        self._served: Dict[RequestKey, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        if replay:
+            logger.info("Graph session replaying %s (no network)", replay)
+        elif record:
+            logger.info("Graph session recording responses to %s", record)
+
+    def _replayed(self, method: str, url: str) -> requests.Response:
+        # the same request recorded several times is served in order, the last one repeats
+        key = request_key(method, url)
+        entries = self._replay.get(key)
+        if not entries:
+            logger.warning("No recorded response for %s %s", method.upper(), url)
+            return replayed_response(method, url, None)
+        with self._lock:
+            entry = entries[min(self._served[key], len(entries) - 1)]
+            self._served[key] += 1
+        if self.replay_latency and entry.get("elapsed_ms"):
+            time.sleep(entry["elapsed_ms"] / 1000)
+        return replayed_response(method, url, entry)
+
+    def _record(self, method: str, url: str, resp: requests.Response, seconds: float) -> None:
+        line = json.dumps(recording_entry(method, url, resp, seconds), ensure_ascii=False)
+        with self._lock, open(self.record_path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            resp = None
+            try:
+                if self._replay is not None:
+                    resp = self._replayed(method, url)
+                else:
+                    resp = super().request(method, url, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                self.metrics.record(method, url, resp.status_code if resp is not None else None, seconds)
+            if self.record_path and self._replay is None:
+                self._record(method, url, resp, seconds)
+
+            if resp.status_code not in THROTTLED_STATUSES or attempt == self.max_retries:
+                return resp
+            delay = retry_after_seconds(resp.headers)
+            logger.warning("Graph %s %s throttled (%s); retry %d/%d in %.1fs",
+                           method.upper(), endpoint_name(url), resp.status_code, attempt + 1, self.max_retries, delay)
+            time.sleep(delay)
+        return resp
+
+
+_session: Optional[GraphSession] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> GraphSession:
+    """The process-wide Graph session."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = GraphSession()
+    return _session
+
+
+def _headers(headers: Headers) -> Dict[str, str]:
+    return dict(headers() if callable(headers) else headers)
+
+
+def list_messages(
+    user_email: str,
+    headers: Headers,
+    folder: Optional[str] = "Inbox",
+    page_size: int = 50,
+    max_pages: Optional[int] = None,
+    select: str = LIST_SELECT,
+    http=None,
+    base: str = GRAPH_BASE,
+    timeout: float = GRAPH_TIMEOUT,
+) -> List[Dict]:
+    """Messages of a folder (the whole mailbox with folder=None), newest first, all pages."""
+    http = http or get_session()
+    scope = f"mailFolders/{folder}/messages" if folder else "messages"
+    url = (
+        f"{base.rstrip('/')}/users/{user_email}/{scope}"
+        f"?$top={page_size}"
+        "&$orderby=receivedDateTime desc"
+        f"&$select={select}"
+    )
+
+    all_messages: List[Dict] = []
+    page_count = 0
+    logger.info("Starting fetch of messages from %s with page_size=%d", folder or "mailbox", page_size)
+
+    while url and (max_pages is None or page_count < max_pages):
+        resp = http.get(url, headers=_headers(headers), timeout=timeout)
+        if resp.status_code != 200:
+            logger.error("Error fetching messages: %s | Response: %s", resp.status_code, resp.text)
+            break
+
+        data = resp.json()
+        messages = data.get("value", [])
+        all_messages.extend(messages)
+        page_count += 1
+        logger.info("Retrieved %d messages from page %d", len(messages), page_count)
+        url = data.get("@odata.nextLink")
+
+    logger.info("Total messages retrieved: %d", len(all_messages))
+    return all_messages
+
+
+def get_message_body(user_email: str, message_id: str, headers: Headers, http=None,
+                     base: str = GRAPH_BASE, timeout: float = GRAPH_TIMEOUT) -> Optional[str]:
+    """HTML body of one message, or None if it can't be read (an empty body is "")."""
+    http = http or get_session()
+    request_headers = _headers(headers)
+    request_headers.setdefault("Prefer", HTML_BODY_PREFER)
+    resp = http.get(f"{base.rstrip('/')}/users/{user_email}/messages/{message_id}?$select=subject,body",
+                    headers=request_headers, timeout=timeout)
+    if resp.status_code != 200:
+        logger.error("Error fetching message body for %s: %s | Response: %s", message_id, resp.status_code, resp.text)
+        return None
+    return (resp.json().get("body") or {}).get("content", "")
@@ -0,0 +1,154 @@
+"""
+Single-pass parser for weather advisory text.
+
+Advisory emails list, per station, a 3-letter station code followed (within
+the next 14 lines) by the weather phenomenon, the operation probability and
+the advisory period as "HHMM/DD Mon" values (Start UTC, Start LT, End UTC,
+End LT).
+
+Patterns come from advisory_extraction.patterns, compiled once. Each line is tokenised exactly
+once into a `LineTokens` (station / phenomenon / percentage / time tokens);
+the per-station window scan then only looks at those tags instead of
+re-running regexes over the same lines for every field. Mail-level values
+(the received datetime) are parsed once per email.
+
+The output matches the original `extract_weather_stations_nlp` field for field.
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from .patterns import MANDATORY_FIELDS, MONTH_MAP, PERCENT_RE, TIME_RE, WINDOW_SIZE
+
+logger = logging.getLogger(__name__)
+
+# (raw text, hhmm, day, month abbreviation)
+TimeToken = Tuple[str, str, str, str]
+
+
+class LineTokens(NamedTuple):
+    text: str
+    is_station: bool
+    is_phenomenon: bool
+    percent: Optional[int]       # first "NN %" on the line
+    times: Tuple[TimeToken, ...]
+
+
+def tokenize_line(line: str) -> LineTokens:
+    # cheap str checks first; the regexes only run on lines that can match
+    upper_word = line.isalpha() and line.isascii() and line.isupper()
+    length = len(line)
+    percent = None
+    if "%" in line:
+        match = PERCENT_RE.search(line)
+        if match:
+            percent = int(match.group(1))
+    times = ()
+    if "/" in line:
+        times = tuple(TIME_RE.findall(line))
+    return LineTokens(
+        line,
+        upper_word and length == 3,
+        upper_word and 2 <= length <= 6,
+        percent,
+        times,
+    )
+
+
+def tokenize(lines: Sequence[str]) -> List[LineTokens]:
+    return [tokenize_line(line) for line in lines]
+
+
+def parse_mail_received_datetime(dt_str: Optional[str]) -> Optional[datetime]:
+    if not dt_str:
+        return None
+    try:
+        return datetime.fromisoformat(dt_str.replace('Z', '+00:00')).astimezone(timezone.utc)
+    except ValueError as e:
+        logger.warning("Failed to parse mail received datetime '%s': %s", dt_str, e)
+        return None
+
+
+def advisory_datetime(token: TimeToken, mail_dt_utc: Optional[datetime]) -> Optional[datetime]:
+    """UTC datetime for an "HHMM/DD Mon" token; the year comes from the mail's received time."""
+    _, hhmm, day, mon_abbr = token
+    if len(hhmm) == 4:
+        hour, minute = int(hhmm[:2]), int(hhmm[2:])
+    else:
+        hour, minute = int(hhmm[:1]), int(hhmm[1:])
+
+    month = MONTH_MAP.get(mon_abbr.lower())
+    if not month:
+        logger.warning("Unknown month abbreviation: '%s'", mon_abbr)
+        return None
+
+    if mail_dt_utc is None:
+        year = datetime.now(timezone.utc).year
+    else:
+        year = mail_dt_utc.year
+        if mail_dt_utc.month == 12 and month == 1:
+            year += 1
+    try:
+        return datetime(year, month, int(day), hour, minute, 0, tzinfo=timezone.utc)
+    except ValueError as e:
+        logger.error("Invalid advisory time %s: %s", token[0], e)
+        return None
+
+
+def format_advisory_time(token: TimeToken, mail_dt_utc: Optional[datetime]) -> str:
+    dt = advisory_datetime(token, mail_dt_utc)
+    if dt is None:
+        return token[0]
+    return f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d}T{dt.hour:02d}:{dt.minute:02d}:00"
+
+
+def _station_entry(station: str, window: Sequence[LineTokens], mail_dt_utc: Optional[datetime]) -> Dict:
+    entry: Dict = {"station": station}
+    probability = phenomenon = None
+    times: List[TimeToken] = []
+
+    for tokens in window:
+        if probability is None and tokens.percent is not None and 0 <= tokens.percent <= 100:
+            probability = tokens.percent
+        if phenomenon is None and tokens.is_phenomenon and tokens.text != station:
+            phenomenon = tokens.text
+        if len(times) < 3:
+            times.extend(tokens.times)
+        elif probability is not None and phenomenon is not None:
+            break
+
+    if probability is not None:
+        entry["operationProbability"] = probability
+    if phenomenon is not None:
+        entry["weatherPhenomenon"] = phenomenon
+    # Start UTC is the 1st time value, End UTC the 3rd (2nd/4th are local time)
+    if len(times) >= 3:
+        entry["advisoryTimePeriodStartUTC"] = format_advisory_time(times[0], mail_dt_utc)
+        entry["advisoryTimePeriodEndUTC"] = format_advisory_time(times[2], mail_dt_utc)
+    return entry
+
+
+def extract_stations(lines: Sequence[str], mail_received_dt: Optional[str] = None,
+                     tokens: Optional[List[LineTokens]] = None) -> List[Dict]:
+    """Complete station entries (all MANDATORY_FIELDS present) from the advisory's text lines."""
+    tokens = tokens if tokens is not None else tokenize(lines)
+    mail_dt_utc = parse_mail_received_datetime(mail_received_dt)
+
+    stations = []
+    for i, line_tokens in enumerate(tokens):
+        if not line_tokens.is_station:
+            continue
+        entry = _station_entry(line_tokens.text, tokens[i + 1: i + 1 + WINDOW_SIZE], mail_dt_utc)
+        missing = [k for k in MANDATORY_FIELDS if k not in entry]
+        if missing:
+            logger.info(
+                "Incomplete station entry for '%s', missing fields, ignoring: %s",
+                line_tokens.text,
+                missing,
+            )
+        else:
+            stations.append(entry)
+            logger.info("Completed station entry: %s", entry)
+
+    logger.info("NLP extraction complete. Total valid stations: %d", len(stations))
+    return stations
@@ -0,0 +1,45 @@
+"""
+Patterns and constants shared by every extraction strategy, compiled once.
+"""
+import re
+
+# canonical output fields of a station entry
+MANDATORY_FIELDS = (
+    "station",
+    "weatherPhenomenon",
+    "operationProbability",
+    "advisoryTimePeriodStartUTC",
+    "advisoryTimePeriodEndUTC",
+)
+
+MONTH_MAP = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4,
+    "may": 5, "jun": 6, "jul": 7, "aug": 8,
+    "sep": 9, "oct": 10, "nov": 11, "dec": 12
+}
+
+WINDOW_SIZE = 14  # lines after a station code that belong to it (line-window strategy)
+
+PERCENT_RE = re.compile(r"(\d{1,3})\s*%")
+# "HHMM/DD Mon"; groups: whole token, HHMM, day, month abbreviation
+TIME_RE = re.compile(r"((\d{3,4})/(\d{1,2})\s*([A-Za-z]{3}))")
+NON_ALNUM_RE = re.compile(r"[^a-z0-9]")
+
+# Mandatory-label rules, checked against the lower-cased visible text.
+# A field's label is present when, for any rule, all its words occur in the
+# text, or any of its compact spellings occurs in the text with everything
+# but a-z0-9 removed ("Weather Phenomenon" -> "weatherphenomenon").
+LABEL_RULES = {
+    "station": ([("station",)], ["station"]),
+    # "phenom" also covers "phenomenon", "operation" covers "operational", "probab" covers "probability"
+    "weatherPhenomenon": ([("weather", "phenom")], ["weatherphenom"]),
+    "operationProbability": ([("operation", "probab")], ["operationprobab", "operationalprobability"]),
+    "advisoryTimePeriodStartUTC": (
+        [("advisory", "start", "utc")],
+        ["advisorytimeperiodstartutc", "timeperiodstartutc", "periodstartutc"],
+    ),
+    "advisoryTimePeriodEndUTC": (
+        [("advisory", "end", "utc")],
+        ["advisorytimeperiodendutc", "timeperiodendutc", "periodendutc"],
+    ),
+}
@@ -0,0 +1,162 @@
+"""
+Pluggable extraction strategies.
+
+A strategy turns an AdvisoryDocument into station entries. `extract`
+returns None when the document is not in a shape the strategy handles,
+or [] when it is but nothing complete was found:
+
+    window  line-window heuristics around 3-letter station codes (parser.py)
+    table   advisory tables read by their header columns (tables.py)
+    hybrid  table, falling back to window (default)
+
+`register_strategy` adds more (e.g. a FallbackStrategy over new ones).
+`extract_advisory` runs the strategy named by ADVISORY_EXTRACTOR and records,
+per email, the path that produced the stations - "table", "window", or
+"table_fallback" when a table was found but yielded nothing and the window
+strategy was used - in `extraction_metrics`.
+"""
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from .document import AdvisoryDocument, prepare_document
+from .parser import extract_stations
+from .tables import extract_table_stations
+
+logger = logging.getLogger(__name__)
+
+ADVISORY_EXTRACTOR = os.environ.get("ADVISORY_EXTRACTOR", "hybrid").lower()
+
+
+class ExtractionStrategy(ABC):
+    name: str = ""
+
+    @abstractmethod
+    def extract(self, doc: AdvisoryDocument, mail_received_dt: Optional[str] = None) -> Optional[List[Dict]]:
+        """Station entries, or None if the document isn't in a shape this strategy handles."""
+
+    def run(self, doc: AdvisoryDocument, mail_received_dt: Optional[str] = None) -> Tuple[List[Dict], str]:
+        """(stations, path) - the path names the strategy that produced the stations."""
+        return self.extract(doc, mail_received_dt) or [], self.name
+
+
+class WindowStrategy(ExtractionStrategy):
+    name = "window"
+
+    def extract(self, doc, mail_received_dt=None):
+        return extract_stations(doc.lines, mail_received_dt, tokens=doc.tokens)
+
+
+class TableStrategy(ExtractionStrategy):
+    name = "table"
+
+    def extract(self, doc, mail_received_dt=None):
+        found, stations = extract_table_stations(doc.tables, mail_received_dt)
+        return stations if found else None
+
+
+class FallbackStrategy(ExtractionStrategy):
+    """Try `strategies` in order; the first one with stations wins."""
+
+    def __init__(self, name: str, strategies: Sequence[ExtractionStrategy]):
+        self.name = name
+        self.strategies = list(strategies)
+
+    def extract(self, doc, mail_received_dt=None):
+        return self.run(doc, mail_received_dt)[0]
+
+    def run(self, doc, mail_received_dt=None):
+        # path "<name>_fallback": <name> recognised the document but found nothing, a later strategy was used
+        fell_back_from = None
+        for i, strategy in enumerate(self.strategies):
+            stations = strategy.extract(doc, mail_received_dt)
+            if stations:
+                return stations, f"{fell_back_from}_fallback" if fell_back_from else strategy.name
+            if stations is not None and fell_back_from is None and i < len(self.strategies) - 1:
+                fell_back_from = strategy.name
+        if fell_back_from:
+            return [], f"{fell_back_from}_fallback"
+        return [], self.strategies[-1].name if self.strategies else self.name
+
+
+STRATEGIES: Dict[str, ExtractionStrategy] = {}
+
+
+def register_strategy(strategy: ExtractionStrategy) -> ExtractionStrategy:
+    STRATEGIES[strategy.name] = strategy
+    return strategy
+
+
+def get_strategy(name: str) -> ExtractionStrategy:
+    try:
+        return STRATEGIES[name]
+    except KeyError:
+        raise ValueError(f"Unknown extraction strategy '{name}' (known: {', '.join(STRATEGIES)})") from None
+
+
+register_strategy(WindowStrategy())
+register_strategy(TableStrategy())
+register_strategy(FallbackStrategy("hybrid", [STRATEGIES["table"], STRATEGIES["window"]]))
+
+
+class ExtractionMetrics:
+    """Per-path email / station counts and extraction time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.emails: Dict[str, int] = defaultdict(int)
+        self.stations: Dict[str, int] = defaultdict(int)
+        self.seconds: Dict[str, float] = defaultdict(float)
+
+    def record(self, path: str, stations: int, seconds: float) -> None:
+        with self._lock:
+            self.emails[path] += 1
+            self.stations[path] += stations
+            self.seconds[path] += seconds
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                path: {
+                    "emails": count,
+                    "stations": self.stations[path],
+                    "avg_ms": round(self.seconds[path] * 1000 / count, 3),
+                }
+                for path, count in self.emails.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.emails.clear()
+            self.stations.clear()
+            self.seconds.clear()
+
+
+extraction_metrics = ExtractionMetrics()
+
+
+class ExtractionResult(NamedTuple):
+    stations: List[Dict]
+    path: str
+    seconds: float
+
+
+def extract_advisory(doc: AdvisoryDocument, mail_received_dt: Optional[str] = None,
+                     strategy: str = ADVISORY_EXTRACTOR) -> ExtractionResult:
+    """Stations of one advisory document with the named strategy, recording the path taken."""
+    start = time.perf_counter()
+    stations, path = get_strategy(strategy).run(doc, mail_received_dt)
+    seconds = time.perf_counter() - start
+    extraction_metrics.record(path, len(stations), seconds)
+    logger.info("Advisory extraction: path=%s stations=%d %.2f ms", path, len(stations), seconds * 1000)
+    return ExtractionResult(stations, path, seconds)
+
+
+def extract_advisory_stations(html_content: str, mail_received_dt: Optional[str] = None,
+                              strategy: str = ADVISORY_EXTRACTOR) -> List[Dict]:
+    """extract_advisory() on the shared parsed document of an HTML body."""
+    return extract_advisory(prepare_document(html_content or ""), mail_received_dt, strategy).stations
@@ -0,0 +1,104 @@
+"""
+Table strategy: read advisory tables by their header columns.
+
+Most advisories arrive as an HTML table whose header row names the columns
+(Station, Weather Phenomenon, Operation Probability, Advisory Time Period
+Start UTC, ...). The columns are mapped once from the header and each data
+row is read directly from its cells, in one pass. Entries are the same as
+the line-window parser produces: same fields, same value checks (3-letter
+station, 2-6 letter phenomenon, 0-100 probability) and the same time
+formatting.
+"""
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .parser import format_advisory_time, parse_mail_received_datetime, tokenize_line
+from .patterns import MANDATORY_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+def header_field(header: str) -> Optional[str]:
+    """Advisory field named by a table header cell, if any."""
+    h = header.lower()
+    if "station" in h:
+        return "station"
+    if "weather" in h and "phenom" in h:
+        return "weatherPhenomenon"
+    if "operation" in h and "probab" in h:
+        return "operationProbability"
+    if "utc" in h:
+        if "start" in h:
+            return "advisoryTimePeriodStartUTC"
+        if "end" in h:
+            return "advisoryTimePeriodEndUTC"
+    return None
+
+
+def map_header(cells: Sequence[str]) -> Dict[str, int]:
+    """{field: column index} for a header row; the first column naming a field wins."""
+    columns: Dict[str, int] = {}
+    for i, cell in enumerate(cells):
+        field = header_field(cell)
+        if field and field not in columns:
+            columns[field] = i
+    return columns
+
+
+def _row_entry(row: Sequence[str], columns: Dict[str, int], mail_dt_utc) -> Optional[Dict]:
+    def cell(field):
+        # first text line of the cell: "TS<br>RA" reads as "TS", as in the line-window parser
+        index = columns[field]
+        return row[index].split("\n", 1)[0] if index < len(row) else ""
+
+    station = tokenize_line(cell("station"))
+    if not station.is_station:
+        return None
+    entry: Dict = {"station": station.text}
+
+    probability = tokenize_line(cell("operationProbability"))
+    percent = probability.percent
+    if percent is not None and 0 <= percent <= 100:
+        entry["operationProbability"] = percent
+
+    phenomenon = tokenize_line(cell("weatherPhenomenon"))
+    if phenomenon.is_phenomenon and phenomenon.text != station.text:
+        entry["weatherPhenomenon"] = phenomenon.text
+
+    for field in ("advisoryTimePeriodStartUTC", "advisoryTimePeriodEndUTC"):
+        times = tokenize_line(cell(field)).times
+        if times:
+            entry[field] = format_advisory_time(times[0], mail_dt_utc)
+    return entry
+
+
+def extract_table_stations(tables: Sequence[Sequence[Sequence[str]]],
+                           mail_received_dt: Optional[str] = None) -> Tuple[bool, List[Dict]]:
+    """
+    (found, stations) from the document's tables. `found` is True when some
+    table has a header row naming all MANDATORY_FIELDS; `stations` holds the
+    complete entries of the rows below such headers.
+    """
+    mail_dt_utc = None
+    found = False
+    stations: List[Dict] = []
+    for table in tables:
+        columns = None
+        for row in table:
+            if columns is None:
+                mapped = map_header(row)
+                if len(mapped) == len(MANDATORY_FIELDS):
+                    columns = mapped
+                    if not found:
+                        found = True
+                        mail_dt_utc = parse_mail_received_datetime(mail_received_dt)
+                continue
+            entry = _row_entry(row, columns, mail_dt_utc)
+            if entry is None:
+                continue
+            missing = [k for k in MANDATORY_FIELDS if k not in entry]
+            if missing:
+                logger.info("Incomplete table row for '%s', missing fields, ignoring: %s", entry["station"], missing)
+            else:
+                stations.append(entry)
+    return found, stations
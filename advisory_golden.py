@@ -0,0 +1,140 @@
+"""
+Golden-corpus regression check and benchmark for advisory_extraction.
+
+Every extraction script and EventHub sender goes through the same
+package, so one corpus covers them all. Each `<name>.html` in the corpus
+directory (default advisory_golden/) is an advisory body; the optional
+`<name>.received` holds its receivedDateTime and `<name>.expected.json` the
+accepted output:
+
+    {"missing": [...mandatory labels not found...],
+     "paths": {strategy: path taken},
+     "stations": {strategy: [...stations...]}}
+
+for every registered strategy. The run compares the current output with
+it under every installed HTML parser backend (html.parser always, plus
+selectolax / lxml when present), prints each regression, then times each
+strategy per email (body to stations, on a freshly parsed document each
+time). Exits 1 on any regression.
+
+After an intended behaviour change, review the diff and accept it with
+--update, which rewrites the expected files from the default backend.
+
+Usage:
+    python advisory_golden.py [--update] [corpus_dir] [repeats]
+"""
+import glob
+import json
+import logging
+import os
+import sys
+import time
+
+from advisory_extraction import (
+    STRATEGIES,
+    AdvisoryDocument,
+    available_backends,
+    extract_advisory,
+    missing_mandatory_fields,
+)
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "advisory_golden")
+DEFAULT_RECEIVED = "2025-11-21T10:00:00Z"
+
+
+def load_corpus(directory):
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.html"))):
+        stem = os.path.splitext(path)[0]
+        with open(path, encoding="utf-8") as f:
+            body = f.read()
+        received = DEFAULT_RECEIVED
+        if os.path.exists(stem + ".received"):
+            with open(stem + ".received", encoding="utf-8") as f:
+                received = f.read().strip()
+        corpus.append((os.path.basename(stem), stem, body, received))
+    return corpus
+
+
+def run_case(body, received, backend=None):
+    doc = AdvisoryDocument(body, backend)
+    result = {"missing": sorted(missing_mandatory_fields(doc)), "paths": {}, "stations": {}}
+    for name in STRATEGIES:
+        extracted = extract_advisory(doc, received, strategy=name)
+        result["paths"][name] = extracted.path
+        result["stations"][name] = extracted.stations
+    return result
+
+
+def diff_case(expected, actual):
+    problems = []
+    if expected.get("missing") != actual["missing"]:
+        problems.append(f"missing labels {expected.get('missing')} -> {actual['missing']}")
+    for name in STRATEGIES:
+        if name not in expected.get("stations", {}):
+            problems.append(f"{name}: no expected output (new strategy? run --update)")
+            continue
+        if expected.get("paths", {}).get(name) != actual["paths"][name]:
+            problems.append(f"{name}: path {expected['paths'].get(name)} -> {actual['paths'][name]}")
+        if expected["stations"][name] != actual["stations"][name]:
+            problems.append(f"{name}: stations {expected['stations'][name]} -> {actual['stations'][name]}")
+    return problems
+
+
+def bench(strategy, corpus, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for _, _, body, received in corpus:
+            extract_advisory(AdvisoryDocument(body), received, strategy=strategy)
+    return (time.perf_counter() - start) / (repeats * len(corpus))
+
+
+def main():
+    args = sys.argv[1:]
+    update = "--update" in args
+    args = [a for a in args if a != "--update"]
+    directory = args[0] if args else GOLDEN_DIR
+    repeats = int(args[1]) if len(args) > 1 else 50
+    logging.getLogger("advisory_extraction").setLevel(logging.WARNING)
+
+    corpus = load_corpus(directory)
+    if not corpus:
+        print(f"No *.html bodies found in {directory}")
+        return 1
+
+    backends = available_backends()
+    regressions = 0
+    for name, stem, body, received in corpus:
+        expected_path = stem + ".expected.json"
+        if update:
+            with open(expected_path, "w", encoding="utf-8") as f:
+                json.dump(run_case(body, received), f, indent=2, ensure_ascii=False)
+                f.write("\n")
+            continue
+        if not os.path.exists(expected_path):
+            print(f"{name}: no {os.path.basename(expected_path)} (run --update)")
+            regressions += 1
+            continue
+        with open(expected_path, encoding="utf-8") as f:
+            expected = json.load(f)
+        problems = []
+        for backend in backends:
+            problems += [f"[{backend}] {p}" for p in diff_case(expected, run_case(body, received, backend))]
+        for problem in problems:
+            print(f"{name}: {problem}")
+        regressions += bool(problems)
+
+    print(f"Corpus: {len(corpus)} email(s) ({directory}), backends: {', '.join(backends)}")
+    if update:
+        print(f"Expected output rewritten for {len(corpus)} email(s)")
+    else:
+        print(f"Regressions: {regressions}")
+
+    print()
+    for name in STRATEGIES:
+        print(f"{name:<8}: {bench(name, corpus, repeats) * 1e6:8.1f} µs/email")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
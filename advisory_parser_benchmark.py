@@ -0,0 +1,239 @@
+"""
+Benchmark: legacy window-regex advisory extraction vs advisory_extraction.parser.
+
+Runs both extractors over a corpus of advisory email bodies, checks that
+they return identical stations for every email, and reports the time per
+email for each. The text-parsing step is timed on its own (HTML-to-text is
+done once up front for both); the HTML-to-lines step is compared separately
+(BeautifulSoup html.parser vs advisory_extraction.document), and so is the whole
+body-to-stations step with the line-window path vs the hybrid table-aware
+extractor (advisory_extraction.strategies).
+
+Corpus: a directory of recorded bodies (`*.html`). An optional
+`<name>.received` file next to a body holds its receivedDateTime. Without a
+directory a synthetic corpus is generated.
+
+Usage:
+    python advisory_parser_benchmark.py [corpus_dir] [repeats]
+"""
+import glob
+import logging
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime, timezone
+
+from bs4 import BeautifulSoup
+
+from advisory_extraction import document as advisory_document
+from advisory_extraction import parser as advisory_parser
+from advisory_extraction import strategies as advisory_strategies
+
+DEFAULT_RECEIVED = "2025-11-21T10:00:00Z"
+
+
+# ---- legacy extractor: the original extract_weather_stations_nlp loop, logging removed ----
+
+def _legacy_build_utc(match_obj, mail_dt_utc):
+    try:
+        if not match_obj:
+            return None
+        hhmm = match_obj.group(1)
+        day = int(match_obj.group(2))
+        mon_abbr = match_obj.group(3).lower()
+        if len(hhmm) == 4:
+            hour, minute = int(hhmm[:2]), int(hhmm[2:])
+        elif len(hhmm) == 3:
+            hour, minute = int(hhmm[:1]), int(hhmm[1:])
+        else:
+            return None
+        month = advisory_parser.MONTH_MAP.get(mon_abbr)
+        if not month:
+            return None
+        if mail_dt_utc is None:
+            year = datetime.now(timezone.utc).year
+        else:
+            year = mail_dt_utc.year
+            if mail_dt_utc.month == 12 and month == 1:
+                year += 1
+        return datetime(year, month, day, hour, minute, 0, tzinfo=timezone.utc)
+    except Exception:
+        return None
+
+
+def _legacy_parse_mail_dt(dt_str):
+    if not dt_str:
+        return None
+    try:
+        return datetime.fromisoformat(dt_str.replace('Z', '+00:00')).astimezone(timezone.utc)
+    except Exception:
+        return None
+
+
+def _legacy_times(window_lines):
+    pattern = re.compile(r'(\d{3,4}/\d{1,2}\s*[A-Za-z]{3})')
+    matches = []
+    for line in window_lines:
+        for m in pattern.finditer(line):
+            matches.append(m.group(1).strip())
+    if len(matches) < 3:
+        return None
+    return matches[0], matches[2]
+
+
+def legacy_extract(lines, mail_received_dt):
+    stations = []
+    n = len(lines)
+    i = 0
+    while i < n:
+        line = lines[i]
+        if re.fullmatch(r"[A-Z]{3}", line):
+            station_code = line
+            entry = {"station": station_code}
+            window = lines[i + 1: i + 15]
+            for w in window:
+                m = re.search(r"(\d{1,3})\s*%", w)
+                if m:
+                    val = int(m.group(1))
+                    if 0 <= val <= 100:
+                        entry["operationProbability"] = val
+                        break
+            for w in window:
+                if re.fullmatch(r"[A-Z]{2,6}", w) and w != station_code:
+                    entry["weatherPhenomenon"] = w
+                    break
+            time_result = _legacy_times(window)
+            if time_result:
+                start_str, end_str = time_result
+                start = _legacy_build_utc(
+                    re.match(r'(\d{3,4})/(\d{1,2})\s*([A-Za-z]{3})', start_str),
+                    _legacy_parse_mail_dt(mail_received_dt))
+                end = _legacy_build_utc(
+                    re.match(r'(\d{3,4})/(\d{1,2})\s*([A-Za-z]{3})', end_str),
+                    _legacy_parse_mail_dt(mail_received_dt))
+                entry["advisoryTimePeriodStartUTC"] = start.strftime("%Y-%m-%dT%H:%M:%S") if start else start_str
+                entry["advisoryTimePeriodEndUTC"] = end.strftime("%Y-%m-%dT%H:%M:%S") if end else end_str
+            if all(k in entry for k in advisory_parser.MANDATORY_FIELDS):
+                stations.append(entry)
+        i += 1
+    return stations
+
+
+# ---- corpus ----
+
+STATIONS = ["DEL", "BOM", "BLR", "MAA", "CCU", "HYD", "AMD", "PNQ", "GOI", "COK", "LKO", "JAI", "PAT", "IXC"]
+PHENOMENA = ["FG", "TS", "TSRA", "HZ", "BR", "DS", "SQ", "RA"]
+
+
+def synthetic_body(rng: random.Random, n_stations: int) -> str:
+    header = ("<tr><th>Station</th><th>Weather Phenomenon</th><th>Operation Probability</th>"
+              "<th>Advisory Time Period Start UTC</th><th>Start LT</th>"
+              "<th>Advisory Time Period End UTC</th><th>End LT</th></tr>")
+    rows = []
+    for station in rng.sample(STATIONS, n_stations):
+        day = rng.randint(1, 28)
+        start = rng.randint(0, 20)
+        rows.append(
+            f"<tr><td>{station}</td><td>{rng.choice(PHENOMENA)}</td><td>{rng.choice([25, 50, 75, 90])}%</td>"
+            f"<td>{start:02d}00/{day} Nov</td><td>{(start + 5) % 24:02d}30/{day} Nov</td>"
+            f"<td>{start + 3:02d}00/{day} Nov</td><td>{(start + 8) % 24:02d}30/{day} Nov</td></tr>"
+        )
+    return (
+        "<html><body><p>Dear Team,</p><p>Please find the weather advisory below.</p>"
+        f"<table>{header}{''.join(rows)}</table>"
+        "<p>Regards,<br>Met Desk</p></body></html>"
+    )
+
+
+def load_corpus(directory):
+    corpus = []
+    if directory:
+        for path in sorted(glob.glob(os.path.join(directory, "*.html"))):
+            with open(path, encoding="utf-8") as f:
+                body = f.read()
+            received = DEFAULT_RECEIVED
+            meta = os.path.splitext(path)[0] + ".received"
+            if os.path.exists(meta):
+                with open(meta, encoding="utf-8") as f:
+                    received = f.read().strip()
+            corpus.append((os.path.basename(path), body, received))
+    else:
+        rng = random.Random(42)
+        for i in range(200):
+            corpus.append((f"synthetic_{i:03d}", synthetic_body(rng, rng.randint(1, 12)), DEFAULT_RECEIVED))
+    return corpus
+
+
+def to_lines(html):
+    text = BeautifulSoup(html, "html.parser").get_text("\n", strip=True)
+    return [l.strip() for l in text.splitlines() if l.strip()]
+
+
+def bench(fn, documents, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for _, lines, received in documents:
+            fn(lines, received)
+    return (time.perf_counter() - start) / (repeats * len(documents))
+
+
+def bench_html(fn, corpus, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for _, body, _ in corpus:
+            fn(body)
+    return (time.perf_counter() - start) / (repeats * len(corpus))
+
+
+def main():
+    directory = sys.argv[1] if len(sys.argv) > 1 else os.environ.get("ADVISORY_CORPUS_DIR")
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    logging.getLogger("advisory_extraction").setLevel(logging.WARNING)
+
+    corpus = load_corpus(directory)
+    if not corpus:
+        print(f"No *.html bodies found in {directory}")
+        return
+    documents = [(name, to_lines(body), received) for name, body, received in corpus]
+
+    mismatches = [name for name, lines, received in documents
+                  if legacy_extract(lines, received) != advisory_parser.extract_stations(lines, received)]
+    print(f"Corpus: {len(documents)} email(s) ({directory or 'synthetic'})")
+    print(f"Output mismatches: {len(mismatches)}" + (f" -> {mismatches[:10]}" if mismatches else ""))
+
+    legacy_s = bench(legacy_extract, documents, repeats)
+    parser_s = bench(advisory_parser.extract_stations, documents, repeats)
+
+    print(f"\nlegacy window regex : {legacy_s * 1e6:8.1f} µs/email")
+    print(f"advisory_parser     : {parser_s * 1e6:8.1f} µs/email")
+    print(f"speed-up            : {legacy_s / parser_s:8.2f}x")
+
+    html_mismatches = [name for name, body, _ in corpus if to_lines(body) != advisory_document.html_to_lines(body)]
+    bs4_s = bench_html(to_lines, corpus, max(1, repeats // 4))
+    doc_s = bench_html(advisory_document.html_to_lines, corpus, max(1, repeats // 4))
+    print(f"\nHTML -> lines mismatches: {len(html_mismatches)}" + (f" -> {html_mismatches[:10]}" if html_mismatches else ""))
+    print(f"BeautifulSoup html.parser: {bs4_s * 1e6:8.1f} µs/email")
+    print(f"advisory_document        : {doc_s * 1e6:8.1f} µs/email")
+    print(f"speed-up                 : {bs4_s / doc_s:8.2f}x")
+
+    def extract_with(strategy):
+        return lambda body, received: advisory_strategies.extract_advisory(
+            advisory_document.AdvisoryDocument(body), received, strategy=strategy).stations
+
+    hybrid_mismatches = [name for name, body, received in corpus
+                         if extract_with("hybrid")(body, received) != extract_with("window")(body, received)]
+    advisory_strategies.extraction_metrics.reset()
+    window_s = bench(extract_with("window"), corpus, max(1, repeats // 4))
+    hybrid_s = bench(extract_with("hybrid"), corpus, max(1, repeats // 4))
+    print(f"\nBody -> stations mismatches (hybrid vs window): {len(hybrid_mismatches)}"
+          + (f" -> {hybrid_mismatches[:10]}" if hybrid_mismatches else ""))
+    print(f"line-window path         : {window_s * 1e6:8.1f} µs/email")
+    print(f"hybrid (table-aware)     : {hybrid_s * 1e6:8.1f} µs/email")
+    print(f"speed-up                 : {window_s / hybrid_s:8.2f}x")
+    print(f"paths taken              : {advisory_strategies.extraction_metrics.snapshot()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Table/graph JSON generation for the METAR server's `table_and_graph_JSON_generater` tool.
+
+  - simple tabular input (a JSON array of flat objects, or a markdown pipe
+    table) is converted locally, without an LLM call
+  - everything else goes to the async Azure OpenAI client, behind a
+    semaphore (GRAPH_LLM_CONCURRENCY) so the event loop - and with it
+    `ping` and `/health` - keeps running during the call
+  - results are cached by a hash of `response_data`, so identical requests
+    are answered from memory
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+GRAPH_LLM_CONCURRENCY = int(os.getenv("GRAPH_LLM_CONCURRENCY", "4"))
+GRAPH_CACHE_SIZE = int(os.getenv("GRAPH_CACHE_SIZE", "256"))
+
+_TIME_LIKE_RE = re.compile(r"time|date|day|hour|month|\b(utc|ist)\b", re.IGNORECASE)
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _coerce(value: str) -> Any:
+    text = value.strip()
+    try:
+        number = float(text)
+    except ValueError:
+        return text
+    return int(number) if number.is_integer() else number
+
+
+def _parse_markdown_table(text: str) -> Optional[List[Dict[str, Any]]]:
+    lines = [l.strip() for l in text.strip().splitlines() if l.strip()]
+    if len(lines) < 3 or not all(l.startswith("|") for l in lines):
+        return None
+    if not re.fullmatch(r"\|?[\s:\-|]+\|?", lines[1]):
+        return None
+    split = lambda l: [c.strip() for c in l.strip("|").split("|")]
+    columns = split(lines[0])
+    rows = []
+    for line in lines[2:]:
+        cells = split(line)
+        if len(cells) != len(columns):
+            return None
+        rows.append({c: _coerce(v) for c, v in zip(columns, cells)})
+    return rows
+
+
+def parse_tabular(response_data: str) -> Optional[List[Dict[str, Any]]]:
+    """Rows of a simple table, or None if the input isn't one."""
+    try:
+        data = json.loads(response_data)
+    except (TypeError, ValueError):
+        return _parse_markdown_table(response_data or "")
+
+    if isinstance(data, dict):
+        # {"rows": [...]} / {"data": [...]} wrappers
+        data = data.get("rows") or data.get("data")
+    if not isinstance(data, list) or not data or not all(isinstance(r, dict) for r in data):
+        return None
+    if any(isinstance(v, (dict, list)) for r in data for v in r.values()):
+        return None
+    return data
+
+
+def build_local_chart(rows: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Table + chart JSON for flat rows; None when no numeric column can be charted."""
+    columns = list(dict.fromkeys(c for r in rows for c in r))
+    numeric = [c for c in columns if all(_is_number(r.get(c)) for r in rows if r.get(c) is not None)
+               and any(r.get(c) is not None for r in rows)]
+    labels = [c for c in columns if c not in numeric]
+    if not numeric or not labels:
+        return None
+
+    x_key, y_key = labels[0], numeric[0]
+    return {
+        "type": "RUN_FINISHED",
+        "table": {"columns": columns, "rows": rows},
+        "chart": {
+            "data": [{x_key: r.get(x_key), y_key: r.get(y_key)} for r in rows],
+            "xKey": x_key,
+            "yKey": y_key,
+            "chartType": "line" if _TIME_LIKE_RE.search(x_key) else "bar",
+        },
+    }
+
+
+class ChartGenerator:
+    def __init__(self, llm, system_prompt: str, model: Optional[str] = None,
+                 concurrency: int = GRAPH_LLM_CONCURRENCY, cache_size: int = GRAPH_CACHE_SIZE):
+        self.llm = llm  # AsyncAzureOpenAI
+        self.system_prompt = system_prompt
+        self.model = model or os.getenv("deployment")
+        self.cache_size = cache_size
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _cache_get(self, key: str) -> Optional[str]:
+        value = self._cache.get(key)
+        if value is not None:
+            self._cache.move_to_end(key)
+        return value
+
+    def _cache_put(self, key: str, value: str) -> None:
+        self._cache[key] = value
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _generate_llm(self, response_data: str) -> str:
+        messages = [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": "The User prompt is as follows:\n" + response_data},
+        ]
+        async with self._semaphore:
+            response = await self.llm.chat.completions.create(model=self.model, messages=messages)
+        return response.choices[0].message.content
+
+    async def generate(self, response_data: str) -> str:
+        key = hashlib.sha256((response_data or "").encode("utf-8")).hexdigest()
+        cached = self._cache_get(key)
+        if cached is not None:
+            logger.info("Table/graph JSON served from cache")
+            return cached
+
+        # identical request already running -> share its result
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            rows = parse_tabular(response_data)
+            local = build_local_chart(rows) if rows else None
+            if local is not None:
+                logger.info("Table/graph JSON generated locally (%d rows)", len(rows))
+                result = json.dumps(local, ensure_ascii=False, default=str)
+            else:
+                result = await self._generate_llm(response_data)
+            self._cache_put(key, result)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            # mark retrieved so an unshared failure doesn't log "exception never retrieved"
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
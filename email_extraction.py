@@ -0,0 +1,530 @@
+import asyncio
+import requests
+import json
+from datetime import datetime, timezone, timedelta
+import os
+import re
+import logging
+ 
+from mail_delta import MailDeltaSync, DELTA_SELECT
+from mail_fetch import make_body_fetcher, inline_body
+from mail_pipeline import AdaptiveThrottle, ThrottledHttp, run_pipeline
+from mailbox_ops import MailboxOps
+from mail_ledger import MailLedger, MAIL_LEDGER_DB
+from advisory_extraction import (
+    GRAPH_BASE,
+    MANDATORY_FIELDS,
+    GraphSession,
+    evaluate_advisory,
+    extract_advisory_stations,
+    get_message_body,
+    list_messages,
+    missing_mandatory_fields,
+)
+ 
+# ===================== LOGGING CONFIG =====================
+ 
+ 
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.environ.get("PIPELINE_LOG_FILE", "weather_pipeline.log")
+ 
+from token_store import get_access_token
+ 
+from logging_config import get_email_logger
+logger = get_email_logger()
+ 
+# ===================== ENV LOADING =====================
+ 
+def load_env(path: str = ".env") -> None:
+    """Minimal .env loader (no external dependency)."""
+    if not os.path.exists(path):
+        logger.debug("No .env file found at %s, skipping env load.", path)
+        return
+ 
+    logger.debug("Loading environment variables from %s", path)
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+ 
+            if '=' in line:
+                key, value = line.split('=', 1)
+                key = key.strip()
+                value = value.strip().strip('"\'')
+                if key not in os.environ:
+                    os.environ[key] = value
+                    logger.debug("Loaded env var: %s", key)
+ 
+# Load .env early
+load_env()
+ 
+ENV = os.environ.get("ENV", "").lower()
+IS_LOCAL_ENV = (ENV == "local")
+logger.info("ENV=%s | IS_LOCAL_ENV=%s", ENV, IS_LOCAL_ENV)
+ 
+# ===================== CONFIG =====================
+ 
+  # <--- or keep your hardcoded token
+USER_EMAIL = os.environ.get("USER_EMAIL")      # mailbox you are operating on
+ 
+ 
+if not USER_EMAIL:
+    logger.critical("USER_EMAIL is not set. Please set it in .env or code.")
+    raise RuntimeError("USER_EMAIL is not set. Please set it in .env or code.")
+ 
+logger.info("Configured USER_EMAIL=%s", USER_EMAIL)
+ 
+def build_headers():
+    """Always use latest access token from token_store."""
+    access_token = get_access_token()
+    return {
+        "Authorization": f"Bearer {access_token}",
+        "Prefer": 'outlook.body-content-type="html"',
+    }
+ 
+def build_archive_headers():
+    """Headers for JSON POST calls (move, reply, etc.)."""
+    access_token = get_access_token()
+    return {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json",
+    }
+ 
+# every Graph call goes through one throttle (bounded concurrency + Retry-After backoff)
+# on a pooled Graph session (advisory_extraction.graph: gzip, timing, GRAPH_RECORD / GRAPH_REPLAY);
+# the throttle does the retries, so the session itself doesn't
+graph_throttle = AdaptiveThrottle()
+graph_session = GraphSession(max_retries=0)
+graph_http = ThrottledHttp(graph_throttle, session=graph_session)
+
+# folder ids cached per process (MAIL_FOLDER_TTL), moves batched through $batch (mailbox_ops.py)
+mailbox = MailboxOps(USER_EMAIL, build_archive_headers, http=graph_http, base=GRAPH_BASE)
+ 
+# delta -> only messages new since the last run (mail_delta.py); full -> page the whole Inbox
+MAIL_SYNC_MODE = os.environ.get("MAIL_SYNC_MODE", "delta").lower()
+# inline -> bodies come with the message listing; batch -> Graph $batch (20 per request) (mail_fetch.py)
+MAIL_BODY_FETCH = os.environ.get("MAIL_BODY_FETCH", "inline")
+ 
+OUTPUT_DIR = "email_extracts"
+ 
+# Only create directory upfront if ENV=local (global mode won't save files)
+if IS_LOCAL_ENV and not os.path.exists(OUTPUT_DIR):
+    os.makedirs(OUTPUT_DIR)
+    logger.info("Created output directory: %s", OUTPUT_DIR)
+ 
+IST_OFFSET = timezone(timedelta(hours=5, minutes=30))
+ 
+# Canonical required fields (used for error reporting + checks)
+REQUIRED_FIELDS = MANDATORY_FIELDS
+ 
+# ===================== UTILS =====================
+ 
+def sanitize_filename(filename: str) -> str:
+    safe_name = re.sub(r'[<>:"/\\|?*]', '_', filename)
+    logger.debug("Sanitized filename '%s' -> '%s'", filename, safe_name)
+    return safe_name
+ 
+def convert_to_ist_format(utc_datetime_str: str) -> str:
+    try:
+        utc_dt = datetime.fromisoformat(utc_datetime_str.replace('Z', '+00:00'))
+        ist_dt = utc_dt.astimezone(IST_OFFSET)
+        formatted = ist_dt.strftime("%Y-%m-%dT%H:%M:%SZ+05:30")
+        logger.debug("Converted UTC '%s' -> IST formatted '%s'", utc_datetime_str, formatted)
+        return formatted
+    except Exception as e:
+        logger.warning("Failed to convert '%s' to IST, using now. Error: %s", utc_datetime_str, e)
+        ist_dt = datetime.now(IST_OFFSET)
+        return ist_dt.strftime("%Y-%m-%dT%H:%M:%SZ+05:30")
+ 
+# ===================== FIELD LABEL CHECK =====================
+ 
+def check_mandatory_fields_in_html(html_content: str):
+    """
+    Returns list of missing required field labels (by name from REQUIRED_FIELDS).
+    """
+    return missing_mandatory_fields(html_content)
+ 
+# ===================== EXTRACTION =====================
+ 
+def extract_weather_stations_nlp(html_content: str, mail_received_dt: str = None):
+    # ADVISORY_EXTRACTOR strategy: table columns when the advisory is a table, line windows otherwise
+    return extract_advisory_stations(html_content, mail_received_dt)
+ 
+# ===================== GRAPH API EMAIL FUNCTIONS =====================
+ 
+def list_select() -> str:
+    """$select for message listings; includes `body` when the fetcher reads bodies inline."""
+    fields = DELTA_SELECT
+    return f"{fields},{body_fetcher.list_select}" if body_fetcher.list_select else fields
+ 
+def get_all_messages(page_size: int = 50, max_pages: int = None):
+    return list_messages(USER_EMAIL, build_headers, folder="Inbox", page_size=page_size,
+                         max_pages=max_pages, select=list_select(), http=graph_http, base=GRAPH_BASE)
+ 
+_delta_sync = None
+ 
+def get_delta_sync() -> MailDeltaSync:
+    global _delta_sync
+    if _delta_sync is None:
+        _delta_sync = MailDeltaSync(USER_EMAIL, build_headers, folder="Inbox", base=GRAPH_BASE,
+                                    select=list_select(), http=graph_http)
+    return _delta_sync
+ 
+def get_new_messages(page_size: int = 50):
+    """
+    Inbox messages received since the last committed run (Graph delta query).
+    Call commit_new_messages() after they have been processed.
+    """
+    sync = get_delta_sync()
+    sync.page_size = page_size
+    return sync.new_messages()
+ 
+_ledger = None
+ 
+def get_ledger() -> MailLedger | None:
+    """Processing ledger (mail_ledger.py) shared by the pipeline runs; MAIL_LEDGER_DB="" disables it."""
+    global _ledger
+    if _ledger is None and MAIL_LEDGER_DB:
+        _ledger = MailLedger(MAIL_LEDGER_DB)
+    return _ledger
+ 
+def commit_new_messages(results=None) -> bool:
+    """
+    Persist the delta position so the next run only sees newer mail.
+    With the pipeline `results` of the round, only once every message is handled
+    (archived, now or by an earlier run); otherwise the position stays where it was
+    and the next run lists those messages again (the ledger skips finished ones).
+    Returns True if the position was saved.
+    """
+    if _delta_sync is None:
+        return False
+    if results is not None:
+        pending = [r for r in results if not r.archived and r.resumed_from != "archived"]
+        if pending:
+            logger.info("Delta position not advanced: %d message(s) not archived yet", len(pending))
+            return False
+    _delta_sync.commit()
+    return True
+ 
+def get_message_body_html(message_id: str) -> str | None:
+    logger.debug("Fetching message body for message_id=%s", message_id)
+    return get_message_body(USER_EMAIL, message_id, build_headers, http=graph_http, base=GRAPH_BASE)
+ 
+body_fetcher = make_body_fetcher(MAIL_BODY_FETCH, USER_EMAIL, build_headers,
+                                 fetch_one=get_message_body_html, http=graph_http, base=GRAPH_BASE)
+ 
+# ===================== SEND ERROR EMAIL TO SENDER (NOW AS REPLY) =====================
+ 
+def send_advisory_error_email(message, missing_fields, invalid_fields, extra_reason: str | None = None):
+    """
+    Reply back to the SAME wrong email (not a new email).
+    Uses:
+      POST /users/{USER_EMAIL}/messages/{message_id}/reply
+    """
+    try:
+        from_obj = message.get("from") or {}
+        email_addr_obj = from_obj.get("emailAddress") or {}
+        sender_address = email_addr_obj.get("address")
+        message_id = message.get("id")
+ 
+        if not message_id:
+            logger.error("Cannot send reply: message id missing in message object.")
+            return
+ 
+        original_subject = message.get("subject") or "your weather advisory email"
+        logger.info(
+            "Sending advisory error email as reply for message_id=%s subject='%s'",
+            message_id,
+            original_subject,
+        )
+ 
+        lines: list[str] = []
+        lines.append("Dear Sender,")
+        lines.append("")
+        lines.append("We attempted to process your recent weather advisory email,")
+        lines.append("but could not extract the required JSON payload due to the following issue(s):")
+        lines.append("")
+ 
+        if missing_fields:
+            lines.append("Missing parameter(s):")
+            for f in missing_fields:
+                lines.append(f"  - " + f)
+            lines.append("")
+ 
+        if invalid_fields:
+            lines.append("Invalid / improperly formatted parameter(s):")
+            for f in invalid_fields:
+                lines.append(f"  - " + f)
+            lines.append("")
+ 
+        if extra_reason:
+            lines.append("Additional details:")
+            lines.append(f"  - {extra_reason}")
+            lines.append("")
+ 
+        lines.append("Required parameters are:")
+        for f in REQUIRED_FIELDS:
+            lines.append(f"  - {f}")
+        lines.append("")
+        lines.append("Please ensure all required parameters are present and in the correct format,")
+        lines.append("then resend the advisory email so that it can be processed and forwarded to Event Hub.")
+        lines.append("")
+        lines.append("This is an automated notification. No reply is necessary.")
+ 
+        body_text = "\n".join(lines)
+ 
+        url = f"{GRAPH_BASE}/users/{USER_EMAIL}/messages/{message_id}/reply"
+        payload = {
+            "comment": body_text
+        }
+ 
+        resp = graph_http.post(url, headers=build_archive_headers(), json=payload)
+        if resp.status_code == 202:
+            if sender_address:
+                logger.info(
+                    "Replied with parameter error notification to %s for message_id=%s",
+                    sender_address,
+                    message_id,
+                )
+            else:
+                logger.info(
+                    "Replied with parameter error notification to original message (sender address not resolved). message_id=%s",
+                    message_id,
+                )
+        else:
+            logger.error(
+                "Failed to send parameter error reply. Status=%s Response=%s",
+                resp.status_code,
+                resp.text,
+            )
+    except Exception as e:
+        logger.exception("Exception while sending error reply: %s", e)
+ 
+# ===================== ARCHIVE HELPERS =====================
+ 
+def get_archive_folder_id() -> str | None:
+    """
+    Return the id of the well-known 'Archive' folder for USER_EMAIL.
+    Resolved once and cached (re-resolved after MAIL_FOLDER_TTL or a 404 on move).
+    """
+    return mailbox.folder_id("archive")
+ 
+def move_message_to_archive(message_id: str) -> bool:
+    """
+    Move the given message to the Archive folder.
+    Returns True if moved successfully, False otherwise.
+    """
+    logger.info("Attempting to move message_id=%s to Archive.", message_id)
+    return mailbox.move(message_id, "archive")
+ 
+def archive_messages(message_ids) -> dict:
+    """
+    Move several messages to the Archive folder through Graph $batch.
+    Returns {message_id: moved}.
+    """
+    logger.info("Attempting to move %d message(s) to Archive.", len(message_ids))
+    return mailbox.move_many(message_ids, "archive")
+ 
+# ===================== MAIN PROCESSING =====================
+ 
+def evaluate_email(message, body_html: str):
+    """
+    Extract the advisory from one email body, without any Graph calls.
+    Returns (weather_advisory, None) on success, or (None, rejection) where
+    rejection holds the missing_fields / invalid_fields / extra_reason for the reply.
+    """
+    stations, rejection = evaluate_advisory(body_html, message.get("receivedDateTime", ""))
+    if rejection:
+        logger.info(
+            "Rejected email id=%s – missing: %s, invalid: %s, reason: %s",
+            message.get("id"),
+            ", ".join(rejection["missing_fields"]) or "-",
+            ", ".join(rejection["invalid_fields"]) or "-",
+            rejection["extra_reason"] or "-",
+        )
+        return None, rejection
+ 
+    weather_advisory = {
+        "createdAt": convert_to_ist_format(message.get("receivedDateTime", "")),
+        "stations": stations
+    }
+    logger.info(
+        "Successfully built weather_advisory for message_id=%s with %d station(s).",
+        message.get("id"),
+        len(stations),
+    )
+    return weather_advisory, None
+ 
+def reply_to_rejected_email(message, rejection) -> None:
+    """Reply to a rejected email with the reason (no archive)."""
+    try:
+        send_advisory_error_email(
+            message,
+            missing_fields=rejection.get("missing_fields") or [],
+            invalid_fields=rejection.get("invalid_fields") or [],
+            extra_reason=rejection.get("extra_reason"),
+        )
+    except Exception as notify_err:
+        logger.exception("Failed to send parameter error email: %s", notify_err)
+ 
+def reject_email(message, rejection) -> None:
+    """Reply to a rejected email with the reason, then move it to Archive."""
+    reply_to_rejected_email(message, rejection)
+ 
+    try:
+        moved = move_message_to_archive(message["id"])
+        if not moved:
+            logger.error("Could not move this message to Archive after error email.")
+    except Exception as arch_err:
+        logger.exception("Exception while moving to Archive after error email: %s", arch_err)
+ 
+def process_single_email(message, body_html: str | None = None):
+    """
+    Extract the advisory from one email. `body_html` is the prefetched body;
+    otherwise the body listed with the message is used, or fetched on its own.
+    Rejected emails get an error reply and are archived.
+    """
+    try:
+        logger.info("Processing single email id=%s subject='%s'",
+                    message.get("id"), (message.get("subject") or "")[:80])
+        if body_html is None:
+            body_html = inline_body(message)
+        if body_html is None:
+            body_html = get_message_body_html(message["id"])
+        if body_html is None:
+            # a failed read is not an empty email: no reply, the next run retries it
+            logger.warning("Body of email id=%s could not be fetched – left for the next run.", message.get("id"))
+            return None
+ 
+        weather_advisory, rejection = evaluate_email(message, body_html)
+        if rejection:
+            reject_email(message, rejection)
+            return None
+        return weather_advisory
+ 
+    except Exception as e:
+        logger.exception("Error processing email id=%s: %s", message.get("id"), e)
+        reject_email(message, {"missing_fields": [], "invalid_fields": [],
+                               "extra_reason": f"Internal processing error: {e}"})
+        return None
+ 
+def process_all_emails(save_files: bool | None = None):
+    """
+    When imported by send_events.py:
+      - Typically you won't call this; you'll use process_single_email.
+    When run directly (python info_table.py):
+      - save_files=True  -> JSON files created in OUTPUT_DIR
+      - save_files=False -> no files created, just extraction + logs
+ 
+    If save_files is None, we default to ENV:
+      - ENV=local  -> save_files=True
+      - ENV=global -> save_files=False
+    """
+    if save_files is None:
+        save_files = IS_LOCAL_ENV
+ 
+    logger.info("=" * 60)
+    logger.info("  WEATHER ADVISORY EMAIL PROCESSOR – NLP VERSION")
+    logger.info("=" * 60)
+    logger.info("ENV = %s | save_files = %s", ENV, save_files)
+    logger.info("Uses label detection + NLP-style window parsing around station codes.")
+    if save_files:
+        logger.info("JSON files WILL be created in %s/", OUTPUT_DIR)
+    else:
+        logger.info("JSON will NOT be saved, only extracted in memory.")
+ 
+    if MAIL_SYNC_MODE == "delta":
+        all_messages = get_new_messages(page_size=50)
+    else:
+        all_messages = get_all_messages(page_size=50)
+    successful_extractions = 0
+    skipped_emails = 0
+    logger.info("Processing %d email(s) through the pipeline...", len(all_messages))
+    results = asyncio.run(run_pipeline(
+        all_messages,
+        fetch_bodies=body_fetcher.fetch_bodies,
+        evaluate=evaluate_email,
+        reject=reply_to_rejected_email,
+        archive_many=archive_messages,
+        ledger=get_ledger(),
+    ))
+ 
+    # results come back in the original message order
+    already_done = 0
+    deferred = 0
+    for result in results:
+        idx, message, weather_advisory = result.index, result.message, result.advisory
+ 
+        if result.resumed_from == "archived":
+            # handled completely by an earlier run (ledger)
+            already_done += 1
+            continue
+ 
+        if result.error and not weather_advisory and not result.rejection:
+            # body fetch failed: not parsed, replied or archived; the next run retries it
+            deferred += 1
+            continue
+ 
+        if weather_advisory:
+            if save_files:
+                if not os.path.exists(OUTPUT_DIR):
+                    os.makedirs(OUTPUT_DIR, exist_ok=True)
+                    logger.info("Created output directory during processing: %s", OUTPUT_DIR)
+ 
+                subject_clean = sanitize_filename(message.get("subject", "No_Subject")[:30])
+                date_clean = message.get("receivedDateTime", "")[:10].replace("-", "_")
+                filename = f"{idx + 1:03d}_{date_clean}_{subject_clean}.json"
+                filepath = os.path.join(OUTPUT_DIR, filename)
+ 
+                with open(filepath, "w", encoding="utf-8") as f:
+                    json.dump(weather_advisory, f, indent=2, ensure_ascii=False)
+ 
+                station_count = len(weather_advisory["stations"])
+                logger.info(
+                    "Extracted %d station(s) – Saved to %s",
+                    station_count,
+                    filename,
+                )
+            else:
+                station_count = len(weather_advisory["stations"])
+                logger.info(
+                    "Extracted %d station(s) – (not saving to disk, save_files=False)",
+                    station_count,
+                )
+ 
+            successful_extractions += 1
+        else:
+            skipped_emails += 1
+ 
+    if MAIL_SYNC_MODE == "delta":
+        commit_new_messages(results)
+ 
+    logger.info("=" * 60)
+    logger.info(" EMAIL PROCESSING SUMMARY")
+    logger.info("=" * 60)
+    logger.info(" Total emails processed: %d", len(all_messages))
+    logger.info(" Successful extractions: %d", successful_extractions)
+    logger.info(" Skipped emails: %d", skipped_emails)
+    logger.info(" Already processed earlier: %d", already_done)
+    logger.info(" Left for the next run (body fetch failed): %d", deferred)
+    for endpoint, stats in graph_session.metrics.snapshot().items():
+        logger.info(" Graph %s: %s", endpoint, stats)
+    if save_files:
+        logger.info(" Files saved in: %s/", OUTPUT_DIR)
+    else:
+        logger.info(" No files saved (save_files=False).")
+ 
+    return len(all_messages), successful_extractions
+ 
+def main():
+    try:
+        save_files = IS_LOCAL_ENV
+        process_all_emails(save_files=save_files)
+    except requests.HTTPError as e:
+        logger.exception("HTTP Error: %s", e)
+    except Exception as e:
+        logger.exception("Error: %s", e)
+ 
+if __name__ == "__main__":
+    main()
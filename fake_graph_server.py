@@ -0,0 +1,128 @@
+"""
+Local fake Microsoft Graph server that replays recorded responses.
+
+A recording is a JSON-lines file, one response per line:
+    {"method": "GET", "url": "https://graph.microsoft.com/v1.0/users/.../messages/delta?...",
+     "status": 200, "body": {...}}
+
+Requests are matched on method + path + query (the host is ignored). When
+the same request was recorded several times, the responses are served in
+order and the last one repeats. Graph URLs inside the bodies (nextLink /
+deltaLink) are rewritten to point back at this server, so a delta round
+replays end to end.
+
+Recordings are made with `RecordingSession`, a drop-in for `requests` /
+`requests.Session` that forwards calls and appends each response to the file,
+or by running with GRAPH_RECORD=recording.jsonl (advisory_extraction.graph).
+GRAPH_REPLAY=recording.jsonl replays in-process instead, without this server.
+
+Usage:
+    python fake_graph_server.py recording.jsonl [port]
+    GRAPH_BASE=http://127.0.0.1:8765/v1.0 python 25NovEmailextaction.py
+"""
+import json
+import logging
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+import requests
+
+from advisory_extraction.graph import load_recording, recording_entry, request_key
+
+logger = logging.getLogger(__name__)
+
+GRAPH_ORIGIN = "https://graph.microsoft.com"
+
+
+class RecordingSession:
+    """Forwards requests to `session` and appends every response to `path` (JSON lines)."""
+
+    def __init__(self, path: str, session=None):
+        self.path = path
+        self.session = session or requests.Session()
+        self._lock = threading.Lock()
+
+    def request(self, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        resp = self.session.request(method, url, **kwargs)
+        entry = recording_entry(method, url, resp, time.perf_counter() - start)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return resp
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
+def make_handler(responses: Dict[Tuple[str, str, str], List[Dict]]):
+    served: Dict[Tuple[str, str, str], int] = defaultdict(int)
+    lock = threading.Lock()
+
+    class ReplayHandler(BaseHTTPRequestHandler):
+        def _replay(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                self.rfile.read(length)
+            key = request_key(self.command, self.path)
+            entries = responses.get(key)
+            if not entries:
+                logger.warning("No recorded response for %s %s", self.command, self.path)
+                self._send(404, {"error": {"code": "NotRecorded", "message": f"{self.command} {self.path}"}})
+                return
+            with lock:
+                index = min(served[key], len(entries) - 1)
+                served[key] += 1
+            entry = entries[index]
+            self._send(entry.get("status", 200), entry.get("body"), entry.get("headers"))
+
+        def _send(self, status: int, body, headers=None):
+            own_origin = f"http://{self.headers.get('Host') or '%s:%d' % self.server.server_address}"
+            if isinstance(body, (dict, list)):
+                payload = json.dumps(body).replace(GRAPH_ORIGIN, own_origin).encode("utf-8")
+                content_type = "application/json"
+            else:
+                payload = (body or "").encode("utf-8")
+                content_type = "text/plain"
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        do_GET = do_POST = do_PATCH = do_DELETE = _replay
+
+        def log_message(self, fmt, *args):
+            logger.debug(fmt, *args)
+
+    return ReplayHandler
+
+
+def serve(recording: str, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    """Start the replay server in a background thread and return it (call .shutdown() to stop)."""
+    server = ThreadingHTTPServer((host, port), make_handler(load_recording(recording)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info("Fake Graph server replaying %s on http://%s:%d/v1.0", recording, host, server.server_address[1])
+    return server
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 2:
+        print("Usage: python fake_graph_server.py <recording.jsonl> [port]")
+        sys.exit(1)
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8765
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(load_recording(sys.argv[1])))
+    print(f"Replaying {sys.argv[1]} on http://127.0.0.1:{port}/v1.0 (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,155 @@
+"""
+Offline benchmark of the advisory email pipeline over recorded Graph responses.
+
+Lists the Inbox with bodies inline, evaluates each email, replies to the
+rejected ones and archives everything through $batch - the run_pipeline
+path of email_extraction.py - against a GraphSession replaying a
+recording, so nothing goes over the network. Reports the wall time per
+email and the session's per-endpoint metrics.
+
+A recording comes from a real run with GRAPH_RECORD=recording.jsonl.
+Without one, a synthetic recording is generated from the advisory_golden/
+bodies (a multiple of 20 emails, so every archive $batch is full).
+GRAPH_REPLAY_LATENCY=1 replays the recorded latency, so the effect of
+concurrency and batching shows in the wall time.
+
+Usage:
+    python graph_replay_benchmark.py [recording.jsonl] [user_email]
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from advisory_extraction import (
+    GRAPH_BASE,
+    LIST_SELECT,
+    GraphSession,
+    evaluate_advisory,
+    list_messages,
+)
+from advisory_extraction.graph import GRAPH_BATCH_LIMIT
+from advisory_golden import GOLDEN_DIR, load_corpus
+from mail_fetch import InlineBodyFetcher
+from mail_pipeline import AdaptiveThrottle, ThrottledHttp, run_pipeline
+from mailbox_ops import MailboxOps
+
+DEFAULT_USER = "advisories@example.com"
+PAGE_SIZE = 50
+SYNTHETIC_EMAILS = 200
+# recorded latency of the synthetic responses, ms
+LATENCY = {"list": 250.0, "folder": 80.0, "move": 400.0, "reply": 150.0}
+
+
+def headers():
+    return {"Authorization": "Bearer replay"}
+
+
+def list_url(user_email, skip=0):
+    url = (
+        f"{GRAPH_BASE}/users/{user_email}/mailFolders/Inbox/messages"
+        f"?$top={PAGE_SIZE}"
+        "&$orderby=receivedDateTime desc"
+        f"&$select={LIST_SELECT},body"
+    )
+    return f"{url}&$skip={skip}" if skip else url
+
+
+def synthetic_recording(path, user_email, count=SYNTHETIC_EMAILS):
+    corpus = [(body, received) for _, _, body, received in load_corpus(GOLDEN_DIR)]
+    messages = []
+    for i in range(count):
+        body, received = corpus[i % len(corpus)]
+        message_id = f"AAMkADg{i:06d}" + "x" * 120
+        messages.append({
+            "id": message_id,
+            "internetMessageId": f"<advisory-{i:06d}@example.com>",
+            "subject": f"Weather advisory {i}",
+            "receivedDateTime": received,
+            "from": {"emailAddress": {"address": "metdesk@example.com"}},
+            "body": {"contentType": "html", "content": body},
+        })
+
+    entries = []
+    for skip in range(0, count, PAGE_SIZE):
+        page = {"value": messages[skip:skip + PAGE_SIZE]}
+        if skip + PAGE_SIZE < count:
+            page["@odata.nextLink"] = list_url(user_email, skip + PAGE_SIZE)
+        entries.append({"method": "GET", "url": list_url(user_email, skip), "status": 200,
+                        "body": page, "elapsed_ms": LATENCY["list"]})
+    entries.append({"method": "GET", "url": f"{GRAPH_BASE}/users/{user_email}/mailFolders/archive",
+                    "status": 200, "body": {"id": "archive-folder-id"}, "elapsed_ms": LATENCY["folder"]})
+    moves = {"responses": [{"id": str(i), "status": 201, "body": {"id": f"moved-{i}"}}
+                           for i in range(GRAPH_BATCH_LIMIT)]}
+    entries.append({"method": "POST", "url": f"{GRAPH_BASE}/$batch", "status": 200,
+                    "body": moves, "elapsed_ms": LATENCY["move"]})
+    for message in messages:
+        entries.append({"method": "POST", "url": f"{GRAPH_BASE}/users/{user_email}/messages/{message['id']}/reply",
+                        "status": 202, "body": "", "elapsed_ms": LATENCY["reply"]})
+
+    with open(path, "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    return count
+
+
+def evaluate(message, html):
+    stations, rejection = evaluate_advisory(html, message.get("receivedDateTime"))
+    if rejection:
+        return None, rejection
+    return {"createdAt": message.get("receivedDateTime"), "stations": stations}, None
+
+
+def main():
+    recording = sys.argv[1] if len(sys.argv) > 1 else None
+    user_email = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_USER
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("advisory_extraction").setLevel(logging.ERROR)
+
+    if not recording:
+        fd, recording = tempfile.mkstemp(suffix=".jsonl")
+        os.close(fd)
+        count = synthetic_recording(recording, user_email)
+        print(f"Synthetic recording: {count} email(s) from {GOLDEN_DIR} -> {recording}")
+
+    session = GraphSession(max_retries=0, replay=recording)
+    http = ThrottledHttp(AdaptiveThrottle(), session=session)
+    mailbox = MailboxOps(user_email, headers, http=http)
+
+    def reject(message, rejection):
+        http.post(f"{GRAPH_BASE}/users/{user_email}/messages/{message['id']}/reply",
+                  headers=headers(), json={"comment": json.dumps(rejection)})
+
+    async def publish(message, advisory):
+        return True
+
+    start = time.perf_counter()
+    messages = list_messages(user_email, headers, folder="Inbox", page_size=PAGE_SIZE,
+                             select=f"{LIST_SELECT},body", http=http)
+    results = asyncio.run(run_pipeline(
+        messages,
+        fetch_bodies=InlineBodyFetcher().fetch_bodies,
+        evaluate=evaluate,
+        reject=reject,
+        publish=publish,
+        archive_many=mailbox.move_many,
+    ))
+    seconds = time.perf_counter() - start
+
+    if not results:
+        print(f"No messages replayed from {recording}")
+        return
+    accepted = sum(1 for r in results if r.advisory)
+    archived = sum(1 for r in results if r.archived)
+    print(f"Emails: {len(results)} | accepted: {accepted} | rejected: {len(results) - accepted} | archived: {archived}")
+    print(f"Wall time: {seconds:.2f}s ({seconds * 1000 / len(results):.2f} ms/email)")
+    print("Graph requests:")
+    for endpoint, stats in sorted(session.metrics.snapshot().items()):
+        print(f"  {endpoint:<22} {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Chat history store for the weather gateway.
+
+One Redis list per user + session holds JSON-encoded {"role", "content"}
+messages. Every turn costs exactly one round trip to read (a bounded
+`LRANGE key -N -1`) and one to write (RPUSH + LTRIM + EXPIRE in a single
+MULTI/EXEC pipeline), on the asyncio Redis client so the event loop is
+never blocked.
+
+`InMemoryHistoryStore` has the same interface for local runs and tests
+(HISTORY_BACKEND=memory).
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(role: str, content: str) -> str:
+    return json.dumps({"role": role, "content": content}, ensure_ascii=False)
+
+
+def _decode_all(raw_msgs) -> List[Dict]:
+    messages = []
+    for raw in raw_msgs:
+        try:
+            messages.append(json.loads(raw))
+        except Exception:
+            continue
+    return messages
+
+
+class RedisHistoryStore:
+    """History lists on a `redis.asyncio.Redis` client (decode_responses=True)."""
+
+    def __init__(self, client, ttl_seconds: int, max_length: int):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.max_length = max_length
+
+    async def ping(self) -> bool:
+        return await self.client.ping()
+
+    async def load(self, key: str, max_messages: int) -> List[Dict]:
+        """Last `max_messages` messages in one LRANGE (negative indexes, no LLEN)."""
+        if max_messages <= 0:
+            return []
+        raw_msgs = await self.client.lrange(key, -max_messages, -1)
+        return _decode_all(raw_msgs)
+
+    async def append(self, key: str, entries: List[Tuple[str, str]]) -> None:
+        """Append messages, cap the list and refresh the TTL atomically in one round trip."""
+        pipe = self.client.pipeline(transaction=True)
+        pipe.rpush(key, *(_encode(role, content) for role, content in entries))
+        pipe.ltrim(key, -self.max_length, -1)
+        pipe.expire(key, self.ttl_seconds)
+        await pipe.execute()
+
+    async def trim(self, key: str, keep_recent: int) -> None:
+        if keep_recent <= 0:
+            await self.client.delete(key)
+            return
+        await self.client.ltrim(key, -keep_recent, -1)
+
+    async def delete(self, key: str) -> int:
+        return await self.client.delete(key)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+class InMemoryHistoryStore:
+    """Process-local store with the same semantics (bounded lists + TTL)."""
+
+    def __init__(self, ttl_seconds: int, max_length: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_length = max_length
+        self._lists: Dict[str, List[str]] = {}
+        self._expires_at: Dict[str, float] = {}
+        self._lock = asyncio.Lock()
+
+    def _live(self, key: str) -> List[str]:
+        expires_at = self._expires_at.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._lists.pop(key, None)
+            self._expires_at.pop(key, None)
+        return self._lists.get(key, [])
+
+    async def ping(self) -> bool:
+        return True
+
+    async def load(self, key: str, max_messages: int) -> List[Dict]:
+        if max_messages <= 0:
+            return []
+        async with self._lock:
+            return _decode_all(self._live(key)[-max_messages:])
+
+    async def append(self, key: str, entries: List[Tuple[str, str]]) -> None:
+        async with self._lock:
+            items = self._live(key) + [_encode(role, content) for role, content in entries]
+            self._lists[key] = items[-self.max_length:]
+            self._expires_at[key] = time.monotonic() + self.ttl_seconds
+
+    async def trim(self, key: str, keep_recent: int) -> None:
+        async with self._lock:
+            if key in self._lists:
+                self._lists[key] = self._live(key)[-keep_recent:] if keep_recent > 0 else []
+
+    async def delete(self, key: str) -> int:
+        async with self._lock:
+            self._expires_at.pop(key, None)
+            return 1 if self._lists.pop(key, None) is not None else 0
+
+    async def close(self) -> None:
+        return None
@@ -1,10 +1,11 @@
-from typing import Any, List, Dict, Optional
+from typing import Any, List, Optional
 import asyncio
 from datetime import datetime, timedelta
-from motor.motor_asyncio import AsyncIOMotorClient
+from contextlib import asynccontextmanager
 import json
 from dotenv import load_dotenv
 import os, time, httpx
+import uvicorn
 from fastmcp import FastMCP, Context
 from fastmcp.server.dependencies import get_access_token, AccessToken, get_context
 from fastmcp.server.auth.providers.jwt import JWTVerifier
@@ -12,7 +13,17 @@ from fastmcp.server.middleware import Middleware, MiddlewareContext
 from starlette.requests import Request
 from starlette.responses import JSONResponse, PlainTextResponse
 from toon import encode
-from openai import AzureOpenAI
+from openai import AsyncAzureOpenAI
+from metar_normalize import ensure_metar_indexes, normalize_loop, numeric_range, cloud_query, fir_query, NUMERIC_PREFIX
+from metar_timeseries import METAR_STORAGE, COLLECTION_METAR_TS, ensure_timeseries_collection, timeseries_sync_loop
+from metar_latest import get_current, ensure_latest_indexes, watch_latest, COLLECTION_METAR_LATEST, METAR_LATEST_WATCH
+from metar_stats import get_metar_summary, summary_refresh_loop
+from metar_format import format_metar_results, OUTPUT_FORMATS
+from metar_aggregate import run_bounded_aggregate, AggregationPolicyError, AGGREGATE_MAX_TIME_MS
+from pymongo.errors import ExecutionTimeout
+from chart_generator import ChartGenerator
+from metar_mongo import PoolMetrics, create_mongo_client, prewarm
+from metar_ingest import ingest_batch, load_station_info, report_station
 
 from fastmcp.server.auth import TokenVerifier, AccessToken as AuthAccessToken
 import base64, json, time
@@ -43,6 +54,12 @@ logger = logging.getLogger(__name__)
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
 DATABASE_NAME = os.getenv("DATABASE_NAME", "metar_data")
 COLLECTION_METAR = os.getenv("COLLECTION_METAR", "metar_data")
+# the regular collection the external METAR writer inserts into
+COLLECTION_METAR_SOURCE = COLLECTION_METAR
+# METAR_STORAGE=timeseries -> tools read the time-series history collection,
+# kept in step with the source by timeseries_sync_loop
+if METAR_STORAGE == "timeseries":
+    COLLECTION_METAR = COLLECTION_METAR_TS
 
 # ------------------- Config (server-only secrets) -------------------
 TENANT_ID = os.getenv("TENANT_ID")
@@ -205,11 +222,18 @@ mcp = FastMCP(name="metar-weather", auth=auth)
 mcp.add_middleware(rate_limiter)
 mcp.add_middleware(ListingFilterMiddleware())
 
-# Global MongoDB client
+# Global MongoDB client (created in the ASGI lifespan)
 client = None
 db = None
-
-llm = AzureOpenAI(
+pool_metrics = PoolMetrics()
+summary_refresher = None
+latest_watcher = None
+normalizer = None
+timeseries_syncer = None
+# set while watch_latest keeps the latest view complete and current
+latest_view_live = asyncio.Event()
+
+llm = AsyncAzureOpenAI(
     api_key=os.getenv("subscription_key"),
     api_version=os.getenv("api_version"),
     azure_endpoint=os.getenv("endpoint"),
@@ -255,52 +279,64 @@ graph_msg = """"
             
             """
 
+chart_generator = ChartGenerator(llm, graph_msg)
+
+async def start_mongodb():
+    """Create and warm the shared MongoDB client, ensure collections/indexes, start background tasks."""
+    global client, db, summary_refresher, latest_watcher, normalizer, timeseries_syncer
+    client = create_mongo_client(MONGODB_URL, pool_metrics)
+    db = client[DATABASE_NAME]
+    try:
+        await prewarm(client)
+    except Exception as e:
+        # server still starts; tools report errors until MongoDB is reachable
+        logger.warning(f"Could not warm MongoDB connection pool: {e}")
+    try:
+        if METAR_STORAGE == "timeseries":
+            await ensure_timeseries_collection(db, COLLECTION_METAR)
+        await ensure_metar_indexes(db[COLLECTION_METAR])
+    except Exception as e:
+        logger.warning(f"Could not ensure METAR indexes: {e}")
+    try:
+        await ensure_latest_indexes(db[COLLECTION_METAR_LATEST])
+    except Exception as e:
+        logger.warning(f"Could not ensure latest-view indexes: {e}")
+    # keep the statistics summary document fresh in the background
+    summary_refresher = asyncio.create_task(summary_refresh_loop(db, COLLECTION_METAR))
+    # reports from the external writer have no metar.numeric / token fields until normalised
+    if METAR_STORAGE != "timeseries":
+        normalizer = asyncio.create_task(normalize_loop(db[COLLECTION_METAR]))
+    else:
+        # copies (and normalises) the external writer's reports into the time-series collection
+        timeseries_syncer = asyncio.create_task(timeseries_sync_loop(db, COLLECTION_METAR_SOURCE, COLLECTION_METAR))
+    if METAR_LATEST_WATCH:
+        # time-series collections have no change streams: follow the regular source instead
+        latest_watcher = asyncio.create_task(watch_latest(db, COLLECTION_METAR_SOURCE, latest_view_live))
+
+
+async def stop_mongodb():
+    """Stop background tasks and close the MongoDB client."""
+    global client, db, summary_refresher, latest_watcher, normalizer, timeseries_syncer
+    for task in (summary_refresher, latest_watcher, normalizer, timeseries_syncer):
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+    summary_refresher = latest_watcher = normalizer = timeseries_syncer = None
+    if client is not None:
+        client.close()
+        logger.info("MongoDB client closed")
+    client = db = None
+
+
 async def get_mongodb_client():
-    """Get MongoDB client connection."""
-    global client, db
+    """Get the shared MongoDB client connection."""
     if client is None:
-        client = AsyncIOMotorClient(MONGODB_URL)
-        db = client[DATABASE_NAME]
+        raise RuntimeError("MongoDB client is not initialised (server lifespan not started)")
     return client, db
 
-def format_metar_data(metar_doc: Dict) -> str:
-    """Format METAR data into a readable string."""
-    station = metar_doc.get('stationICAO', 'Unknown')
-    iata = metar_doc.get('stationIATA', 'N/A')
-    processed_timestamp = metar_doc.get('processed_timestamp', 'Unknown')
-    
-    result = f"🛩️  Station: {station}"
-    if iata:
-        result += f" ({iata})"
-    result += f"\n Last Updated: {processed_timestamp}\n"
-    
-    if metar_doc.get('hasMetarData') and 'metar' in metar_doc:
-        metar = metar_doc['metar']
-        raw_data = metar.get('rawData', 'N/A')
-        result += f" Raw METAR: {raw_data}\n"
-        
-        if 'decodedData' in metar and 'observation' in metar['decodedData']:
-            obs = metar['decodedData']['observation']
-            result += f"\n Weather Conditions:\n"
-            result += f"   Temperature: {obs.get('airTemperature', 'N/A')}\n"
-            result += f"   Dewpoint: {obs.get('dewpointTemperature', 'N/A')}\n"
-            result += f"   Wind: {obs.get('windSpeed', 'N/A')} from {obs.get('windDirection', 'N/A')}\n"
-            result += f"   Visibility: {obs.get('horizontalVisibility', 'N/A')}\n"
-            result += f"   Pressure: {obs.get('observedQNH', 'N/A')}\n"
-            
-            if obs.get('cloudLayers'):
-                result += f"   Clouds: {', '.join(obs['cloudLayers'])}\n"
-            
-            if obs.get('weatherConditions'):
-                result += f"   Weather: {obs['weatherConditions']}\n"
-    
-    if metar_doc.get('hasTaforData') and 'tafor' in metar_doc:
-        tafor = metar_doc['tafor']
-        raw_taf = tafor.get('rawData', 'N/A')
-        result += f"\n📊 TAF: {raw_taf}\n"
-    
-    return result
-
 # ------------------- Tools (protected by JWTVerifier) ---------------
 @mcp.tool(tags=["WeatherDataRead"])
 async def search_metar_data(
@@ -318,7 +354,8 @@ async def search_metar_data(
     cloud_type: str = None,
     fir_region: str = None,
     hours_back: int = None,
-    limit: int = 10
+    limit: int = 10,
+    output_format: str = "table"
 ) -> str:
     """Generic search for METAR data with multiple optional filters.
 
@@ -338,6 +375,7 @@ async def search_metar_data(
         fir_region: Filter by FIR region (e.g., 'Chennai', 'Mumbai')
         hours_back: Look back N hours from now
         limit: Maximum results to return (set default as: 10, max: 50)
+        output_format: 'table' (compact TOON rows, default) or 'text' (verbose per-report blocks)
     """
     try:
         _, db = await get_mongodb_client()
@@ -353,7 +391,7 @@ async def search_metar_data(
         
         # FIR region filter
         if fir_region:
-            query["metar.firRegion"] = {"$regex": fir_region, "$options": "i"}
+            query.setdefault("$and", []).append(fir_query(fir_region))
         
         # Time filter
         if hours_back:
@@ -364,45 +402,23 @@ async def search_metar_data(
         if weather_condition:
             query["metar.decodedData.observation.weatherConditions"] = weather_condition
         
-        # Cloud type filter (search in raw METAR data)
+        # Cloud type filter (tokenised cloud groups from raw METAR data)
         if cloud_type:
-            query["metar.rawData"] = {"$regex": cloud_type, "$options": "i"}
-        
-        # Temperature filters
-        if temperature_min is not None or temperature_max is not None:
-            temp_query = {}
-            if temperature_min is not None:
-                temp_query["$gte"] = str(temperature_min)
-            if temperature_max is not None:
-                temp_query["$lte"] = str(temperature_max)
-            query["metar.decodedData.observation.airTemperature"] = temp_query
-        
-        # Visibility filters
-        if visibility_min is not None or visibility_max is not None:
-            vis_query = {}
-            if visibility_min is not None:
-                vis_query["$gte"] = str(visibility_min)
-            if visibility_max is not None:
-                vis_query["$lte"] = str(visibility_max)
-            query["metar.decodedData.observation.horizontalVisibility"] = vis_query
-        
-        # Wind speed filters
-        if wind_speed_min is not None or wind_speed_max is not None:
-            wind_query = {}
-            if wind_speed_min is not None:
-                wind_query["$gte"] = str(wind_speed_min)
-            if wind_speed_max is not None:
-                wind_query["$lte"] = str(wind_speed_max)
-            query["metar.decodedData.observation.windSpeed"] = wind_query
-        
-        # Pressure filters
-        if pressure_min is not None or pressure_max is not None:
-            pressure_query = {}
-            if pressure_min is not None:
-                pressure_query["$gte"] = str(pressure_min)
-            if pressure_max is not None:
-                pressure_query["$lte"] = str(pressure_max)
-            query["metar.decodedData.observation.observedQNH"] = pressure_query
+            query.setdefault("$and", []).append(cloud_query(cloud_type))
+        
+        # Numeric range filters on metar.numeric (numbers written at ingest, or by the
+        # background normalize_loop for other writers' reports, so comparisons are
+        # numeric and can use the numeric_*_timestamp indexes)
+        numeric_filters = {
+            "airTemperature": (temperature_min, temperature_max),
+            "horizontalVisibility": (visibility_min, visibility_max),
+            "windSpeed": (wind_speed_min, wind_speed_max),
+            "observedQNH": (pressure_min, pressure_max),
+        }
+        for field, (min_value, max_value) in numeric_filters.items():
+            condition = numeric_range(min_value, max_value)
+            if condition:
+                query[f"{NUMERIC_PREFIX}.{field}"] = condition
         
         # Limit results
         limit = min(limit, 50)
@@ -432,40 +448,74 @@ async def search_metar_data(
             return f"No METAR data found with filters: {', '.join(filters)}"
         
         # Format results
-        result = f"🔍 METAR Search Results ({len(results)} documents found):\n"
-        applied_filters = [f"{k}: {v}" for k, v in locals().items() if v is not None and k not in ['db', 'cursor', 'results', 'limit', 'hours_back', 'query']]
+        header = f"🔍 METAR Search Results ({len(results)} documents found):\n"
+        filter_values = {
+            "station_icao": station_icao,
+            "station_iata": station_iata,
+            "weather_condition": weather_condition,
+            "temperature_min": temperature_min,
+            "temperature_max": temperature_max,
+            "visibility_min": visibility_min,
+            "visibility_max": visibility_max,
+            "wind_speed_min": wind_speed_min,
+            "wind_speed_max": wind_speed_max,
+            "pressure_min": pressure_min,
+            "pressure_max": pressure_max,
+            "cloud_type": cloud_type,
+            "fir_region": fir_region,
+        }
+        applied_filters = [f"{k}: {v}" for k, v in filter_values.items() if v is not None]
         if applied_filters:
-            result += f"Filters: {', '.join(applied_filters)}\n"
-        result += "=" * 80 + "\n\n"
+            header += f"Filters: {', '.join(applied_filters)}\n"
         
-        for i, doc in enumerate(results, 1):
-            result += f"--- Result {i} ---\n"
-            result += format_metar_data(doc)
-            result += "\n"
-        
-        return result
+        return format_metar_results(results, header, output_format if output_format in OUTPUT_FORMATS else "table")
         
     except Exception as e:
         logger.error(f"Error in search_metar_data: {e}", exc_info=True)
         return f"Error executing search: {str(e)}"
 
 @mcp.tool(tags=["WeatherDataRead"])
-async def list_available_stations() -> str:
-    """List all available weather stations with their codes."""
+async def get_current_weather(
+    station_icao: str = None,
+    station_iata: str = None,
+    output_format: str = "table"
+) -> str:
+    """Current (latest) METAR for one station, or for all stations when no code is given.
+
+    Args:
+        station_icao: ICAO code (e.g., 'VIDP', 'VABB')
+        station_iata: IATA code (e.g., 'DEL', 'BOM')
+        output_format: 'table' (compact TOON rows, default) or 'text' (verbose per-report blocks)
+    """
     try:
         _, db = await get_mongodb_client()
         
-        # Get unique ICAO codes
-        icao_codes = await db[COLLECTION_METAR].distinct("stationICAO")
-        icao_codes.sort()
+        # point read on the latest-per-station view while the watcher keeps it live,
+        # indexed history reads otherwise
+        results = await get_current(db, COLLECTION_METAR, station_icao, station_iata, live=latest_view_live.is_set())
         
-        # Get unique IATA codes (non-null)
-        iata_codes = await db[COLLECTION_METAR].distinct("stationIATA")
-        iata_codes = [code for code in iata_codes if code is not None]
-        iata_codes.sort()
+        if not results:
+            station = station_icao or station_iata
+            return f"No current METAR found for {station}" if station else "No current METAR data available"
+        
+        header = f"🌤️ Current METAR ({len(results)} station(s)):\n"
+        return format_metar_results(results, header, output_format if output_format in OUTPUT_FORMATS else "table")
+        
+    except Exception as e:
+        logger.error(f"Error in get_current_weather: {e}", exc_info=True)
+        return f"Error retrieving current weather: {str(e)}"
+
+@mcp.tool(tags=["WeatherDataRead"])
+async def list_available_stations() -> str:
+    """List all available weather stations with their codes."""
+    try:
+        _, db = await get_mongodb_client()
         
-        # Get station count
-        total_stations = await db[COLLECTION_METAR].count_documents({})
+        # Codes and counts come from the cached dataset summary (single point read)
+        summary = await get_metar_summary(db, COLLECTION_METAR)
+        icao_codes = summary["icao_codes"]
+        iata_codes = summary["iata_codes"]
+        total_stations = summary["total"]
         
         result = f"📡 Available Weather Stations ({total_stations} total reports)\n"
         result += "=" * 50 + "\n\n"
@@ -502,20 +552,15 @@ async def get_metar_statistics() -> str:
     try:
         _, db = await get_mongodb_client()
         
-        # Get basic counts
-        total_metar = await db[COLLECTION_METAR].count_documents({})
-        
-        # Get unique station counts
-        unique_icao = len(await db[COLLECTION_METAR].distinct("stationICAO"))
-        unique_iata = len([code for code in await db[COLLECTION_METAR].distinct("stationIATA") if code is not None])
-        
-        # Get date range
-        earliest = await db[COLLECTION_METAR].find({}, {"metar.updatedTime": 1}).sort("metar.updatedTime", 1).limit(1).to_list(1)
-        latest = await db[COLLECTION_METAR].find({}, {"metar.updatedTime": 1}).sort("metar.updatedTime", -1).limit(1).to_list(1)
-        
-        # Get data availability
-        with_metar = await db[COLLECTION_METAR].count_documents({"hasMetarData": True})
-        with_taf = await db[COLLECTION_METAR].count_documents({"hasTaforData": True})
+        # All statistics come from one $facet pass, cached in the summary document
+        summary = await get_metar_summary(db, COLLECTION_METAR)
+        total_metar = summary["total"]
+        unique_icao = len(summary["icao_codes"])
+        unique_iata = len(summary["iata_codes"])
+        earliest = summary["earliest"]
+        latest = summary["latest"]
+        with_metar = summary["with_metar"]
+        with_taf = summary["with_taf"]
         
         result = f"📊 METAR Database Statistics\n"
         result += "=" * 40 + "\n\n"
@@ -529,13 +574,13 @@ async def get_metar_statistics() -> str:
         
         result += f"📅 Data Range:\n"
         if earliest:
-            result += f"   Earliest: {earliest[0]['metar']['updatedTime']}\n"
+            result += f"   Earliest: {earliest}\n"
         if latest:
-            result += f"   Latest: {latest[0]['metar']['updatedTime']}\n\n"
+            result += f"   Latest: {latest}\n\n"
         
         result += f"✅ Availability:\n"
-        result += f"   Reports with METAR: {with_metar:,} ({with_metar/total_metar*100:.1f}%)\n"
-        result += f"   Reports with TAF: {with_taf:,} ({with_taf/total_metar*100:.1f}%)\n"
+        result += f"   Reports with METAR: {with_metar:,} ({with_metar/max(total_metar, 1)*100:.1f}%)\n"
+        result += f"   Reports with TAF: {with_taf:,} ({with_taf/max(total_metar, 1)*100:.1f}%)\n"
         
         return result
         
@@ -544,8 +589,14 @@ async def get_metar_statistics() -> str:
         return f"Error retrieving statistics: {str(e)}"
 
 @mcp.tool(tags=["WeatherDataRead"])
-async def raw_mongodb_query_find(query_json: str, limit: int = 10) -> str:
-    """Execute a raw MongoDB query for find queries against the METAR database."""
+async def raw_mongodb_query_find(query_json: str, limit: int = 10, output_format: str = "table") -> str:
+    """Execute a raw MongoDB query for find queries against the METAR database.
+
+    Args:
+        query_json: MongoDB filter as JSON
+        limit: Maximum results to return (max: 50)
+        output_format: 'table' (compact TOON rows, default) or 'text' (verbose per-report blocks)
+    """
     try:
         _, db = await get_mongodb_client()
         
@@ -567,16 +618,10 @@ async def raw_mongodb_query_find(query_json: str, limit: int = 10) -> str:
         if not results:
             return f"No documents found matching query: {query_json}"
                 
-        result = f"🔍 Raw MongoDB Query Results ({len(results)} documents found):\n"
-        result += f"Query: {query_json}\n"
-        result += "=" * 60 + "\n\n"
+        header = f"🔍 Raw MongoDB Query Results ({len(results)} documents found):\n"
+        header += f"Query: {query_json}\n"
         
-        for i, doc in enumerate(results, 1):
-            result += f"--- Result {i} ---\n"
-            result += format_metar_data(doc)
-            result += "\n"
-        
-        return result
+        return format_metar_results(results, header, output_format if output_format in OUTPUT_FORMATS else "table")
         
     except Exception as e:
         logger.error(f"Error in raw_mongodb_query_find: {e}", exc_info=True)
@@ -584,7 +629,8 @@ async def raw_mongodb_query_find(query_json: str, limit: int = 10) -> str:
 
 @mcp.tool(tags=["WeatherDataRead"])
 async def raw_mongodb_query_aggregate(query_json: str, limit: int = 10) -> str:
-    """Execute a raw MongoDB aggregate query against the METAR database."""
+    """Execute a raw MongoDB aggregate query against the METAR database.
+    The pipeline must start with a $match on an indexed field (stationICAO, stationIATA, timestamp, ...)."""
     try:
         _, db = await get_mongodb_client()
         
@@ -598,13 +644,23 @@ async def raw_mongodb_query_aggregate(query_json: str, limit: int = 10) -> str:
         limit = min(limit, 50)
         
         logger.info(f"Executing raw MongoDB query: {query}")
-        cursor = db[COLLECTION_METAR].aggregate(query)
-        # cursor = db[COLLECTION_METAR].find(query).sort("metar.updatedTime", -1).limit(limit)
-
-        results = await cursor.to_list(length=limit)
+        # policy-checked: $limit appended, maxTimeMS enforced, unindexed scans rejected
+        try:
+            results, cost = await run_bounded_aggregate(db[COLLECTION_METAR], query, limit)
+        except AggregationPolicyError as e:
+            return f"Aggregation rejected: {str(e)}"
+        except ExecutionTimeout:
+            return f"Aggregation exceeded the {AGGREGATE_MAX_TIME_MS} ms time limit. Narrow the $match (station / timestamp) and retry."
+        
+        cost_line = (
+            f"\n\npipeline_cost: elapsed_ms={cost['elapsed_ms']} returned={cost['returned']} "
+            f"stages={'>'.join(cost['stages'])}"
+        )
+        if cost["rewrites"]:
+            cost_line += f" rewrites={'; '.join(cost['rewrites'])}"
         
         if not results:
-            return f"No documents found matching query: {query_json}"
+            return f"No documents found matching query: {query_json}{cost_line}"
         
         # Format results
         logger.debug(f"Aggregate query results: {results}")
@@ -619,7 +675,7 @@ async def raw_mongodb_query_aggregate(query_json: str, limit: int = 10) -> str:
         #     result += format_metar_data(doc)
         #     result += "\n"
         
-        return toon_result
+        return toon_result + cost_line
         
     except Exception as e:
         logger.error(f"Error in raw_mongodb_query_aggregate: {e}", exc_info=True)
@@ -633,21 +689,34 @@ async def table_and_graph_JSON_generater(response_data:str) -> str:
         response_data: response from LLM
     """
 
-    prompt = response_data
-    messages = [
-                {"role": "system", "content": graph_msg},
-                {"role": "user", "content": "The User prompt is as follows:\n" + prompt}
-            ]
-    # Request LLM analysis
-    response = llm.chat.completions.create(
-                    model=os.getenv("deployment"),
-                    messages=messages,
-                )
-    result = response.choices[0].message.content
+    result = await chart_generator.generate(response_data)
     logger.info(f"Generated Table and Graph JSON: {result}")
     return result
 
 
+@mcp.tool(tags=["WeatherDataWrite"])
+async def bulk_add_metar_data(reports: str) -> str:
+    """Ingest a batch of raw METAR/TAF reports into the METAR database.
+
+    Args:
+        reports: Raw reports, one per line (e.g. "VEPT 021330Z 08009KT 4500 HZ SCT018 BKN100 30/26 Q1001 NOSIG"); TAF lines start with "TAF"
+    """
+    try:
+        _, db = await get_mongodb_client()
+        lines = reports.splitlines()
+        stations = {report_station(line) for line in lines} - {None}
+        station_info = await load_station_info(db, COLLECTION_METAR, stations)
+        counts = await ingest_batch(db, COLLECTION_METAR, lines, station_info)
+        return (
+            f"✅ Ingested {counts['decoded']} of {counts['received']} reports "
+            f"({counts['upserted']} new, {counts['matched']} already stored, {counts['rejected']} rejected; "
+            f"{counts['latest_updated']} stations updated in the latest view)"
+        )
+    except Exception as e:
+        logger.error(f"Error in bulk_add_metar_data: {e}", exc_info=True)
+        return f"💥 Error ingesting METAR data: {str(e)}"
+
+
 # @mcp.tool(tags=["WeatherDataWrite"])
 # async def add_metar_data(metar_raw: str, email: str = "system@occhub.com") -> str:
 #     """Add new METAR data to the external weather service.
@@ -718,10 +787,18 @@ async def ping() -> str:
 @mcp.custom_route("/health", methods=["GET"])
 async def health_check_route(request: Request):
     """Health check endpoint - no authentication required."""
+    mongodb = {"connected": False, "pool": pool_metrics.snapshot()}
+    if client is not None:
+        try:
+            await asyncio.wait_for(client.admin.command("ping"), timeout=2)
+            mongodb["connected"] = True
+        except Exception as e:
+            mongodb["error"] = str(e)
     return JSONResponse({
-        "status": "healthy",
+        "status": "healthy" if mongodb["connected"] else "degraded",
         "timestamp": datetime.now().isoformat(),
         "server": "metar-weather-mcp",
+        "mongodb": mongodb,
         "azure_config": {
             "auth_enabled": True
         }
@@ -742,18 +819,37 @@ async def root(request: Request):
         "auth_method": "Direct Azure AD authentication - clients authenticate directly with Azure AD"
     })
 
+# ------------------- ASGI app ---------------------------------------
+mcp_app = mcp.http_app(transport="streamable-http")
+_mcp_lifespan = mcp_app.router.lifespan_context
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await start_mongodb()
+    try:
+        # the MCP session manager has its own lifespan that must run too
+        async with _mcp_lifespan(app):
+            yield
+    finally:
+        await stop_mongodb()
+
+mcp_app.router.lifespan_context = lifespan
+app = mcp_app  # uvicorn http_app:app
+
+
 if __name__ == "__main__":
     # Initialize and run the server
     logger.info("METAR MCP Server with Azure Authentication starting...")
     logger.info(f"MongoDB URL: {MONGODB_URL}")
     logger.info(f"Database: {DATABASE_NAME}")
-    logger.info(f"Collection: {COLLECTION_METAR}")
+    logger.info(f"Collection: {COLLECTION_METAR} (storage: {METAR_STORAGE})")
     logger.info(f"Azure Tenant ID: {TENANT_ID}")
     logger.info(f"Azure App ID: {APP_ID}")
     logger.info(f"Port: {PORT}")
     logger.info("Server ready! Waiting for HTTP requests...")
     
 
-    # mcp.run(transport="streamable-http", host="0.0.0.0", port=PORT)
+    # uvicorn.run(app, host="0.0.0.0", port=PORT)
 
-    mcp.run(transport="streamable-http", host="127.0.0.1", port=PORT)
+    uvicorn.run(app, host="127.0.0.1", port=PORT)
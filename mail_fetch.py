@@ -0,0 +1,154 @@
+"""
+Message body fetching for the advisory pipeline.
+
+The pipeline used to list messages and then GET each body separately. A
+`BodyFetcher` returns the HTML bodies for a whole list of messages instead:
+
+  - InlineBodyFetcher: `body` is requested in the listing's $select, so the
+    bodies arrive with the list and no extra request is made
+  - BatchBodyFetcher:  bodies are fetched through Graph JSON $batch, up to
+    20 per request (for listings that can't carry bodies)
+  - MockBodyFetcher:   bodies from a dict / directory, for offline runs
+
+All return {message_id: html}. A message whose body couldn't be fetched
+(Graph error, throttled $batch item) is left out, so the pipeline can tell a
+failed read from an empty email and retry it on the next run.
+"""
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Optional
+
+import requests
+
+from advisory_extraction.graph import GRAPH_BASE, GRAPH_BATCH_LIMIT, HTML_BODY_PREFER
+
+logger = logging.getLogger(__name__)
+
+
+def inline_body(message: Dict) -> Optional[str]:
+    """Body HTML carried in a listed message, or None if the listing didn't include it."""
+    body = message.get("body")
+    if isinstance(body, dict) and "content" in body:
+        return body.get("content") or ""
+    return None
+
+
+class BodyFetcher(ABC):
+    # extra fields the message listing must $select for this fetcher
+    list_select: str = ""
+
+    @abstractmethod
+    def fetch_bodies(self, messages: Iterable[Dict]) -> Dict[str, str]:
+        """{message_id: html} for the messages whose body could be read."""
+
+
+class InlineBodyFetcher(BodyFetcher):
+    """Bodies come with the listing; falls back to `fetch_one` for messages listed without one."""
+
+    list_select = "body"
+
+    def __init__(self, fetch_one: Optional[Callable[[str], Optional[str]]] = None):
+        self.fetch_one = fetch_one
+
+    def fetch_bodies(self, messages: Iterable[Dict]) -> Dict[str, str]:
+        bodies = {}
+        for message in messages:
+            html = inline_body(message)
+            if html is None and self.fetch_one:
+                html = self.fetch_one(message["id"])
+            if html is None:
+                # fetch_one failed (or there is none): left out for the pipeline to retry
+                continue
+            bodies[message["id"]] = html
+        return bodies
+
+
+class BatchBodyFetcher(BodyFetcher):
+    """Bodies through POST /$batch, GRAPH_BATCH_LIMIT messages per request."""
+
+    def __init__(
+        self,
+        user_email: str,
+        headers_fn: Callable[[], Dict[str, str]],
+        http=requests,
+        base: str = GRAPH_BASE,
+        timeout: float = 60,
+    ):
+        self.user_email = user_email
+        self.headers_fn = headers_fn
+        self.http = http
+        self.base = base.rstrip("/")
+        self.timeout = timeout
+
+    def _batch_request(self, message_ids: List[str]) -> Dict[str, str]:
+        payload = {
+            "requests": [
+                {
+                    "id": str(i),
+                    "method": "GET",
+                    "url": f"/users/{self.user_email}/messages/{message_id}?$select=body",
+                    "headers": {"Prefer": HTML_BODY_PREFER},
+                }
+                for i, message_id in enumerate(message_ids)
+            ]
+        }
+        headers = dict(self.headers_fn())
+        headers["Content-Type"] = "application/json"
+        resp = self.http.post(f"{self.base}/$batch", headers=headers, json=payload, timeout=self.timeout)
+        if resp.status_code != 200:
+            logger.error("Body $batch failed: %s | Response: %s", resp.status_code, resp.text)
+            return {}
+
+        bodies = {}
+        for item in resp.json().get("responses", []):
+            message_id = message_ids[int(item["id"])]
+            if item.get("status") == 200:
+                bodies[message_id] = ((item.get("body") or {}).get("body") or {}).get("content", "")
+            else:
+                logger.error("Body fetch for %s inside $batch failed: %s", message_id, item.get("status"))
+        return bodies
+
+    def fetch_bodies(self, messages: Iterable[Dict]) -> Dict[str, str]:
+        message_ids = [m["id"] for m in messages]
+        bodies: Dict[str, str] = {}
+        for start in range(0, len(message_ids), GRAPH_BATCH_LIMIT):
+            chunk = message_ids[start:start + GRAPH_BATCH_LIMIT]
+            bodies.update(self._batch_request(chunk))
+        logger.info("Fetched %d/%d bodies in %d $batch request(s)",
+                    len(bodies), len(message_ids), -(-len(message_ids) // GRAPH_BATCH_LIMIT))
+        return bodies
+
+
+class MockBodyFetcher(BodyFetcher):
+    """Bodies from a {message_id: html} dict, or from `<message_id>.html` files in a directory."""
+
+    def __init__(self, bodies: Optional[Dict[str, str]] = None, directory: Optional[str] = None):
+        self.bodies = dict(bodies or {})
+        self.directory = directory
+        self.calls = 0
+
+    def fetch_bodies(self, messages: Iterable[Dict]) -> Dict[str, str]:
+        self.calls += 1
+        result = {}
+        for message in messages:
+            message_id = message["id"]
+            html = self.bodies.get(message_id)
+            if html is None and self.directory:
+                path = os.path.join(self.directory, f"{message_id}.html")
+                if os.path.exists(path):
+                    with open(path, encoding="utf-8") as f:
+                        html = f.read()
+            result[message_id] = html or ""
+        return result
+
+
+def make_body_fetcher(mode: str, user_email: str, headers_fn, fetch_one=None, http=requests,
+                      base: str = GRAPH_BASE) -> BodyFetcher:
+    """Fetcher for MAIL_BODY_FETCH: "inline" (default), "batch" or "mock:<dir>"."""
+    mode = mode or "inline"
+    if mode.lower() == "batch":
+        return BatchBodyFetcher(user_email, headers_fn, http=http, base=base)
+    if mode.lower().startswith("mock:"):
+        return MockBodyFetcher(directory=mode.split(":", 1)[1])
+    return InlineBodyFetcher(fetch_one=fetch_one)
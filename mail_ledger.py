@@ -0,0 +1,159 @@
+"""
+Durable processing ledger for advisory emails.
+
+One SQLite row per email (MAIL_LEDGER_DB), keyed by the internet message ID
+(stable when the message is moved to Archive and its Graph ID changes) with
+the Graph message ID indexed as a second key. Each pipeline stage records
+how far the email got:
+
+    fetched -> parsed -> published / replied -> archived
+
+together with the parsed advisory or rejection. A stage only ever moves an
+entry forward. On a rerun the pipeline looks the emails up first and
+resumes each one after its last recorded stage: archived emails are
+skipped, parsed ones are not fetched or parsed again, and published ones
+are only archived - a crash between the EventHub send and the archive move
+no longer publishes the advisory twice.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MAIL_LEDGER_DB = os.environ.get("MAIL_LEDGER_DB", "mail_ledger.db")
+
+STAGES = ("fetched", "parsed", "published", "replied", "archived")
+_RANK = {stage: rank for rank, stage in enumerate(STAGES, start=1)}
+_LOOKUP_CHUNK = 400  # stays under SQLite's bound-parameter limit (2 per message)
+
+
+def ledger_key(message: Dict) -> str:
+    """Ledger key of a Graph message: its internetMessageId, else its Graph id."""
+    return message.get("internetMessageId") or f"id:{message.get('id')}"
+
+
+@dataclass
+class LedgerEntry:
+    key: str
+    message_id: str
+    state: str
+    advisory: Optional[Dict] = None
+    rejection: Optional[Dict] = None
+    error: Optional[str] = None
+    updated_at: Optional[str] = None
+
+    def reached(self, stage: str) -> bool:
+        return _RANK[self.state] >= _RANK[stage]
+
+
+class MailLedger:
+    def __init__(self, path: str = MAIL_LEDGER_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS mail_ledger ("
+            " key TEXT PRIMARY KEY, message_id TEXT NOT NULL, internet_message_id TEXT,"
+            " stage INTEGER NOT NULL, advisory TEXT, rejection TEXT, error TEXT, updated_at TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS mail_ledger_message_id ON mail_ledger (message_id)")
+        self._conn.commit()
+
+    @staticmethod
+    def _entry(row) -> LedgerEntry:
+        key, message_id, stage, advisory, rejection, error, updated_at = row
+        return LedgerEntry(
+            key=key,
+            message_id=message_id,
+            state=STAGES[stage - 1],
+            advisory=json.loads(advisory) if advisory else None,
+            rejection=json.loads(rejection) if rejection else None,
+            error=error,
+            updated_at=updated_at,
+        )
+
+    def lookup_many(self, messages: List[Dict]) -> List[Optional[LedgerEntry]]:
+        """Entries for `messages`, in order (None = never seen)."""
+        by_key: Dict[str, LedgerEntry] = {}
+        by_id: Dict[str, LedgerEntry] = {}
+        for start in range(0, len(messages), _LOOKUP_CHUNK):
+            chunk = messages[start:start + _LOOKUP_CHUNK]
+            keys = [ledger_key(m) for m in chunk]
+            ids = [m.get("id") for m in chunk]
+            marks = ",".join("?" * len(chunk))
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT key, message_id, stage, advisory, rejection, error, updated_at FROM mail_ledger"
+                    f" WHERE key IN ({marks}) OR message_id IN ({marks})",
+                    keys + ids,
+                ).fetchall()
+            for row in rows:
+                entry = self._entry(row)
+                by_key[entry.key] = entry
+                by_id[entry.message_id] = entry
+        return [by_key.get(ledger_key(m)) or by_id.get(m.get("id")) for m in messages]
+
+    def lookup(self, message: Dict) -> Optional[LedgerEntry]:
+        return self.lookup_many([message])[0]
+
+    def record_many(self, messages: Iterable[Dict], stage: str, advisory: Optional[Dict] = None,
+                    rejection: Optional[Dict] = None, error: Optional[str] = None) -> None:
+        """Move `messages` forward to `stage` (never backwards), in one transaction."""
+        rank = _RANK[stage]
+        now = datetime.now(timezone.utc).isoformat()
+        rows = [
+            (
+                ledger_key(m), m.get("id"), m.get("internetMessageId"), rank,
+                json.dumps(advisory, ensure_ascii=False) if advisory is not None else None,
+                json.dumps(rejection, ensure_ascii=False) if rejection is not None else None,
+                error, now,
+            )
+            for m in messages
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO mail_ledger"
+                " (key, message_id, internet_message_id, stage, advisory, rejection, error, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET"
+                "  message_id = excluded.message_id,"
+                "  stage = MAX(stage, excluded.stage),"
+                "  advisory = COALESCE(excluded.advisory, advisory),"
+                "  rejection = COALESCE(excluded.rejection, rejection),"
+                "  error = excluded.error,"
+                "  updated_at = excluded.updated_at",
+                rows,
+            )
+            self._conn.commit()
+
+    def record(self, message: Dict, stage: str, advisory: Optional[Dict] = None,
+               rejection: Optional[Dict] = None, error: Optional[str] = None) -> None:
+        self.record_many([message], stage, advisory=advisory, rejection=rejection, error=error)
+
+    def note_error(self, message: Dict, error: str) -> None:
+        """Keep the last error of a seen email without changing its stage."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE mail_ledger SET error = ?, updated_at = ? WHERE key = ?",
+                (error, datetime.now(timezone.utc).isoformat(), ledger_key(message)),
+            )
+            self._conn.commit()
+
+    def counts(self) -> Dict[str, int]:
+        """{stage: number of emails whose last recorded stage it is}."""
+        with self._lock:
+            rows = self._conn.execute("SELECT stage, COUNT(*) FROM mail_ledger GROUP BY stage").fetchall()
+        return {STAGES[stage - 1]: count for stage, count in rows}
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,333 @@
+"""
+Concurrent staged pipeline for advisory emails, with adaptive Graph throttling.
+
+Stages, joined by asyncio queues:
+    fetch   -> bodies for chunks of messages (BodyFetcher)
+    parse   -> evaluate each email: advisory, or the reason it was rejected
+    publish -> send accepted advisories (optional, e.g. EventHub)
+    mailbox -> reply to rejected emails, archive handled ones
+               (one by one, or ARCHIVE_BATCH at a time through `archive_many`)
+Each message goes through the stages in that order, so its reply/archive
+never happens before its publish; different messages overlap freely.
+Results are returned in the original message order. With a MailLedger each
+stage is recorded as it completes, and messages seen by an earlier run
+resume after their last recorded stage (see mail_ledger.py).
+
+The blocking Graph helpers run in worker threads. All of them share one
+`AdaptiveThrottle`, which replaces the fixed sleeps: it caps the number of
+Graph requests in flight, and on 429/503 it pauses every caller for the
+`Retry-After` period and halves the cap, then grows it back one step per
+run of successful requests.
+
+Config:
+    MAIL_PIPELINE_WORKERS   workers per I/O stage (default 4)
+    GRAPH_MAX_CONCURRENCY   max Graph requests in flight (default 8)
+    GRAPH_MAX_RETRIES       retries of a throttled request (default 5)
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from advisory_extraction.graph import GRAPH_MAX_RETRIES, THROTTLED_STATUSES, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+MAIL_PIPELINE_WORKERS = int(os.environ.get("MAIL_PIPELINE_WORKERS", "4"))
+GRAPH_MAX_CONCURRENCY = int(os.environ.get("GRAPH_MAX_CONCURRENCY", "8"))
+
+FETCH_CHUNK = 20
+ARCHIVE_BATCH = 20
+
+
+class AdaptiveThrottle:
+    """Thread-safe concurrency cap + Retry-After pause shared by all Graph calls."""
+
+    def __init__(self, max_concurrency: int = GRAPH_MAX_CONCURRENCY, min_concurrency: int = 1,
+                 increase_after: int = 20):
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.increase_after = increase_after
+        self.limit = self.max_concurrency
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._pause_until = 0.0
+        self._successes = 0
+        self.throttled = 0
+
+    def acquire(self) -> None:
+        with self._cond:
+            while True:
+                wait = self._pause_until - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                elif self._in_flight >= self.limit:
+                    self._cond.wait()
+                else:
+                    self._in_flight += 1
+                    return
+
+    def release(self, status: Optional[int] = None, headers=None) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            if status in THROTTLED_STATUSES:
+                delay = retry_after_seconds(headers)
+                self.throttled += 1
+                self._pause_until = max(self._pause_until, time.monotonic() + delay)
+                self.limit = max(self.min_concurrency, self.limit // 2)
+                self._successes = 0
+                logger.warning("Graph throttled (%s): pausing %.1fs, concurrency -> %d", status, delay, self.limit)
+            elif status is not None and status < 500:
+                self._successes += 1
+                if self._successes >= self.increase_after and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
+    def call(self, send: Callable[[], requests.Response], max_retries: int = GRAPH_MAX_RETRIES) -> requests.Response:
+        """Run `send` under the throttle, retrying throttled responses after their Retry-After."""
+        for attempt in range(max_retries + 1):
+            self.acquire()
+            resp = None
+            try:
+                resp = send()
+            finally:
+                self.release(resp.status_code if resp is not None else None,
+                             resp.headers if resp is not None else None)
+            if resp.status_code not in THROTTLED_STATUSES or attempt == max_retries:
+                return resp
+        return resp
+
+
+class ThrottledHttp:
+    """requests-style `get` / `post` / `request` that go through an AdaptiveThrottle."""
+
+    def __init__(self, throttle: AdaptiveThrottle, session=requests):
+        self.throttle = throttle
+        self.session = session
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", 30)
+        return self.throttle.call(lambda: self.session.request(method, url, **kwargs))
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+
+@dataclass
+class PipelineResult:
+    index: int
+    message: Dict
+    advisory: Optional[Dict] = None
+    rejection: Optional[Dict] = None
+    published: bool = False
+    replied: bool = False
+    archived: bool = False
+    error: Optional[str] = None
+    resumed_from: Optional[str] = None  # ledger stage the message already had at the start of the run
+
+
+async def run_pipeline(
+    messages: List[Dict],
+    fetch_bodies: Callable[[List[Dict]], Dict[str, str]],
+    evaluate: Callable[[Dict, str], Tuple[Optional[Dict], Optional[Dict]]],
+    reject: Callable[[Dict, Dict], None],
+    publish: Optional[Callable[[Dict, Dict], Awaitable[bool]]] = None,
+    archive: Optional[Callable[[str], bool]] = None,
+    archive_many: Optional[Callable[[List[str]], Dict[str, bool]]] = None,
+    ledger=None,
+    workers: int = MAIL_PIPELINE_WORKERS,
+) -> List[PipelineResult]:
+    """
+    Run `messages` through fetch -> parse -> publish -> mailbox.
+
+    fetch_bodies(messages) -> {id: html}       (blocking, run in threads); messages missing from
+                                               the result (or all, if it raises) failed to fetch:
+                                               they get `error` set and are retried by the next run
+    evaluate(message, html) -> (advisory, rejection)
+    reject(message, rejection)                 reply + archive of a rejected email
+    publish(message, advisory) -> bool         async; when given, accepted emails are
+                                               archived with `archive` after a successful publish
+    archive_many([id, ...]) -> {id: moved}     when given, rejected and published emails are
+                                               archived through it, ARCHIVE_BATCH ids per call,
+                                               and `reject` only has to send the reply
+    ledger                                     optional mail_ledger.MailLedger; every stage is
+                                               recorded and messages resume after their last one
+    """
+    results = [PipelineResult(index=i, message=m) for i, m in enumerate(messages)]
+    parse_q: asyncio.Queue = asyncio.Queue(maxsize=workers * FETCH_CHUNK)
+    publish_q: asyncio.Queue = asyncio.Queue(maxsize=workers * 4)
+    mailbox_q: asyncio.Queue = asyncio.Queue(maxsize=workers * 4)
+
+    def record(batch: List[PipelineResult], stage: str, **fields):
+        if ledger is None or not batch:
+            return
+        try:
+            ledger.record_many([r.message for r in batch], stage, **fields)
+        except Exception as e:
+            # the run goes on; at worst a rerun repeats this stage
+            logger.error("Ledger update to '%s' failed for %d message(s): %s", stage, len(batch), e)
+
+    # ledger lookup: skip finished messages, resume the rest after their last stage
+    resumed: List[PipelineResult] = []
+    to_fetch = results
+    if ledger is not None:
+        to_fetch = []
+        for result, entry in zip(results, await asyncio.to_thread(ledger.lookup_many, messages)):
+            if entry is None or not entry.reached("parsed"):
+                to_fetch.append(result)
+                continue
+            result.resumed_from = entry.state
+            result.advisory, result.rejection = entry.advisory, entry.rejection
+            result.published = bool(entry.advisory) and entry.reached("published")
+            result.replied = bool(entry.rejection) and entry.reached("replied")
+            result.archived = entry.reached("archived")
+            if not result.archived:
+                resumed.append(result)
+        logger.info("Ledger: %d message(s) already done, %d resumed, %d new",
+                    len(results) - len(to_fetch) - len(resumed), len(resumed), len(to_fetch))
+
+    chunks: asyncio.Queue = asyncio.Queue()
+    for start in range(0, len(to_fetch), FETCH_CHUNK):
+        chunks.put_nowait(to_fetch[start:start + FETCH_CHUNK])
+
+    async def route(result: PipelineResult):
+        if result.advisory and publish and not result.published:
+            await publish_q.put(result)
+        else:
+            await mailbox_q.put(result)
+
+    async def resume_worker():
+        for result in resumed:
+            await route(result)
+
+    async def fetch_worker():
+        while True:
+            try:
+                chunk = chunks.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                bodies = await asyncio.to_thread(fetch_bodies, [r.message for r in chunk])
+            except Exception as e:
+                logger.exception("Body fetch failed for %d message(s): %s", len(chunk), e)
+                bodies, error = {}, f"Body fetch failed: {e}"
+            else:
+                error = "Body could not be fetched"
+            # a body that couldn't be read is a Graph failure, not an empty email: the message is
+            # left unparsed (no reply, no archive, nothing recorded past "fetched") for the next run
+            fetched = []
+            for result in chunk:
+                html = bodies.get(result.message.get("id"))
+                if html is None:
+                    result.error = error
+                    continue
+                fetched.append(result)
+                await parse_q.put((result, html))
+            if len(fetched) < len(chunk):
+                logger.warning("%d of %d message(s) left for the next run: body fetch failed",
+                               len(chunk) - len(fetched), len(chunk))
+            await asyncio.to_thread(record, fetched, "fetched")
+
+    async def parse_worker():
+        while True:
+            result, html = await parse_q.get()
+            try:
+                try:
+                    result.advisory, result.rejection = await asyncio.to_thread(evaluate, result.message, html)
+                except Exception as e:
+                    logger.exception("Error evaluating email id=%s: %s", result.message.get("id"), e)
+                    result.error = str(e)
+                    result.rejection = {"missing_fields": [], "invalid_fields": [],
+                                        "extra_reason": f"Internal processing error: {e}"}
+                await asyncio.to_thread(record, [result], "parsed",
+                                        advisory=result.advisory, rejection=result.rejection)
+                await route(result)
+            except Exception as e:
+                logger.error("Parse stage failed for message %s: %s", result.message.get("id"), e, exc_info=True)
+                result.error = str(e)
+            finally:
+                parse_q.task_done()
+
+    async def publish_worker():
+        while True:
+            result = await publish_q.get()
+            try:
+                result.published = bool(await publish(result.message, result.advisory))
+                if result.published:
+                    await asyncio.to_thread(record, [result], "published")
+            except Exception as e:
+                logger.error("Error publishing advisory for message %s: %s", result.message.get("id"), e,
+                             exc_info=True)
+                result.error = str(e)
+            try:
+                await mailbox_q.put(result)
+            finally:
+                publish_q.task_done()
+
+    to_archive: List[PipelineResult] = []
+
+    async def archive_batch(batch: List[PipelineResult]):
+        try:
+            moved = await asyncio.to_thread(archive_many, [r.message.get("id") for r in batch])
+        except Exception as e:
+            logger.error("Batched archive of %d message(s) failed: %s", len(batch), e, exc_info=True)
+            moved = {}
+            for result in batch:
+                result.error = str(e)
+        for result in batch:
+            result.archived = bool(moved.get(result.message.get("id")))
+        await asyncio.to_thread(record, [r for r in batch if r.archived], "archived")
+
+    async def mailbox_worker():
+        while True:
+            result = await mailbox_q.get()
+            message_id = result.message.get("id")
+            try:
+                if result.rejection and not result.replied:
+                    await asyncio.to_thread(reject, result.message, result.rejection)
+                    result.replied = True
+                    await asyncio.to_thread(record, [result], "replied")
+                if archive_many and (result.rejection or result.published):
+                    to_archive.append(result)
+                    if len(to_archive) >= ARCHIVE_BATCH:
+                        batch = to_archive[:]
+                        to_archive.clear()
+                        await archive_batch(batch)
+                elif result.published and archive:
+                    result.archived = bool(await asyncio.to_thread(archive, message_id))
+                    if result.archived:
+                        await asyncio.to_thread(record, [result], "archived")
+            except Exception as e:
+                logger.error("Mailbox step failed for message %s: %s", message_id, e, exc_info=True)
+                result.error = str(e)
+            finally:
+                mailbox_q.task_done()
+
+    fetchers = [asyncio.create_task(fetch_worker()) for _ in range(workers)]
+    fetchers.append(asyncio.create_task(resume_worker()))
+    consumers = [asyncio.create_task(parse_worker()) for _ in range(workers)]
+    consumers += [asyncio.create_task(mailbox_worker()) for _ in range(workers)]
+    if publish:
+        consumers += [asyncio.create_task(publish_worker()) for _ in range(workers)]
+    try:
+        await asyncio.gather(*fetchers)
+        # stages drain in order; each stage only feeds later ones
+        await parse_q.join()
+        await publish_q.join()
+        await mailbox_q.join()
+        if to_archive:
+            await archive_batch(to_archive)
+    finally:
+        for task in fetchers + consumers:
+            task.cancel()
+        await asyncio.gather(*fetchers, *consumers, return_exceptions=True)
+    return results
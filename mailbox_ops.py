@@ -0,0 +1,197 @@
+"""
+Mailbox operations with cached folder IDs and batched moves.
+
+Well-known folder IDs (archive, inbox, ...) are resolved once per process
+and cached for MAIL_FOLDER_TTL seconds. A move that comes back 404 makes the
+cached ID be resolved again; if the folder turned out to have a new ID the
+move is retried once with it.
+
+`move_many` sends the moves through Graph JSON $batch, GRAPH_BATCH_LIMIT per
+request, so archiving N messages costs ceil(N / 20) requests (plus one
+folder lookup per TTL) instead of two requests per message. Moves throttled
+inside a batch (429/503) are retried after their Retry-After.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import requests
+
+from advisory_extraction.graph import (
+    GRAPH_BASE,
+    GRAPH_BATCH_LIMIT,
+    GRAPH_MAX_RETRIES,
+    THROTTLED_STATUSES,
+    retry_after_seconds,
+)
+
+logger = logging.getLogger(__name__)
+
+MAIL_FOLDER_TTL = float(os.environ.get("MAIL_FOLDER_TTL", "3600"))
+
+
+class MailboxOps:
+    def __init__(
+        self,
+        user_email: str,
+        headers_fn: Callable[[], Dict[str, str]],
+        http=requests,
+        base: str = GRAPH_BASE,
+        ttl: float = MAIL_FOLDER_TTL,
+        timeout: float = 60,
+    ):
+        self.user_email = user_email
+        self.headers_fn = headers_fn
+        self.http = http
+        self.base = base.rstrip("/")
+        self.ttl = ttl
+        self.timeout = timeout
+        self.requests = 0
+        self._folders: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _headers(self) -> Dict[str, str]:
+        headers = dict(self.headers_fn())
+        headers["Content-Type"] = "application/json"
+        return headers
+
+    def folder_id(self, name: str = "archive", refresh: bool = False) -> Optional[str]:
+        """ID of a (well-known) mail folder, from the cache unless expired or `refresh`."""
+        key = name.lower()
+        if not refresh:
+            with self._lock:
+                cached = self._folders.get(key)
+            if cached and cached[1] > time.monotonic():
+                return cached[0]
+
+        logger.debug("Fetching %s folder id for user %s", name, self.user_email)
+        self.requests += 1
+        resp = self.http.get(f"{self.base}/users/{self.user_email}/mailFolders/{name}",
+                             headers=self._headers(), timeout=self.timeout)
+        if resp.status_code != 200:
+            logger.error("Failed to get %s folder. Status=%s Response=%s", name, resp.status_code, resp.text)
+            return None
+        folder_id = resp.json().get("id")
+        if not folder_id:
+            logger.error("%s folder found but no id field present.", name)
+            return None
+        with self._lock:
+            self._folders[key] = (folder_id, time.monotonic() + self.ttl)
+        return folder_id
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        with self._lock:
+            if name is None:
+                self._folders.clear()
+            else:
+                self._folders.pop(name.lower(), None)
+
+    def _refreshed(self, name: str, old_id: str) -> Optional[str]:
+        """Re-resolve a folder after a 404; the new ID, or None if it didn't change."""
+        new_id = self.folder_id(name, refresh=True)
+        if new_id and new_id != old_id:
+            logger.warning("%s folder id changed (%s -> %s); retrying move(s)", name, old_id, new_id)
+            return new_id
+        return None
+
+    def move(self, message_id: str, folder: str = "archive") -> bool:
+        """Move one message; True if moved."""
+        destination = self.folder_id(folder)
+        if not destination:
+            logger.error("Could not resolve %s folder id. Skipping move.", folder)
+            return False
+
+        for attempt in range(2):
+            self.requests += 1
+            resp = self.http.post(f"{self.base}/users/{self.user_email}/messages/{message_id}/move",
+                                  headers=self._headers(), json={"destinationId": destination},
+                                  timeout=self.timeout)
+            if resp.status_code == 201:  # Created = moved successfully
+                moved = resp.json()
+                logger.info("Message moved to %s. New folder id=%s New message id=%s",
+                            folder, moved.get("parentFolderId"), moved.get("id"))
+                return True
+            if resp.status_code == 404 and attempt == 0:
+                destination = self._refreshed(folder, destination)
+                if destination:
+                    continue
+            logger.error("Failed to move message to %s. Status=%s Response=%s", folder, resp.status_code, resp.text)
+            return False
+        return False
+
+    def _batch_move(self, message_ids, destination: str) -> Dict[str, Tuple[int, Dict]]:
+        payload = {
+            "requests": [
+                {
+                    "id": str(i),
+                    "method": "POST",
+                    "url": f"/users/{self.user_email}/messages/{message_id}/move",
+                    "headers": {"Content-Type": "application/json"},
+                    "body": {"destinationId": destination},
+                }
+                for i, message_id in enumerate(message_ids)
+            ]
+        }
+        self.requests += 1
+        resp = self.http.post(f"{self.base}/$batch", headers=self._headers(), json=payload, timeout=self.timeout)
+        if resp.status_code != 200:
+            logger.error("Move $batch failed: %s | Response: %s", resp.status_code, resp.text)
+            return {message_id: (resp.status_code, dict(resp.headers)) for message_id in message_ids}
+
+        statuses = {message_id: (0, {}) for message_id in message_ids}
+        for item in resp.json().get("responses", []):
+            statuses[message_ids[int(item["id"])]] = (item.get("status", 0), item.get("headers") or {})
+        return statuses
+
+    def move_many(self, message_ids: Iterable[str], folder: str = "archive") -> Dict[str, bool]:
+        """Move messages via $batch; {message_id: moved}."""
+        message_ids = list(message_ids)
+        results = {message_id: False for message_id in message_ids}
+        if not message_ids:
+            return results
+        destination = self.folder_id(folder)
+        if not destination:
+            logger.error("Could not resolve %s folder id. Skipping %d move(s).", folder, len(message_ids))
+            return results
+
+        requests_before = self.requests
+        pending = message_ids
+        refreshed = False
+        for attempt in range(GRAPH_MAX_RETRIES + 1):
+            not_found, retry, wait = [], [], 0.0
+            for start in range(0, len(pending), GRAPH_BATCH_LIMIT):
+                chunk = pending[start:start + GRAPH_BATCH_LIMIT]
+                for message_id, (status, headers) in self._batch_move(chunk, destination).items():
+                    if status == 201:
+                        results[message_id] = True
+                    elif status == 404:
+                        not_found.append(message_id)
+                    elif status in THROTTLED_STATUSES:
+                        retry.append(message_id)
+                        wait = max(wait, retry_after_seconds(headers))
+                    else:
+                        logger.error("Move of %s to %s inside $batch failed: %s", message_id, folder, status)
+
+            throttled = len(retry)
+            if not_found and not refreshed:
+                refreshed = True
+                new_destination = self._refreshed(folder, destination)
+                if new_destination:
+                    destination = new_destination
+                    retry += not_found
+                    not_found = []
+            for message_id in not_found:
+                logger.error("Move of %s to %s inside $batch failed: 404", message_id, folder)
+
+            pending = retry
+            if not pending or attempt == GRAPH_MAX_RETRIES:
+                break
+            if throttled:
+                logger.warning("%d move(s) throttled; retrying in %.1fs", throttled, wait)
+                time.sleep(wait)
+
+        logger.info("Moved %d/%d message(s) to %s in %d request(s)",
+                    sum(results.values()), len(message_ids), folder, self.requests - requests_before)
+        return results
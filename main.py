@@ -11,6 +11,7 @@ from ag_ui.core import (
     TextMessageEndEvent,
     ToolCallStartEvent,
     ToolCallArgsEvent,
+    ToolCallEndEvent,
     ToolCallResultEvent,
     RunStartedEvent,
     RunFinishedEvent,
@@ -26,8 +27,7 @@ import sys
 import httpx
 from dotenv import load_dotenv
 import uvicorn
-from toon import encode
-from redis import Redis
+from redis.asyncio import Redis
 from redis_entraid.cred_provider import create_from_service_principal
 load_dotenv()
 import ssl
@@ -35,8 +35,11 @@ import logging
 from pymongo import MongoClient, errors
 from variables import weather_schema, toon_payload, msg 
 from mongoDB import insert_weather_chat, insert_weather_summary, get_recent_weather_summary
-# pip install tiktoken
-import tiktoken
+from tool_scheduler import ToolCallScheduler
+from token_accounting import token_counter, CONTEXT_TOKEN_LIMIT
+from summary_worker import SummaryWorker, SUMMARY_TRIGGER_RATIO
+from history_store import RedisHistoryStore, InMemoryHistoryStore
+from prompt_layout import build_static_prefix, build_chat_messages, prompt_cache_metrics, PROMPT_CACHE_KEY
 
 app = FastAPI()
  
@@ -93,6 +96,7 @@ try:
     if redis_credential_provider:
         # NOTE: redis-py versions differ in accepted SSL params.
         # Many versions do NOT accept ssl_context in Redis(...), so use ssl_cert_reqs and ssl_check_hostname.
+        # asyncio client: history reads/writes must not block the event loop.
         redis_client = Redis(
             host=REDIS_HOST,
             port=REDIS_PORT,
@@ -104,12 +108,6 @@ try:
             ssl_cert_reqs=None if _dev_disable_ssl_verify else "required",
             ssl_check_hostname=False if _dev_disable_ssl_verify else True,
         )
-        # quick non-fatal ping to surface connectivity issues early
-        try:
-            ok = redis_client.ping()
-            logger.info("Redis ping -> %s", ok)
-        except Exception as e:
-            logger.warning("Redis ping failed (will continue): %s", e)
     else:
         redis_client = None
 except TypeError as te:
@@ -150,92 +148,81 @@ def make_history_key(user_id: str, session_id: str) -> str:
     return f"{NAMESPACE}:{PROJECT}:{MODULE}:history:{uid}:{sid}"
 
 
-# ...existing code...
+# History backend: Redis when configured, in-memory for local runs/tests (HISTORY_BACKEND=memory)
+if os.getenv("HISTORY_BACKEND", "redis").lower() == "memory":
+    logger.warning("Using in-memory chat history store (HISTORY_BACKEND=memory)")
+    history_store = InMemoryHistoryStore(ttl_seconds=HISTORY_TTL_SECONDS, max_length=MAX_HISTORY_MESSAGES)
+elif redis_client:
+    history_store = RedisHistoryStore(redis_client, ttl_seconds=HISTORY_TTL_SECONDS, max_length=MAX_HISTORY_MESSAGES)
+else:
+    history_store = None
+
+
+@app.on_event("startup")
+async def check_history_store():
+    # quick non-fatal ping to surface connectivity issues early
+    if not history_store:
+        return
+    try:
+        ok = await history_store.ping()
+        logger.info("History store ping -> %s", ok)
+    except Exception as e:
+        logger.warning("History store ping failed (will continue): %s", e)
+
 
+@app.on_event("shutdown")
+async def close_history_store():
+    if history_store:
+        await history_store.close()
 
-def append_turn_to_history(user_id: str, session_id: str, user_msg: str, assistant_msg: str) -> None:
+
+async def append_turn_to_history(user_id: str, session_id: str, user_msg: str, assistant_msg: str) -> None:
     """
-    Store one full turn (user + assistant) in Redis List for a given user + session.
-    Defensive: it returns immediately if Redis is unavailable or any operation fails.
+    Store one full turn (user + assistant) for a given user + session.
+    Single round trip: append + trim to MAX_HISTORY_MESSAGES + refresh TTL.
+    Defensive: it returns immediately if the store is unavailable or any operation fails.
     """
-    if not redis_client:
-        logger.debug("append_turn_to_history: redis_client is not available, skipping")
+    if not history_store:
+        logger.debug("append_turn_to_history: history_store is not available, skipping")
         return
 
     key = make_history_key(user_id, session_id)
-    user_entry = json.dumps({"role": "user", "content": user_msg}, ensure_ascii=False)
-    assistant_entry = json.dumps({"role": "assistant", "content": assistant_msg}, ensure_ascii=False)
-
     try:
-        pipe = redis_client.pipeline()
-        pipe.rpush(key, user_entry, assistant_entry)
-        pipe.expire(key, HISTORY_TTL_SECONDS)
-        pipe.execute()
+        await history_store.append(key, [("user", user_msg), ("assistant", assistant_msg)])
     except Exception as e:
         logger.warning("append_turn_to_history failed for key=%s: %s", key, e)
 
 
-def load_history_messages(user_id: str, session_id: str, max_messages: int = MAX_HISTORY_MESSAGES):
+async def load_history_messages(user_id: str, session_id: str, max_messages: int = MAX_HISTORY_MESSAGES):
     """
-    Load last N messages from Redis for a given user + session and return as list of dicts.
-    Defensive: returns empty list if Redis is unavailable or on error.
+    Load last N messages for a given user + session and return as list of dicts.
+    Defensive: returns empty list if the store is unavailable or on error.
     """
-    if not redis_client:
-        logger.debug("load_history_messages: redis_client is not available")
+    if not history_store:
+        logger.debug("load_history_messages: history_store is not available")
         return []
 
     key = make_history_key(user_id, session_id)
     try:
-        length = redis_client.llen(key)
+        return await history_store.load(key, max_messages)
     except Exception as e:
-        logger.warning("Redis llen failed for key=%s: %s", key, e)
+        logger.warning("Loading history failed for key=%s: %s", key, e)
         return []
 
-    if not length:
-        return []
-
-    start = max(0, length - max_messages)
-    try:
-        raw_msgs = redis_client.lrange(key, start, -1)
-    except Exception as e:
-        logger.warning("Redis lrange failed for key=%s: %s", key, e)
-        return []
-
-    messages = []
-    for raw in raw_msgs:
-        try:
-            messages.append(json.loads(raw))
-        except Exception:
-            continue
-    return messages
-
-def trim_history_to_recent(user_id: str, session_id: str, keep_recent: int = 5) -> bool:
+async def trim_history_to_recent(user_id: str, session_id: str, keep_recent: int = 5) -> bool:
     """
-    Trim Redis history to keep only the N most recent messages.
+    Trim history to keep only the N most recent messages.
     Returns True if trimming was successful, False otherwise.
     """
-    if not redis_client:
-        logger.debug("trim_history_to_recent: redis_client is not available")
+    if not history_store:
+        logger.debug("trim_history_to_recent: history_store is not available")
         return False
 
     key = make_history_key(user_id, session_id)
     try:
-        # Get current length
-        length = redis_client.llen(key)
-        # if length <= keep_recent:
-        #     logger.info("History already within limit, no trimming needed")
-        #     return True
-        
-        # Calculate how many to remove from the left
-        to_remove = length - keep_recent
-        
-        # Remove old messages from the left (ltrim keeps elements from start to end)
-        # We want to keep the last keep_recent messages, so start from (length - keep_recent)
-        start_index = to_remove
-        redis_client.ltrim(key, start_index, -1)
-        
+        await history_store.trim(key, keep_recent)
         logger.info(
-            f"Trimmed {to_remove} old messages from Redis for user={user_id}, "
+            f"Trimmed Redis history for user={user_id}, "
             f"session={session_id}, kept {keep_recent} recent messages"
         )
         return True
@@ -244,14 +231,6 @@ def trim_history_to_recent(user_id: str, session_id: str, keep_recent: int = 5)
         logger.warning("trim_history_to_recent failed for key=%s: %s", key, e)
         return False
     
-def count_tokens_text(text: str, model: str = "gpt-4o"):
-                # Choose an encoding. If model isn't supported directly, fallback to cl100k_base.
-                try:
-                    enc = tiktoken.encoding_for_model(model)
-                except KeyError:
-                    enc = tiktoken.get_encoding("cl100k_base")
-                return len(enc.encode(text))
-
 encoder = EventEncoder()
 
  
@@ -324,21 +303,59 @@ async def test_mcp_connection():
         print(f"❌ MCP connection test failed: {e}")
         return False
  
-async def summary_chat(messages: str):
+async def summary_chat(messages: list):
 
     prompt_summary = "Summarize the previous conversation in concise manner focusing on weather related information only. The summary should be brief and capture key points discussed."
-    messages.append({
+    messages = messages + [{
         "role": "system",
         "content": prompt_summary
-    })
+    }]
 
-    re = llm.chat.completions.create(
+    # sync SDK call -> run in a thread so the event loop keeps serving requests
+    re = await asyncio.to_thread(
+        llm.chat.completions.create,
         model=os.getenv("deployment"),
         messages=messages,
         stream=False,
     )
     return re.choices[0].message.content
 
+
+async def _latest_summary_text(user_id: str, session_id: str):
+    recent_summary = await get_recent_weather_summary(session_id, user_id)
+    return recent_summary["summary"] if recent_summary else None
+
+
+async def _store_summary(user_id: str, session_id: str, summary: str):
+    await insert_weather_summary(session_id, user_id, summary)
+
+
+def _next_turn_context_tokens(history_messages: list, summary_text):
+    # size of the request this session would send next (user prompt excluded)
+    static_prefix = build_static_prefix(msg, toon_payload, weather_schema)
+    return token_counter.count_messages(build_chat_messages(static_prefix, history_messages, "", summary_text))
+
+
+summary_worker = SummaryWorker(
+    load_history=load_history_messages,
+    get_summary=_latest_summary_text,
+    save_summary=_store_summary,
+    trim_history=trim_history_to_recent,
+    summarize=summary_chat,
+    context_tokens=_next_turn_context_tokens,
+    trigger_tokens=int(CONTEXT_TOKEN_LIMIT * SUMMARY_TRIGGER_RATIO),
+)
+
+
+@app.on_event("startup")
+async def start_summary_worker():
+    summary_worker.start()
+
+
+@app.on_event("shutdown")
+async def stop_summary_worker():
+    await summary_worker.stop()
+
 async def interact_with_server(user_prompt: str, session_id: str, user_id: str):
     """Main orchestration generator that yields AG-UI events for streaming."""
     # session_id=DUMMY_SESSION_ID
@@ -382,94 +399,37 @@ async def interact_with_server(user_prompt: str, session_id: str, user_id: str):
                 for tool in tool_descriptions
             ]
  
-            toon = toon_payload
-            schema = weather_schema          
-            schema_toon = encode(schema)
+            # 1) Byte-stable cacheable prefix: system prompt + airport TOON + schema
+            static_prefix = build_static_prefix(msg, toon_payload, weather_schema)
             recent_summary = await get_recent_weather_summary(session_id, user_id)
-            sys_msg =msg
- 
-            messages = [
-                {"role": "system", "content": sys_msg},
-                {"role": "system", "content": "key Value pairs of airport:\n" + toon},
-                {"role": "system", "content": "Schema (JSON):\n" + schema_toon},
-            ]
- 
+            summary_text = recent_summary["summary"] if recent_summary else None
            
             # 2) Conversation history from Redis (per user + session)
-            history_messages = load_history_messages(user_id, session_id)
+            history_messages = await load_history_messages(user_id, session_id)
             
             if history_messages:
                 print(
                     f"🧠 Loaded {len(history_messages)} history messages "
                     f"from Redis for user={user_id}, session={session_id}"
                 )
-            messages.extend(history_messages)
-
-            if recent_summary:
-                messages.append(
-                    {
-                        "role": "system",
-                        "content": "The summary of older messages:\n" + recent_summary["summary"] if recent_summary else "",
-                    }
-                )
-
-            # 3) Current user prompt
-            messages.append(
-                {
-                    "role": "user",
-                    "content": "The User prompt is as follows:\n" + user_prompt,
-                }
-            )
-
-            
-
-
-
 
-            
-
-            print("Token calculated : ", count_tokens_text(str(messages)))
+            # 3) Summary goes before history so the history stays append-only; user prompt last
+            messages = build_chat_messages(static_prefix, history_messages, user_prompt, summary_text)
 
-            if count_tokens_text(str(messages)) > 128000:
-                print("⚠️ Token limit exceeded, trimming history...")
-                
-                summary_response = await summary_chat(messages)
+            context_tokens = token_counter.count_messages(messages)
+            print("Token calculated : ", context_tokens)
 
-                await insert_weather_summary(session_id, user_id, summary_response)
-
-                # Trim Redis history to keep only 5 recent messages
-                trimmed = trim_history_to_recent(user_id, session_id, keep_recent=5)
-                if trimmed:
-                   
-                    # Reload messages after trimming
-                    history_messages = load_history_messages(user_id, session_id)
-                    
-                    # Rebuild messages list with trimmed history
-                    messages = [
-                        {"role": "system", "content": sys_msg},
-                        {"role": "system", "content": "key Value pairs of airport:\n" + toon},
-                        {"role": "system", "content": "Schema (JSON):\n" + schema_toon},
-                    ]
-                    messages.extend(history_messages)
-
-                    if recent_summary:
-                        messages.append(
-                            {
-                                "role": "system",
-                                "content": "The summary of older messages:\n" + recent_summary["summary"] if recent_summary else "",
-                            }
-                        )
-                        
-                    messages.append({
-                        "role": "user",
-                        "content": "The User prompt is as follows:\n" + user_prompt,
-                    })
-                    
-                    print(f"🔄 Recalculated tokens after trimming: {count_tokens_text(str(messages))}")
-                else:
-                    print("❌ Failed to trim Redis history, continuing with current messages")
-
-                
+            if context_tokens > CONTEXT_TOKEN_LIMIT:
+                # The summary worker normally summarises before this point; if it fell
+                # behind, drop the oldest history from this request only (the stored
+                # history is untouched) and let the worker catch up.
+                print("⚠️ Token limit exceeded, dropping oldest history from this request...")
+                summary_worker.schedule(user_id, session_id)
+                while history_messages and context_tokens > CONTEXT_TOKEN_LIMIT:
+                    history_messages = history_messages[1:]
+                    messages = build_chat_messages(static_prefix, history_messages, user_prompt, summary_text)
+                    context_tokens = token_counter.count_messages(messages)
+                print(f"🔄 Recalculated tokens after trimming: {context_tokens}")
 
             # ------------------------------------------------------------------
             # print(messages)
@@ -483,7 +443,9 @@ async def interact_with_server(user_prompt: str, session_id: str, user_id: str):
                         tool_choice="auto",
                         tools=openai_tools if openai_tools else None,
                         stream=False,
+                        prompt_cache_key=PROMPT_CACHE_KEY,
                     )
+                    prompt_cache_metrics.record(response)
 
                 except Exception as llm_err:
                         print(f"⚠️ Failed to get a response from LLM: {llm_err}")
@@ -514,6 +476,8 @@ async def interact_with_server(user_prompt: str, session_id: str, user_id: str):
                         ],
                     })
  
+                    # Announce every call up front, then run them concurrently
+                    pending_calls = []
                     for tool_call in message.tool_calls:
                         tool_name = tool_call.function.name
                         tool_args = json.loads(tool_call.function.arguments)
@@ -538,41 +502,35 @@ async def interact_with_server(user_prompt: str, session_id: str, user_id: str):
                                 delta=json.dumps(tool_args),
                             )
                         )
- 
-                        # Call the tool with authentication (like test script)
-                        try:
-                            print(f"  📡 Executing authenticated tool call on MCP server...")
-                            result = await client.call_tool(tool_name, tool_args)
-                           
-                            # Handle result data properly
-                            if hasattr(result, 'data'):
-                                result_data = result.data
-                            else:
-                                result_data = result
-                           
-                            if isinstance(result_data, dict):
-                                result_content = result_data.get("content", str(result_data))
-                            else:
-                                result_content = str(result_data)
- 
-                            print(f"  ✅ Tool result: {result_content[:200]}{'...' if len(result_content) > 200 else ''}")
-                           
-                        except Exception as tool_error:
-                            print(f"  ❌ Tool call failed: {tool_error}")
-                            traceback.print_exc()
-                            result_content = f"Tool call failed: {str(tool_error)}"
+                        pending_calls.append((tool_call, tool_args))
+
+                    # Stream end/result events as each call finishes
+                    outcomes = [None] * len(pending_calls)
+                    scheduler = ToolCallScheduler(client)
+                    async for outcome in scheduler.run(pending_calls):
+                        outcomes[outcome.index] = outcome
+
+                        yield encoder.encode(
+                            ToolCallEndEvent(
+                                type=EventType.TOOL_CALL_END,
+                                tool_call_id=outcome.tool_call_id,
+                            )
+                        )
  
                         yield encoder.encode(
                             ToolCallResultEvent(
                                 type=EventType.TOOL_CALL_RESULT,
                                 message_id="msg_1",
-                                tool_call_id=tool_call.id,
-                                content=result_content,
+                                tool_call_id=outcome.tool_call_id,
+                                content=outcome.content,
                                 role="tool",
                             )
                         )
-                        
-                        if tool_name == "table_and_graph_JSON_generater":
+
+                    # Tool messages must follow the order of message.tool_calls
+                    for outcome in outcomes:
+                        result_content = outcome.content
+                        if outcome.tool_name == "table_and_graph_JSON_generater" and outcome.ok:
                             cleaned = re.sub(r'^```json|```$', '', result_content, flags=re.MULTILINE)
                             result_tg = json.loads(cleaned)
                             result_tg = json.dumps(result_tg)
@@ -581,13 +539,13 @@ async def interact_with_server(user_prompt: str, session_id: str, user_id: str):
                             # print(graphs)
                             messages.append({
                                 "role": "tool",
-                                "tool_call_id": tool_call.id,
+                                "tool_call_id": outcome.tool_call_id,
                                 "content": "json generated",
                             })
                         else:
                             messages.append({
                                 "role": "tool",
-                                "tool_call_id": tool_call.id,
+                                "tool_call_id": outcome.tool_call_id,
                                 "content": result_content,
                             })
  
@@ -622,10 +580,12 @@ async def interact_with_server(user_prompt: str, session_id: str, user_id: str):
                         print(f"  ✅ Finished streaming all {len(content)} characters")
                    
                         try:
-                            append_turn_to_history(user_id, session_id, user_prompt, content)
+                            await append_turn_to_history(user_id, session_id, user_prompt, content)
                             print(
                                 f"💾 Saved turn to Redis for user={user_id}, session={session_id}"
                             )
+                            # pre-compute a rolling summary off the request path if needed
+                            summary_worker.schedule(user_id, session_id)
                         except Exception as redis_err:
                             print(f"⚠️ Failed to write chat history to Redis: {redis_err}")
                    
@@ -742,6 +702,11 @@ async def health_check():
             "authentication": "failed"
         }
  
+@app.get("/metrics/prompt-cache")
+async def prompt_cache_stats():
+    """Prompt-cache usage (cached vs. total prompt tokens) since process start."""
+    return prompt_cache_metrics.snapshot()
+
 @app.get("/test-mcp")
 async def test_mcp_endpoint():
     """Test endpoint that replicates your test script functionality."""
@@ -787,12 +752,12 @@ async def delete_session(userId: str = Query("anonymous"), sessionId: str = Quer
     Returns 200 on success, 404 if key not found, 503 if Redis unavailable.
     """
     try:
-        if not redis_client:
-            logger.warning("delete_session: redis_client not available")
+        if not history_store:
+            logger.warning("delete_session: history_store not available")
             return {"status": "failed", "error": "redis unavailable"}
 
         key = make_history_key(userId, sessionId)
-        deleted = redis_client.delete(key)
+        deleted = await history_store.delete(key)
         if deleted:
             logger.info("Deleted session history key=%s for user=%s", key, userId)
             return {"status": "success", "deleted_keys": deleted}
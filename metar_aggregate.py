@@ -0,0 +1,157 @@
+"""
+Bounded execution of LLM-supplied aggregation pipelines against the METAR collection.
+
+`prepare_pipeline` checks and rewrites a pipeline before it reaches MongoDB:
+  - write stages ($out, $merge) and server-side JavaScript are rejected
+  - $lookup / $graphLookup / $unionWith may only target the METAR collection
+  - a pipeline must open with a $match on an indexed field, so it can't scan
+    the whole history; otherwise it is rejected with the list of indexed
+    fields. Setting AGGREGATE_DEFAULT_WINDOW_HOURS opts in to prepending a
+    `timestamp` window instead (which changes what the pipeline means, so it
+    is reported in the rewrites). Pipelines opening with a stage that must
+    come first ($geoNear, $collStats, ...) are left as they are
+  - a trailing $limit is always appended (so $sort + $limit become a top-k sort)
+`run_bounded_aggregate` then runs it with maxTimeMS / allowDiskUse policy and
+returns the documents plus a small cost report for the response.
+"""
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Tuple
+
+from metar_normalize import NUMERIC_FIELDS, NUMERIC_PREFIX, CLOUD_TOKENS_FIELD, FIR_TOKENS_FIELD
+
+logger = logging.getLogger(__name__)
+
+AGGREGATE_MAX_TIME_MS = int(os.getenv("AGGREGATE_MAX_TIME_MS", "5000"))
+AGGREGATE_ALLOW_DISK_USE = os.getenv("AGGREGATE_ALLOW_DISK_USE", "0") == "1"
+AGGREGATE_DEFAULT_WINDOW_HOURS = int(os.getenv("AGGREGATE_DEFAULT_WINDOW_HOURS", "0"))  # 0: reject instead
+AGGREGATE_MAX_STAGES = int(os.getenv("AGGREGATE_MAX_STAGES", "12"))
+
+FORBIDDEN_STAGES = {"$out", "$merge", "$currentOp", "$listSessions", "$planCacheStats"}
+FORBIDDEN_OPERATORS = {"$where", "$function", "$accumulator"}
+LOOKUP_STAGES = {"$lookup": "from", "$graphLookup": "from", "$unionWith": "coll"}
+# stages MongoDB only accepts as the first stage; they bring their own bounds (or read no documents)
+FIRST_STAGE_ONLY = {"$geoNear", "$collStats", "$indexStats", "$documents"}
+
+# leading fields that hit an index (see metar_normalize.ensure_metar_indexes)
+INDEXED_FIELDS = {"stationICAO", "stationIATA", "timestamp", CLOUD_TOKENS_FIELD, FIR_TOKENS_FIELD} | {
+    f"{NUMERIC_PREFIX}.{field}" for field in NUMERIC_FIELDS.values()
+}
+
+
+class AggregationPolicyError(ValueError):
+    """Pipeline rejected by the aggregation policy."""
+
+
+def _contains_operator(value: Any, operators: set) -> bool:
+    if isinstance(value, dict):
+        return any(k in operators or _contains_operator(v, operators) for k, v in value.items())
+    if isinstance(value, list):
+        return any(_contains_operator(v, operators) for v in value)
+    return False
+
+
+def _lookup_target(stage_name: str, spec: Any) -> Any:
+    if stage_name == "$unionWith" and isinstance(spec, str):
+        return spec
+    if isinstance(spec, dict):
+        return spec.get(LOOKUP_STAGES[stage_name])
+    return None
+
+
+def _match_uses_index(match: Dict) -> bool:
+    """True when the filter can be served by an index: an indexed field at the top
+    level or in any $and clause, or in every $or branch."""
+    for field, value in match.items():
+        if field in INDEXED_FIELDS:
+            return True
+        if field == "$and" and isinstance(value, list):
+            if any(isinstance(clause, dict) and _match_uses_index(clause) for clause in value):
+                return True
+        if field == "$or" and isinstance(value, list) and value:
+            if all(isinstance(clause, dict) and _match_uses_index(clause) for clause in value):
+                return True
+    return False
+
+
+def _check_stages(pipeline: List[Dict], collection_name: str) -> None:
+    """Reject forbidden stages, including inside $lookup/$unionWith sub-pipelines and $facet."""
+    for stage in pipeline:
+        if not isinstance(stage, dict):
+            raise AggregationPolicyError("Pipeline stages must be objects")
+        for stage_name, spec in stage.items():
+            if stage_name in FORBIDDEN_STAGES:
+                raise AggregationPolicyError(f"Stage {stage_name} is not allowed")
+            if stage_name in LOOKUP_STAGES:
+                if _lookup_target(stage_name, spec) != collection_name:
+                    raise AggregationPolicyError(f"{stage_name} may only read from '{collection_name}'")
+                if isinstance(spec, dict) and isinstance(spec.get("pipeline"), list):
+                    _check_stages(spec["pipeline"], collection_name)
+            if stage_name == "$facet" and isinstance(spec, dict):
+                for sub_pipeline in spec.values():
+                    if isinstance(sub_pipeline, list):
+                        _check_stages(sub_pipeline, collection_name)
+
+
+def prepare_pipeline(pipeline: Any, limit: int, collection_name: str) -> Tuple[List[Dict], List[str]]:
+    """Validate and rewrite a pipeline. Returns (pipeline, list of rewrites applied)."""
+    if isinstance(pipeline, dict):
+        pipeline = [pipeline]
+    if not isinstance(pipeline, list) or not all(isinstance(stage, dict) and len(stage) == 1 for stage in pipeline):
+        raise AggregationPolicyError("Pipeline must be a JSON list of single-key stage objects")
+    if len(pipeline) > AGGREGATE_MAX_STAGES:
+        raise AggregationPolicyError(f"Pipeline has {len(pipeline)} stages (max {AGGREGATE_MAX_STAGES})")
+
+    _check_stages(pipeline, collection_name)
+    if _contains_operator(pipeline, FORBIDDEN_OPERATORS):
+        raise AggregationPolicyError("Server-side JavaScript ($where/$function/$accumulator) is not allowed")
+
+    rewrites = []
+    rewritten = list(pipeline)
+
+    first_name, first_spec = next(iter(rewritten[0].items())) if rewritten else (None, None)
+    indexed_start = first_name == "$match" and isinstance(first_spec, dict) and _match_uses_index(first_spec)
+    if not indexed_start and first_name not in FIRST_STAGE_ONLY:
+        if AGGREGATE_DEFAULT_WINDOW_HOURS <= 0:
+            raise AggregationPolicyError(
+                "Pipeline must start with a $match on an indexed field so it doesn't scan the whole "
+                f"collection; indexed fields: {', '.join(sorted(INDEXED_FIELDS))}. "
+                'For example: {"$match": {"stationICAO": "VOBL"}}'
+            )
+        since = datetime.now(timezone.utc) - timedelta(hours=AGGREGATE_DEFAULT_WINDOW_HOURS)
+        rewritten.insert(0, {"$match": {"timestamp": {"$gte": since}}})
+        rewrites.append(f"prepended $match timestamp >= last {AGGREGATE_DEFAULT_WINDOW_HOURS}h (no indexed leading $match)")
+
+    last_name, last_spec = next(iter(rewritten[-1].items()))
+    if not (last_name == "$limit" and isinstance(last_spec, int) and last_spec <= limit):
+        rewritten.append({"$limit": limit})
+        rewrites.append(f"appended $limit {limit}")
+
+    return rewritten, rewrites
+
+
+async def run_bounded_aggregate(collection, pipeline: Any, limit: int) -> Tuple[List[Dict], Dict[str, Any]]:
+    """Run a policy-checked pipeline. Raises AggregationPolicyError or the driver's errors."""
+    prepared, rewrites = prepare_pipeline(pipeline, limit, collection.name)
+
+    t0 = time.perf_counter()
+    cursor = collection.aggregate(
+        prepared,
+        maxTimeMS=AGGREGATE_MAX_TIME_MS,
+        allowDiskUse=AGGREGATE_ALLOW_DISK_USE,
+    )
+    results = await cursor.to_list(length=limit)
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+
+    cost = {
+        "stages": [next(iter(stage)) for stage in prepared],
+        "rewrites": rewrites,
+        "elapsed_ms": round(elapsed_ms, 1),
+        "returned": len(results),
+        "max_time_ms": AGGREGATE_MAX_TIME_MS,
+        "allow_disk_use": AGGREGATE_ALLOW_DISK_USE,
+    }
+    logger.info(f"Bounded aggregate cost: {cost}")
+    return results, cost
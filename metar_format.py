@@ -0,0 +1,115 @@
+"""
+Formatting of METAR documents for tool responses.
+
+Two modes:
+  - "text":  the verbose per-document layout (one block per report)
+  - "table": one row per report with fixed columns, TOON-encoded like
+             raw_mongodb_query_aggregate's output; column names are sent
+             once instead of repeated labels per report, so multi-station
+             answers cost far fewer tokens
+
+Both build output in a list of parts and join once at the end.
+"""
+from typing import Dict, Iterable, List
+
+from toon import encode
+
+OUTPUT_FORMATS = ("table", "text")
+
+TABLE_COLUMNS = [
+    "station", "iata", "updated", "temp", "dewpoint", "wind", "windDir",
+    "visibility", "qnh", "clouds", "weather", "raw",
+]
+
+
+def _observation(metar_doc: Dict) -> Dict:
+    metar = metar_doc.get("metar") or {}
+    return (metar.get("decodedData") or {}).get("observation") or {}
+
+
+def _write_metar_text(parts: List[str], metar_doc: Dict) -> None:
+    station = metar_doc.get('stationICAO', 'Unknown')
+    iata = metar_doc.get('stationIATA', 'N/A')
+    processed_timestamp = metar_doc.get('processed_timestamp', 'Unknown')
+
+    parts.append(f"🛩️  Station: {station}")
+    if iata:
+        parts.append(f" ({iata})")
+    parts.append(f"\n Last Updated: {processed_timestamp}\n")
+
+    if metar_doc.get('hasMetarData') and 'metar' in metar_doc:
+        metar = metar_doc['metar']
+        parts.append(f" Raw METAR: {metar.get('rawData', 'N/A')}\n")
+
+        if 'decodedData' in metar and 'observation' in metar['decodedData']:
+            obs = metar['decodedData']['observation']
+            parts.append("\n Weather Conditions:\n")
+            parts.append(f"   Temperature: {obs.get('airTemperature', 'N/A')}\n")
+            parts.append(f"   Dewpoint: {obs.get('dewpointTemperature', 'N/A')}\n")
+            parts.append(f"   Wind: {obs.get('windSpeed', 'N/A')} from {obs.get('windDirection', 'N/A')}\n")
+            parts.append(f"   Visibility: {obs.get('horizontalVisibility', 'N/A')}\n")
+            parts.append(f"   Pressure: {obs.get('observedQNH', 'N/A')}\n")
+
+            if obs.get('cloudLayers'):
+                parts.append(f"   Clouds: {', '.join(obs['cloudLayers'])}\n")
+
+            if obs.get('weatherConditions'):
+                parts.append(f"   Weather: {obs['weatherConditions']}\n")
+
+    if metar_doc.get('hasTaforData') and 'tafor' in metar_doc:
+        parts.append(f"\n📊 TAF: {metar_doc['tafor'].get('rawData', 'N/A')}\n")
+
+
+def format_metar_data(metar_doc: Dict) -> str:
+    """Format METAR data into a readable string."""
+    parts: List[str] = []
+    _write_metar_text(parts, metar_doc)
+    return "".join(parts)
+
+
+def metar_row(metar_doc: Dict) -> Dict:
+    """Flat row (TABLE_COLUMNS) for one METAR document."""
+    metar = metar_doc.get("metar") or {}
+    obs = _observation(metar_doc)
+    clouds = obs.get("cloudLayers")
+    weather = obs.get("weatherConditions")
+    return {
+        "station": metar_doc.get("stationICAO", ""),
+        "iata": metar_doc.get("stationIATA") or "",
+        "updated": str(metar_doc.get("processed_timestamp") or metar.get("updatedTime") or ""),
+        "temp": obs.get("airTemperature", ""),
+        "dewpoint": obs.get("dewpointTemperature", ""),
+        "wind": obs.get("windSpeed", ""),
+        "windDir": obs.get("windDirection", ""),
+        "visibility": obs.get("horizontalVisibility", ""),
+        "qnh": obs.get("observedQNH", ""),
+        "clouds": " ".join(clouds) if isinstance(clouds, list) else (clouds or ""),
+        "weather": " ".join(weather) if isinstance(weather, list) else (weather or ""),
+        "raw": metar.get("rawData", ""),
+    }
+
+
+def format_metar_results(docs: Iterable[Dict], header: str, output_format: str = "table") -> str:
+    """Render a list of METAR documents under a header line."""
+    docs = list(docs)
+    parts: List[str] = [header]
+
+    if output_format == "text":
+        parts.append("=" * 80 + "\n\n")
+        for i, doc in enumerate(docs, 1):
+            parts.append(f"--- Result {i} ---\n")
+            _write_metar_text(parts, doc)
+            parts.append("\n")
+    else:
+        rows = [metar_row(doc) for doc in docs]
+        taf_rows = [
+            {"station": doc.get("stationICAO", ""), "taf": doc["tafor"].get("rawData", "")}
+            for doc in docs
+            if doc.get("hasTaforData") and doc.get("tafor")
+        ]
+        payload = {"metar": rows}
+        if taf_rows:
+            payload["taf"] = taf_rows
+        parts.append(encode(payload))
+
+    return "".join(parts)
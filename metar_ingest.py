@@ -0,0 +1,419 @@
+"""
+Bulk METAR/TAF ingestion.
+
+Takes batches of raw reports (a file, an asyncio queue, or the
+`bulk_add_metar_data` tool), decodes each one once into the stored
+`metar.decodedData.observation` shape and writes the batch with a single
+unordered `bulk_write`:
+  - METAR documents are upserted keyed by stationICAO + observation time
+    (`timestamp`), so re-sending a report is a no-op; with
+    METAR_STORAGE=timeseries (no upserts on time-series collections) the
+    reports already stored under that key are dropped and the rest inserted
+  - the normalised search fields (metar_normalize) are written in the same
+    document, so no backfill is needed
+  - the per-station latest view (metar_latest) is updated with one more
+    bulk_write, using the newest report per station in the batch
+
+Report format: one report per line; TAF lines start with "TAF". A TAF is
+attached to the station's METARs in the same batch and to the latest view.
+
+Usage:
+    python metar_ingest.py reports.txt
+"""
+import asyncio
+import logging
+import os
+import re
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from metar_normalize import normalized_fields
+from metar_latest import COLLECTION_METAR_LATEST, latest_update_op
+from metar_timeseries import METAR_STORAGE, drop_already_stored
+
+logger = logging.getLogger(__name__)
+
+INGEST_BATCH_SIZE = int(os.getenv("METAR_INGEST_BATCH_SIZE", "500"))
+INGEST_FLUSH_SECONDS = float(os.getenv("METAR_INGEST_FLUSH_SECONDS", "2"))
+
+_STATION_RE = re.compile(r"^[A-Z]{4}$")
+_TIME_RE = re.compile(r"^(\d{2})(\d{2})(\d{2})Z$")
+_WIND_RE = re.compile(r"^(\d{3}|VRB)(\d{2,3})(?:G(\d{2,3}))?(KT|MPS)$")
+_VIS_RE = re.compile(r"^(\d{4})(NDV)?$")
+_TEMP_RE = re.compile(r"^(M?\d{2})/(M?\d{2})?$")
+_QNH_RE = re.compile(r"^([QA])(\d{4})$")
+_CLOUD_RE = re.compile(r"^(FEW|SCT|BKN|OVC|VV|///)(\d{3}|///)(CB|TCU|///)?$")
+_NO_CLOUD = {"NSC", "SKC", "CLR", "NCD"}
+_WEATHER_RE = re.compile(
+    r"^(\+|-|VC)?(MI|PR|BC|DR|BL|SH|TS|FZ)?"
+    r"((DZ|RA|SN|SG|IC|PL|GR|GS|UP|BR|FG|FU|VA|DU|SA|HZ|PY|PO|SQ|FC|SS|DS)+)$"
+)
+_TREND = {"NOSIG", "BECMG", "TEMPO", "RMK"}
+# wind is stored in m/s, the unit the search tool's wind filters take
+_KT_TO_MPS = 0.514444
+
+
+class MetarDecodeError(ValueError):
+    """Raised for a report that can't be keyed (no station or observation time)."""
+
+
+def observation_time(ddhhmm: str, reference: datetime) -> datetime:
+    """
+    Resolve a DDHHMMZ group against `reference` (UTC): the report is from the
+    reference month, or the previous one when its day is in the future.
+    """
+    match = _TIME_RE.match(ddhhmm)
+    if not match:
+        raise MetarDecodeError(f"Bad observation time group: {ddhhmm}")
+    day, hour, minute = (int(g) for g in match.groups())
+    year, month = reference.year, reference.month
+    for _ in range(2):
+        try:
+            candidate = datetime(year, month, day, hour, minute)
+        except ValueError:
+            candidate = None
+        if candidate is not None and candidate <= reference.replace(tzinfo=None) + timedelta(hours=1):
+            return candidate
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    raise MetarDecodeError(f"Observation time {ddhhmm} doesn't fit the current or previous month")
+
+
+def _wind_mps(value: str, unit: str) -> str:
+    speed = int(value) * _KT_TO_MPS if unit == "KT" else int(value)
+    return f"{round(speed, 1):g} m/s"
+
+
+def report_station(raw: str) -> Optional[str]:
+    """ICAO code of a raw METAR/TAF line without decoding the rest, or None."""
+    for token in raw.split():
+        if token in ("METAR", "SPECI", "TAF", "AMD", "COR", "AUTO"):
+            continue
+        return token if _STATION_RE.match(token) else None
+    return None
+
+
+def decode_metar(raw: str, reference: Optional[datetime] = None) -> Tuple[str, datetime, Dict]:
+    """Decode a raw METAR into (station ICAO, observation time, decoded observation)."""
+    reference = reference or datetime.now(timezone.utc)
+    tokens = raw.strip().rstrip("=").split()
+    if tokens and tokens[0] in ("METAR", "SPECI"):
+        tokens = tokens[1:]
+    if tokens and tokens[0] in ("COR", "AUTO"):
+        tokens = tokens[1:]
+    if len(tokens) < 2 or not _STATION_RE.match(tokens[0]):
+        raise MetarDecodeError(f"No station in report: {raw[:40]}")
+
+    station = tokens[0]
+    observed = observation_time(tokens[1], reference)
+
+    obs: Dict = {}
+    clouds: List[str] = []
+    weather: List[str] = []
+    for token in tokens[2:]:
+        if token in _TREND:
+            break
+        if token in ("AUTO", "COR"):
+            continue
+        if "windSpeed" not in obs and (m := _WIND_RE.match(token)):
+            direction, speed, gust, unit = m.groups()
+            obs["windDirection"] = direction
+            obs["windSpeed"] = _wind_mps(speed, unit)
+            if gust:
+                obs["windGust"] = _wind_mps(gust, unit)
+        elif token == "CAVOK":
+            obs["horizontalVisibility"] = "CAVOK"
+        elif "horizontalVisibility" not in obs and (m := _VIS_RE.match(token)):
+            obs["horizontalVisibility"] = m.group(1)
+        elif m := _TEMP_RE.match(token):
+            obs["airTemperature"] = m.group(1)
+            if m.group(2):
+                obs["dewpointTemperature"] = m.group(2)
+        elif m := _QNH_RE.match(token):
+            kind, value = m.groups()
+            obs["observedQNH"] = f"{int(value)} hPa" if kind == "Q" else f"{int(value) / 100:.2f} inHg"
+        elif _CLOUD_RE.match(token):
+            clouds.append(token)
+        elif token in _NO_CLOUD:
+            clouds.append(token)
+        elif _WEATHER_RE.match(token):
+            weather.append(token)
+
+    if clouds:
+        obs["cloudLayers"] = clouds
+    if weather:
+        obs["weatherConditions"] = " ".join(weather)
+    return station, observed, obs
+
+
+def decode_taf(raw: str, reference: Optional[datetime] = None) -> Tuple[str, Optional[datetime]]:
+    """Station ICAO and issue time of a raw TAF."""
+    reference = reference or datetime.now(timezone.utc)
+    tokens = raw.strip().rstrip("=").split()
+    tokens = [t for t in tokens if t not in ("TAF", "AMD", "COR")]
+    if not tokens or not _STATION_RE.match(tokens[0]):
+        raise MetarDecodeError(f"No station in TAF: {raw[:40]}")
+    issued = None
+    if len(tokens) > 1 and _TIME_RE.match(tokens[1]):
+        issued = observation_time(tokens[1], reference)
+    return tokens[0], issued
+
+
+def build_metar_document(
+    raw_metar: str,
+    tafs: Optional[Dict[str, Dict]] = None,
+    stations: Optional[Dict[str, Dict]] = None,
+    reference: Optional[datetime] = None,
+    processed_at: Optional[datetime] = None,
+) -> Dict:
+    """
+    Full stored document for one raw METAR, including the normalised search fields.
+    `tafs` / `stations` are keyed by ICAO: the station's TAF and its IATA code / FIR.
+    """
+    raw_metar = " ".join(raw_metar.split()).rstrip("=")
+    station, observed, obs = decode_metar(raw_metar, reference)
+    station_info = (stations or {}).get(station) or {}
+    taf = (tafs or {}).get(station)
+    processed_at = processed_at or datetime.now(timezone.utc)
+
+    doc = {
+        "stationICAO": station,
+        "stationIATA": station_info.get("stationIATA"),
+        "timestamp": observed,
+        "processed_timestamp": processed_at,
+        "hasMetarData": True,
+        "metar": {
+            "rawData": raw_metar,
+            "updatedTime": observed,
+            "decodedData": {"observation": obs},
+        },
+        "hasTaforData": bool(taf),
+    }
+    if station_info.get("firRegion"):
+        doc["metar"]["firRegion"] = station_info["firRegion"]
+    if taf:
+        doc["tafor"] = taf
+
+    for path, value in normalized_fields(doc).items():
+        doc["metar"][path.split(".", 1)[1]] = value
+    return doc
+
+
+async def load_station_info(db, source: Optional[str] = None, stations: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+    """
+    ICAO -> {stationIATA, firRegion}, to fill in what raw reports don't carry.
+    Read from the latest view; stations it lacks or has incomplete (fresh deploy,
+    never seeded) are looked up in the history collection `source`.
+    `stations` limits both reads to the given ICAO codes.
+    """
+    stations = sorted(set(stations)) if stations is not None else None
+    info = {}
+    query = {"_id": {"$in": stations}} if stations is not None else {}
+    cursor = db[COLLECTION_METAR_LATEST].find(query, {"stationIATA": 1, "metar.firRegion": 1})
+    async for doc in cursor:
+        info[doc["_id"]] = {
+            "stationIATA": doc.get("stationIATA"),
+            "firRegion": (doc.get("metar") or {}).get("firRegion"),
+        }
+    if not source:
+        return info
+
+    complete = [icao for icao, fields in info.items() if fields["stationIATA"] and fields["firRegion"]]
+    if stations is not None:
+        missing = [icao for icao in stations if icao not in complete]
+        if not missing:
+            return info
+        match = {"stationICAO": {"$in": missing}}
+    else:
+        match = {"stationICAO": {"$ne": None, "$nin": complete}}
+    pipeline = [
+        {"$match": match},
+        # $max skips nulls: any report that carried the code is enough
+        {"$group": {"_id": "$stationICAO", "stationIATA": {"$max": "$stationIATA"}, "firRegion": {"$max": "$metar.firRegion"}}},
+    ]
+    async for row in db[source].aggregate(pipeline, allowDiskUse=True):
+        fields = info.setdefault(row["_id"], {"stationIATA": None, "firRegion": None})
+        fields["stationIATA"] = fields["stationIATA"] or row.get("stationIATA")
+        fields["firRegion"] = fields["firRegion"] or row.get("firRegion")
+    return info
+
+
+def _metar_upsert_op(doc: Dict) -> UpdateOne:
+    fields = dict(doc)
+    processed = fields.pop("processed_timestamp")
+    return UpdateOne(
+        {"stationICAO": doc["stationICAO"], "timestamp": doc["timestamp"]},
+        {"$set": fields, "$setOnInsert": {"processed_timestamp": processed}},
+        upsert=True,
+    )
+
+
+def _ignore_duplicate_keys(e: BulkWriteError) -> None:
+    # concurrent writers can collide on upsert; anything else is a real error
+    others = [err for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+    if others:
+        raise e
+
+
+async def ingest_batch(db, collection: str, reports: Iterable[str], station_info: Optional[Dict] = None) -> Dict:
+    """
+    Decode and write one batch of raw METAR/TAF lines. Returns counts:
+    received, decoded, upserted, matched, rejected, latest_updated.
+    """
+    # one UTC clock for both the observation-time reference and processed_timestamp
+    reference = processed_at = datetime.now(timezone.utc)
+    station_info = station_info or {}
+
+    metars: List[str] = []
+    tafs: Dict[str, Dict] = {}
+    received = rejected = 0
+    for line in reports:
+        line = line.strip()
+        if not line:
+            continue
+        received += 1
+        if line.startswith("TAF"):
+            try:
+                station, issued = decode_taf(line, reference)
+            except MetarDecodeError as e:
+                rejected += 1
+                logger.warning(f"Rejected TAF: {e}")
+                continue
+            tafs[station] = {"rawData": " ".join(line.split()).rstrip("="), "issueTime": issued}
+        else:
+            metars.append(line)
+
+    docs: Dict[Tuple[str, datetime], Dict] = {}
+    for raw in metars:
+        try:
+            doc = build_metar_document(raw, tafs, station_info, reference, processed_at)
+        except MetarDecodeError as e:
+            rejected += 1
+            logger.warning(f"Rejected METAR: {e}")
+            continue
+        # the same report twice in a batch -> keep the last one
+        docs[(doc["stationICAO"], doc["timestamp"])] = doc
+
+    counts = {"received": received, "decoded": len(docs), "upserted": 0, "matched": 0,
+              "rejected": rejected, "latest_updated": 0}
+    if docs:
+        if METAR_STORAGE == "timeseries":
+            new_docs = await drop_already_stored(db, collection, list(docs.values()))
+            if new_docs:
+                result = await db[collection].insert_many(new_docs, ordered=False)
+                counts["upserted"] = len(result.inserted_ids)
+            counts["matched"] = len(docs) - len(new_docs)
+        else:
+            try:
+                result = await db[collection].bulk_write([_metar_upsert_op(d) for d in docs.values()], ordered=False)
+                counts["upserted"], counts["matched"] = result.upserted_count, result.matched_count
+            except BulkWriteError as e:
+                _ignore_duplicate_keys(e)
+
+    # latest view: newest report per station only, so upserts in one batch don't collide
+    newest: Dict[str, Dict] = {}
+    for doc in docs.values():
+        current = newest.get(doc["stationICAO"])
+        if current is None or doc["timestamp"] > current["timestamp"]:
+            newest[doc["stationICAO"]] = doc
+    latest_ops = [op for op in (latest_update_op(d) for d in newest.values()) if op is not None]
+    # TAFs for stations without a METAR in this batch
+    for station, taf in tafs.items():
+        if station not in newest:
+            latest_ops.append(UpdateOne({"_id": station}, {"$set": {"tafor": taf, "hasTaforData": True}}))
+    if latest_ops:
+        try:
+            result = await db[COLLECTION_METAR_LATEST].bulk_write(latest_ops, ordered=False)
+            counts["latest_updated"] = result.upserted_count + result.modified_count
+        except BulkWriteError as e:
+            _ignore_duplicate_keys(e)
+
+    logger.info(f"METAR ingest batch: {counts}")
+    return counts
+
+
+async def ingest_stream(db, collection: str, reports: AsyncIterable[str], batch_size: int = INGEST_BATCH_SIZE,
+                        flush_seconds: float = INGEST_FLUSH_SECONDS) -> Dict:
+    """Ingest an async stream of report lines in batches of `batch_size` (or every `flush_seconds`)."""
+    station_info = await load_station_info(db, collection)
+    totals: Dict[str, int] = {}
+    batch: List[str] = []
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + flush_seconds
+
+    async def flush():
+        nonlocal batch, deadline
+        if batch:
+            for key, value in (await ingest_batch(db, collection, batch, station_info)).items():
+                totals[key] = totals.get(key, 0) + value
+            batch = []
+        deadline = loop.time() + flush_seconds
+
+    # a partial batch is written once `flush_seconds` pass even if no further line arrives;
+    # the pending read is awaited again rather than cancelled (cancelling would end the generator)
+    lines = reports.__aiter__()
+    pending = None
+    while True:
+        if pending is None:
+            pending = asyncio.ensure_future(lines.__anext__())
+        done, _ = await asyncio.wait({pending}, timeout=max(0.0, deadline - loop.time()) if batch else None)
+        if not done:
+            await flush()
+            continue
+        try:
+            line = pending.result()
+        except StopAsyncIteration:
+            break
+        pending = None
+        if not batch:
+            deadline = loop.time() + flush_seconds
+        batch.append(line)
+        if len(batch) >= batch_size or loop.time() >= deadline:
+            await flush()
+    await flush()
+    return totals
+
+
+async def queue_reports(queue: asyncio.Queue) -> AsyncIterable[str]:
+    """Async iterator over a queue of report lines; a None item ends the stream."""
+    while True:
+        item = await queue.get()
+        try:
+            if item is None:
+                return
+            yield item
+        finally:
+            queue.task_done()
+
+
+async def file_reports(path: str) -> AsyncIterable[str]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            yield line
+
+
+async def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from metar_timeseries import COLLECTION_METAR_TS
+
+    load_dotenv()
+    if len(sys.argv) < 2:
+        print("Usage: python metar_ingest.py <reports.txt>")
+        return
+    collection = COLLECTION_METAR_TS if METAR_STORAGE == "timeseries" else os.getenv("COLLECTION_METAR", "metar_data")
+    client = AsyncIOMotorClient(os.getenv("MONGODB_URL", "mongodb://localhost:27017"))
+    db = client[os.getenv("DATABASE_NAME", "metar_data")]
+    try:
+        totals = await ingest_stream(db, collection, file_reports(sys.argv[1]))
+        logger.info(f"Ingest complete: {totals}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
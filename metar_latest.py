@@ -0,0 +1,153 @@
+"""
+Latest METAR per station, as a small materialised collection.
+
+One document per station (`_id` = ICAO code) holding that station's most
+recent report. "Current weather at X" becomes a point read and "current
+weather everywhere" a full read of a few hundred small documents, instead
+of sort-by-timestamp queries against the history.
+
+The view is kept up to date by:
+  - writers calling `latest_update_op` / `upsert_latest` on insert
+  - optionally, `watch_latest` following inserts made by other services
+    through a change stream (METAR_LATEST_WATCH=1; needs a replica set and a
+    regular collection, time-series collections have no change streams)
+and can be rebuilt from scratch with `rebuild_latest`.
+
+Most reports are written by an external service, so the view is only
+complete and current while `watch_latest` is running. `get_current` reads
+the view in that case and otherwise answers from the history collection
+(indexed station/timestamp reads), so a stopped or disabled watcher can't
+leave stale answers behind.
+"""
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_METAR_LATEST = os.getenv("COLLECTION_METAR_LATEST", "metar_latest")
+METAR_LATEST_WATCH = os.getenv("METAR_LATEST_WATCH", "0") == "1"
+
+
+def _latest_fields(doc: Dict) -> Dict:
+    latest = dict(doc)
+    latest.pop("_id", None)
+    latest["source_id"] = doc.get("_id")
+    return latest
+
+
+def _newer_filter(doc: Dict) -> Dict:
+    # only replace when the incoming report is newer (or the station has none yet)
+    return {
+        "_id": doc["stationICAO"],
+        "$or": [
+            {"timestamp": {"$lt": doc["timestamp"]}},
+            {"timestamp": {"$exists": False}},
+        ],
+    }
+
+
+def latest_update_op(doc: Dict) -> Optional[UpdateOne]:
+    """UpdateOne for a bulk_write into the latest view, or None if the doc can't be keyed."""
+    if not doc.get("stationICAO") or doc.get("timestamp") is None:
+        return None
+    return UpdateOne(_newer_filter(doc), {"$set": _latest_fields(doc)}, upsert=True)
+
+
+async def upsert_latest(latest_collection, doc: Dict) -> bool:
+    """Atomically replace the station's latest report if `doc` is newer. Returns True if updated."""
+    if not doc.get("stationICAO") or doc.get("timestamp") is None:
+        return False
+    try:
+        result = await latest_collection.update_one(_newer_filter(doc), {"$set": _latest_fields(doc)}, upsert=True)
+        return bool(result.modified_count or result.upserted_id)
+    except DuplicateKeyError:
+        # station exists with a newer report: the filter didn't match and the upsert collided
+        return False
+
+
+async def ensure_latest_indexes(latest_collection) -> None:
+    await latest_collection.create_index([("stationIATA", ASCENDING)], name="iata")
+
+
+async def rebuild_latest(db, source: str) -> None:
+    """Recompute the whole view server-side from the history collection."""
+    pipeline = [
+        {"$match": {"stationICAO": {"$ne": None}, "timestamp": {"$ne": None}}},
+        {"$sort": {"stationICAO": 1, "timestamp": -1}},
+        {"$group": {"_id": "$stationICAO", "doc": {"$first": "$$ROOT"}}},
+        {"$replaceRoot": {"newRoot": {"$mergeObjects": ["$doc", {"_id": "$_id", "source_id": "$doc._id"}]}}},
+        {"$merge": {"into": COLLECTION_METAR_LATEST, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+    await db[source].aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+    logger.info(f"Rebuilt {COLLECTION_METAR_LATEST} from {source}")
+
+
+async def get_latest(db, station_icao: str = None, station_iata: str = None) -> List[Dict]:
+    """Latest report(s): one station by ICAO (point read) / IATA, or all stations."""
+    latest = db[COLLECTION_METAR_LATEST]
+    if station_icao:
+        doc = await latest.find_one({"_id": station_icao.upper()})
+        return [doc] if doc else []
+    if station_iata:
+        return await latest.find({"stationIATA": station_iata.upper()}).to_list(length=None)
+    return await latest.find({}).sort("_id", 1).to_list(length=None)
+
+
+async def latest_from_history(db, source: str, station_icao: str = None, station_iata: str = None) -> List[Dict]:
+    """Latest report(s) read straight from the history collection, same shape as `get_latest`."""
+    history = db[source]
+    if station_icao:
+        doc = await history.find_one({"stationICAO": station_icao.upper()}, sort=[("timestamp", -1)])
+        return [doc] if doc else []
+    if station_iata:
+        return await history.find({"stationIATA": station_iata.upper()}).sort("timestamp", -1).limit(1).to_list(1)
+    # $sort + $group/$first on the station_timestamp index: one index walk per station
+    pipeline = [
+        {"$match": {"stationICAO": {"$ne": None}, "timestamp": {"$ne": None}}},
+        {"$sort": {"stationICAO": 1, "timestamp": -1}},
+        {"$group": {"_id": "$stationICAO", "doc": {"$first": "$$ROOT"}}},
+        {"$replaceRoot": {"newRoot": "$doc"}},
+        {"$sort": {"stationICAO": 1}},
+    ]
+    return await history.aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+
+
+async def get_current(db, source: str, station_icao: str = None, station_iata: str = None, live: bool = False) -> List[Dict]:
+    """
+    Current report(s) for the tools. `live` says the view is complete and followed
+    by `watch_latest`; without it the view may be behind, so history is read instead.
+    """
+    if live:
+        return await get_latest(db, station_icao, station_iata)
+    return await latest_from_history(db, source, station_icao, station_iata)
+
+
+async def watch_latest(db, source: str, live: Optional[asyncio.Event] = None) -> None:
+    """
+    Background task: follow inserts into the history collection and update the view.
+    The view is rebuilt once the stream is open (so no insert falls in between) and
+    `live` is set from then on; it is cleared while the stream is down.
+    """
+    latest = db[COLLECTION_METAR_LATEST]
+    while True:
+        try:
+            async with db[source].watch([{"$match": {"operationType": "insert"}}]) as stream:
+                logger.info(f"Watching {source} inserts for {COLLECTION_METAR_LATEST}")
+                await rebuild_latest(db, source)
+                if live is not None:
+                    live.set()
+                async for change in stream:
+                    await upsert_latest(latest, change["fullDocument"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Latest-view change stream failed, retrying in 30s: {e}", exc_info=True)
+        finally:
+            if live is not None:
+                live.clear()
+        await asyncio.sleep(30)
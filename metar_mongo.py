@@ -0,0 +1,168 @@
+"""
+Mongo client for the METAR server: pool sizing from config, warm-up and pool metrics.
+
+The client is created once in the server's ASGI lifespan (see http_app.py).
+It is warmed up before the first request and closed on shutdown, and its
+connection pool is observed through a pymongo `ConnectionPoolListener` so
+that /health can report pool usage and checkout wait times.
+
+Config:
+    MONGO_MAX_POOL_SIZE                 (default 50)
+    MONGO_MIN_POOL_SIZE                 (default 5)   connections kept open
+    MONGO_MAX_IDLE_TIME_MS              (default 300000)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS         (default 5000) max wait for a free connection
+    MONGO_SERVER_SELECTION_TIMEOUT_MS   (default 5000)
+    MONGO_CONNECT_TIMEOUT_MS            (default 5000)
+    MONGO_PREWARM_CONNECTIONS           (default = min pool size)
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_PREWARM_CONNECTIONS = int(os.getenv("MONGO_PREWARM_CONNECTIONS", str(MONGO_MIN_POOL_SIZE)))
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Connection pool counters and checkout wait times.
+    pymongo calls these from its own threads, hence the lock.
+    """
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._waits_ms = deque(maxlen=window)
+        self._pending: Dict[int, float] = {}
+        self.connections_open = 0
+        self.checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures: Dict[str, int] = {}
+        self.pool_clears = 0
+
+    # pool
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    # connections
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_open = max(0, self.connections_open - 1)
+
+    # checkouts
+    def connection_check_out_started(self, event):
+        # older pymongo has no event.duration: time from the start event, per thread
+        with self._lock:
+            self._pending[threading.get_ident()] = _now_ms()
+
+    def connection_check_out_failed(self, event):
+        reason = str(getattr(event, "reason", "unknown"))
+        with self._lock:
+            self._pending.pop(threading.get_ident(), None)
+            self.checkout_failures[reason] = self.checkout_failures.get(reason, 0) + 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            started = self._pending.pop(threading.get_ident(), None)
+            duration = getattr(event, "duration", None)  # seconds, pymongo >= 4.7
+            if duration is not None:
+                wait_ms = duration * 1000
+            elif started is not None:
+                wait_ms = _now_ms() - started
+            else:
+                wait_ms = None
+            if wait_ms is not None:
+                self._waits_ms.append(wait_ms)
+            self.checkouts += 1
+            self.checked_out += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            waits = sorted(self._waits_ms)
+            failures = dict(self.checkout_failures)
+            snapshot = {
+                "max_pool_size": MONGO_MAX_POOL_SIZE,
+                "min_pool_size": MONGO_MIN_POOL_SIZE,
+                "connections_open": self.connections_open,
+                "checked_out": self.checked_out,
+                "checkouts": self.checkouts,
+                "checkout_failures": failures,
+                "pool_clears": self.pool_clears,
+            }
+        if waits:
+            snapshot["checkout_wait_ms"] = {
+                "p50": round(_percentile(waits, 0.50), 3),
+                "p95": round(_percentile(waits, 0.95), 3),
+                "max": round(waits[-1], 3),
+                "samples": len(waits),
+            }
+        return snapshot
+
+
+def _now_ms() -> float:
+    return time.perf_counter() * 1000
+
+
+def _percentile(sorted_values, q: float) -> float:
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def create_mongo_client(url: str, metrics: Optional[PoolMetrics] = None) -> AsyncIOMotorClient:
+    """Motor client with pool settings from config and (optionally) the metrics listener attached."""
+    return AsyncIOMotorClient(
+        url,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        event_listeners=[metrics] if metrics else [],
+    )
+
+
+async def prewarm(client: AsyncIOMotorClient, connections: int = MONGO_PREWARM_CONNECTIONS) -> None:
+    """
+    Do server selection and open `connections` pool connections up front
+    (concurrent pings each need their own connection), so the first tool
+    calls after a deploy don't pay for it.
+    """
+    await client.admin.command("ping")
+    if connections > 1:
+        await asyncio.gather(*(client.admin.command("ping") for _ in range(connections)))
+    logger.info(f"MongoDB connection pool warmed ({connections} connections)")
@@ -0,0 +1,258 @@
+"""
+Write-time normalisation of METAR documents for indexed search.
+
+The decoded observation (`metar.decodedData.observation`) stores values as
+strings ("30", "M02", "9999", "1008 hPa"...). Range filters on strings are
+lexicographic ("9" > "10") and cannot use a numeric index, so writers store
+a parallel numeric copy under `metar.numeric` and the search tool filters on
+that instead.
+
+Cloud groups and FIR names are likewise tokenised into indexed arrays
+(`metar.cloudTokens`, `metar.firTokens`) so the search tool can use
+equality / $all lookups instead of unanchored case-insensitive regexes.
+Documents not normalised yet (no `metar.normVersion`) still match through
+the old regex filters, reached via the norm_version index.
+
+Old documents are filled in with `backfill_numeric_fields`. Reports written
+by the external METAR service carry none of these fields, so the server
+runs `normalize_loop` in the background to fill them in within
+METAR_NORMALIZE_INTERVAL_SECONDS of the insert.
+
+Usage (one-off backfill + index creation):
+    python metar_normalize.py
+"""
+import asyncio
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+NUMERIC_PREFIX = "metar.numeric"
+CLOUD_TOKENS_FIELD = "metar.cloudTokens"
+FIR_TOKENS_FIELD = "metar.firTokens"
+NORM_VERSION_FIELD = "metar.normVersion"
+
+# bump when normalized_fields() starts writing something new; the backfill
+# re-processes every document below this version
+NORMALIZATION_VERSION = 3
+
+NORMALIZE_INTERVAL_SECONDS = int(os.getenv("METAR_NORMALIZE_INTERVAL_SECONDS", "60"))
+
+# decoded observation field -> numeric field under metar.numeric
+NUMERIC_FIELDS = {
+    "airTemperature": "airTemperature",
+    "dewpointTemperature": "dewpointTemperature",
+    "windSpeed": "windSpeed",
+    "horizontalVisibility": "horizontalVisibility",
+    "observedQNH": "observedQNH",
+}
+
+_NUMBER_RE = re.compile(r"[-+]?\d+(?:\.\d+)?")
+
+# FEW020, SCT030CB, BKN015TCU, OVC008, VV002, ///015CB, FEW///, //////CB, SCT030///
+# (whole whitespace-separated groups: \b can't sit next to a "/")
+_CLOUD_GROUP_RE = re.compile(r"(?<!\S)(FEW|SCT|BKN|OVC|VV|///)(\d{3}|///)/?(CB|TCU|///)?(?!\S)")
+_NO_CLOUD_RE = re.compile(r"\b(NSC|SKC|CLR|NCD|CAVOK)\b")
+_WORD_RE = re.compile(r"[A-Z0-9]+")
+
+
+def to_number(value: Any) -> Optional[float]:
+    """
+    Parse a decoded METAR value into a float.
+    Handles plain numbers, unit suffixes ("1008 hPa", "12 kt"), METAR
+    negatives ("M02") and CAVOK visibility. Returns None when there is no value.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+
+    text = str(value).strip().upper()
+    if not text or text in ("N/A", "NA", "NIL", "//", "///", "////"):
+        return None
+    if text.startswith("CAVOK"):
+        return 9999.0
+
+    match = _NUMBER_RE.search(text)
+    if not match:
+        return None
+    number = float(match.group(0))
+    # METAR style negative temperatures: M02 -> -2
+    if text.startswith("M") and match.start() == 1:
+        number = -number
+    return number
+
+
+def numeric_observation(observation: Dict) -> Dict[str, float]:
+    """Numeric copy of the range-searchable observation fields (missing ones omitted)."""
+    numeric = {}
+    for source, target in NUMERIC_FIELDS.items():
+        number = to_number(observation.get(source))
+        if number is not None:
+            numeric[target] = number
+    return numeric
+
+
+def cloud_tokens(raw_metar: Optional[str]) -> List[str]:
+    """
+    Tokens for the cloud groups in a raw METAR: cover codes (FEW/SCT/BKN/OVC/VV),
+    convective types (CB/TCU), the full groups (e.g. BKN020CB) and NSC/SKC/CAVOK.
+    """
+    if not raw_metar:
+        return []
+    text = raw_metar.upper()
+    tokens = set()
+    for match in _CLOUD_GROUP_RE.finditer(text):
+        cover, _height, convective = match.groups()
+        if cover != "///":
+            tokens.add(cover)
+        if convective and convective != "///":
+            tokens.add(convective)
+        tokens.add(match.group(0))
+    tokens.update(_NO_CLOUD_RE.findall(text))
+    return sorted(tokens)
+
+
+def fir_tokens(fir_region: Optional[str]) -> List[str]:
+    """Upper-cased words of a FIR name without the 'FIR' suffix ('Chennai FIR' -> ['CHENNAI'])."""
+    if not fir_region:
+        return []
+    return [w for w in _WORD_RE.findall(str(fir_region).upper()) if w != "FIR"]
+
+
+def _token_or_regex(field: str, tokens: List[str], raw_field: str, words: List[str]) -> Dict[str, Any]:
+    """Token match on normalised documents, case-insensitive regexes on the raw field otherwise."""
+    indexed = {field: tokens[0]} if len(tokens) == 1 else {field: {"$all": tokens}}
+    if not words:
+        return indexed
+    fallback = {"$and": [{raw_field: {"$regex": re.escape(word), "$options": "i"}} for word in words]}
+    fallback[NORM_VERSION_FIELD] = None
+    return {"$or": [indexed, fallback]}
+
+
+def cloud_query(cloud_type: str) -> Dict[str, Any]:
+    """Filter for the search tool's cloud_type ('CB', 'SCT', 'BKN CB', 'OVC008')."""
+    tokens = cloud_tokens(cloud_type) or _WORD_RE.findall(cloud_type.upper())
+    return _token_or_regex(CLOUD_TOKENS_FIELD, tokens, "metar.rawData", cloud_type.split() or tokens)
+
+
+def fir_query(fir_region: str) -> Dict[str, Any]:
+    """Filter for the search tool's fir_region ('Chennai', 'mumbai fir')."""
+    tokens = fir_tokens(fir_region)
+    return _token_or_regex(FIR_TOKENS_FIELD, tokens, "metar.firRegion", tokens)
+
+
+def normalized_fields(metar_doc: Dict) -> Dict[str, Any]:
+    """
+    `$set` fields to write alongside a METAR document.
+    Writers call this at insert/update time; the backfill uses it for old documents.
+    """
+    metar = metar_doc.get("metar") or {}
+    observation = (metar.get("decodedData") or {}).get("observation") or {}
+    return {
+        NUMERIC_PREFIX: numeric_observation(observation),
+        CLOUD_TOKENS_FIELD: cloud_tokens(metar.get("rawData")),
+        FIR_TOKENS_FIELD: fir_tokens(metar.get("firRegion")),
+        NORM_VERSION_FIELD: NORMALIZATION_VERSION,
+    }
+
+
+def numeric_range(min_value: Optional[float], max_value: Optional[float]) -> Optional[Dict[str, float]]:
+    """Mongo range filter for a numeric field, or None if neither bound is set."""
+    if min_value is None and max_value is None:
+        return None
+    condition = {}
+    if min_value is not None:
+        condition["$gte"] = float(min_value)
+    if max_value is not None:
+        condition["$lte"] = float(max_value)
+    return condition
+
+
+async def ensure_metar_indexes(collection) -> None:
+    """Create (idempotently) the indexes the METAR tools query on."""
+    await collection.create_index(
+        [("stationICAO", ASCENDING), ("timestamp", DESCENDING)],
+        name="station_timestamp",
+    )
+    await collection.create_index(
+        [("stationIATA", ASCENDING), ("timestamp", DESCENDING)],
+        name="iata_timestamp",
+    )
+    await collection.create_index([("timestamp", DESCENDING)], name="timestamp")
+    for field in NUMERIC_FIELDS.values():
+        await collection.create_index(
+            [(f"{NUMERIC_PREFIX}.{field}", ASCENDING), ("timestamp", DESCENDING)],
+            name=f"numeric_{field}_timestamp",
+        )
+    # multikey indexes for the tokenised text fields
+    await collection.create_index(
+        [(CLOUD_TOKENS_FIELD, ASCENDING), ("timestamp", DESCENDING)],
+        name="cloud_tokens_timestamp",
+    )
+    await collection.create_index(
+        [(FIR_TOKENS_FIELD, ASCENDING), ("timestamp", DESCENDING)],
+        name="fir_tokens_timestamp",
+    )
+    # the backfill's "below the current version" scan
+    await collection.create_index([(NORM_VERSION_FIELD, ASCENDING)], name="norm_version")
+    logger.info("METAR indexes ensured on %s", collection.name)
+
+
+async def backfill_numeric_fields(collection, batch_size: int = 1000) -> int:
+    """Write the normalised fields on every document below NORMALIZATION_VERSION. Returns documents updated."""
+    cursor = collection.find(
+        {NORM_VERSION_FIELD: {"$ne": NORMALIZATION_VERSION}},
+        {"metar.decodedData.observation": 1, "metar.rawData": 1, "metar.firRegion": 1},
+    ).batch_size(batch_size)
+
+    updated = 0
+    ops = []
+    async for doc in cursor:
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": normalized_fields(doc)}))
+        if len(ops) >= batch_size:
+            result = await collection.bulk_write(ops, ordered=False)
+            updated += result.modified_count
+            ops = []
+            logger.info("Backfilled %d METAR documents so far", updated)
+    if ops:
+        result = await collection.bulk_write(ops, ordered=False)
+        updated += result.modified_count
+
+    logger.info("Normalisation backfill complete: %d documents updated", updated)
+    return updated
+
+
+async def normalize_loop(collection, interval_seconds: int = NORMALIZE_INTERVAL_SECONDS) -> None:
+    """Background task: normalise documents inserted without the normalised fields."""
+    while True:
+        try:
+            await backfill_numeric_fields(collection)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("METAR normalisation backfill failed: %s", e, exc_info=True)
+        await asyncio.sleep(interval_seconds)
+
+
+async def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv()
+    client = AsyncIOMotorClient(os.getenv("MONGODB_URL", "mongodb://localhost:27017"))
+    collection = client[os.getenv("DATABASE_NAME", "metar_data")][os.getenv("COLLECTION_METAR", "metar_data")]
+    try:
+        await backfill_numeric_fields(collection)
+        await ensure_metar_indexes(collection)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
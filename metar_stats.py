@@ -0,0 +1,109 @@
+"""
+Dataset summary for the METAR station/statistics tools.
+
+All statistics (counts, availability, date range, distinct ICAO/IATA codes)
+come from one `$facet` aggregation. The result is kept as a single document
+in COLLECTION_METAR_SUMMARY and refreshed in the background, so
+`list_available_stations` and `get_metar_statistics` answer from one
+`_id` point read instead of six to eight queries each.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_METAR_SUMMARY = os.getenv("COLLECTION_METAR_SUMMARY", "metar_summary")
+SUMMARY_DOC_ID = "metar_statistics"
+SUMMARY_REFRESH_SECONDS = int(os.getenv("METAR_SUMMARY_REFRESH_SECONDS", "300"))
+
+STATS_PIPELINE = [
+    {
+        "$facet": {
+            "totals": [
+                {
+                    "$group": {
+                        "_id": None,
+                        "total": {"$sum": 1},
+                        "with_metar": {"$sum": {"$cond": [{"$eq": ["$hasMetarData", True]}, 1, 0]}},
+                        "with_taf": {"$sum": {"$cond": [{"$eq": ["$hasTaforData", True]}, 1, 0]}},
+                        "earliest": {"$min": "$metar.updatedTime"},
+                        "latest": {"$max": "$metar.updatedTime"},
+                    }
+                }
+            ],
+            "icao": [
+                {"$match": {"stationICAO": {"$ne": None}}},
+                {"$group": {"_id": "$stationICAO"}},
+                {"$sort": {"_id": 1}},
+            ],
+            "iata": [
+                {"$match": {"stationIATA": {"$ne": None}}},
+                {"$group": {"_id": "$stationIATA"}},
+                {"$sort": {"_id": 1}},
+            ],
+        }
+    }
+]
+
+_refresh_lock = asyncio.Lock()
+
+
+async def compute_metar_summary(collection) -> Dict:
+    """Run the single-pass statistics aggregation over the METAR collection."""
+    rows = await collection.aggregate(STATS_PIPELINE, allowDiskUse=True).to_list(length=1)
+    facets = rows[0] if rows else {}
+    totals = (facets.get("totals") or [{}])[0]
+    return {
+        "_id": SUMMARY_DOC_ID,
+        "total": totals.get("total", 0),
+        "with_metar": totals.get("with_metar", 0),
+        "with_taf": totals.get("with_taf", 0),
+        "earliest": totals.get("earliest"),
+        "latest": totals.get("latest"),
+        "icao_codes": [row["_id"] for row in facets.get("icao", [])],
+        "iata_codes": [row["_id"] for row in facets.get("iata", [])],
+        "refreshed_at": datetime.now(),
+    }
+
+
+async def refresh_metar_summary(db, collection_name: str) -> Dict:
+    summary = await compute_metar_summary(db[collection_name])
+    await db[COLLECTION_METAR_SUMMARY].replace_one({"_id": SUMMARY_DOC_ID}, summary, upsert=True)
+    logger.info(
+        "METAR summary refreshed: %d reports, %d ICAO stations",
+        summary["total"], len(summary["icao_codes"]),
+    )
+    return summary
+
+
+async def get_metar_summary(db, collection_name: str, max_age_seconds: int = SUMMARY_REFRESH_SECONDS * 2) -> Dict:
+    """
+    Point read of the summary document; recomputed only if missing or stale
+    (e.g. the background refresher isn't running).
+    """
+    summary: Optional[Dict] = await db[COLLECTION_METAR_SUMMARY].find_one({"_id": SUMMARY_DOC_ID})
+    if summary and summary.get("refreshed_at") and datetime.now() - summary["refreshed_at"] < timedelta(seconds=max_age_seconds):
+        return summary
+
+    async with _refresh_lock:
+        # another caller may have refreshed while we waited
+        summary = await db[COLLECTION_METAR_SUMMARY].find_one({"_id": SUMMARY_DOC_ID})
+        if summary and summary.get("refreshed_at") and datetime.now() - summary["refreshed_at"] < timedelta(seconds=max_age_seconds):
+            return summary
+        return await refresh_metar_summary(db, collection_name)
+
+
+async def summary_refresh_loop(db, collection_name: str, interval_seconds: int = SUMMARY_REFRESH_SECONDS) -> None:
+    """Background task: keep the summary document fresh."""
+    while True:
+        try:
+            async with _refresh_lock:
+                await refresh_metar_summary(db, collection_name)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"METAR summary refresh failed: {e}", exc_info=True)
+        await asyncio.sleep(interval_seconds)
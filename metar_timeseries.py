@@ -0,0 +1,198 @@
+"""
+Time-series storage for METAR history.
+
+METAR reports are one station reporting every 30/60 minutes, read by
+station + recent window and sorted by `timestamp`, so they are stored in a
+MongoDB time-series collection:
+    timeField = "timestamp", metaField = "stationICAO", granularity = "minutes"
+with `expireAfterSeconds` retention (METAR_RETENTION_DAYS) so old
+observations age out automatically.
+
+The METAR server reads from it when METAR_STORAGE=timeseries. The external
+METAR writer keeps writing the regular collection, so in that mode the
+server runs `timeseries_sync_loop`, which repeats the (checkpointed,
+idempotent) migration every METAR_TS_SYNC_SECONDS to copy new reports over.
+
+Usage (copy the regular collection into the time-series one; resumable):
+    python metar_timeseries.py
+"""
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from bson import ObjectId
+from pymongo.errors import CollectionInvalid
+
+from metar_normalize import normalized_fields, ensure_metar_indexes
+
+logger = logging.getLogger(__name__)
+
+METAR_STORAGE = os.getenv("METAR_STORAGE", "collection").lower()
+COLLECTION_METAR_TS = os.getenv("COLLECTION_METAR_TS", "metar_history")
+METAR_RETENTION_DAYS = int(os.getenv("METAR_RETENTION_DAYS", "90"))
+COLLECTION_MIGRATIONS = "metar_migrations"
+TS_SYNC_SECONDS = int(os.getenv("METAR_TS_SYNC_SECONDS", "60"))
+# ObjectIds from concurrent writers are only roughly ordered: each sync pass
+# re-reads this far behind its checkpoint (already-copied reports are dropped)
+TS_SYNC_REWIND_SECONDS = int(os.getenv("METAR_TS_SYNC_REWIND_SECONDS", "120"))
+
+TIMESERIES_OPTIONS = {
+    "timeField": "timestamp",
+    "metaField": "stationICAO",
+    "granularity": "minutes",
+}
+
+
+def retention_seconds() -> int:
+    return METAR_RETENTION_DAYS * 24 * 60 * 60
+
+
+async def ensure_timeseries_collection(db, name: str = COLLECTION_METAR_TS) -> None:
+    """Create the time-series collection if missing; keep its retention in sync with config."""
+    try:
+        await db.create_collection(
+            name,
+            timeseries=TIMESERIES_OPTIONS,
+            expireAfterSeconds=retention_seconds(),
+        )
+        logger.info(f"Created time-series collection {name} (retention {METAR_RETENTION_DAYS} days)")
+    except CollectionInvalid:
+        # already exists -> only update retention
+        await db.command("collMod", name, expireAfterSeconds=retention_seconds())
+
+
+def to_timeseries_document(doc: Dict) -> Dict:
+    """Time-series copy of a regular METAR document (normalised fields filled in)."""
+    ts_doc = dict(doc)
+    ts_doc.pop("_id", None)
+    metar = ts_doc.get("metar")
+    if isinstance(metar, dict):
+        metar = dict(metar)
+        for path, value in normalized_fields(doc).items():
+            metar[path.split(".", 1)[1]] = value
+        ts_doc["metar"] = metar
+    return ts_doc
+
+
+async def drop_already_stored(db, target: str, docs: List[Dict]) -> List[Dict]:
+    """
+    `docs` minus those whose (stationICAO, timestamp) is already in `target`.
+    Time-series collections have no unique indexes or upserts, so this is what
+    keeps a resumed migration or a re-sent report from being stored twice; the
+    lookup uses the metaField + timeField that the collection is bucketed on.
+    """
+    if not docs:
+        return docs
+    by_station = defaultdict(list)
+    for doc in docs:
+        by_station[doc["stationICAO"]].append(doc["timestamp"])
+    query = {"$or": [{"stationICAO": station, "timestamp": {"$in": times}} for station, times in by_station.items()]}
+    existing = set()
+    async for doc in db[target].find(query, {"stationICAO": 1, "timestamp": 1, "_id": 0}):
+        existing.add((doc["stationICAO"], doc["timestamp"]))
+    if existing:
+        logger.info(f"Skipping {len(existing)} METAR documents already in {target}")
+    return [d for d in docs if (d["stationICAO"], d["timestamp"]) not in existing]
+
+
+async def migrate_to_timeseries(db, source: str, target: str = COLLECTION_METAR_TS, batch_size: int = 1000,
+                                rewind_seconds: int = 0) -> int:
+    """
+    Copy `source` into the time-series `target`, in `_id` order.
+    Progress is checkpointed in COLLECTION_MIGRATIONS so an interrupted run resumes.
+    Documents without a datetime `timestamp` can't go into a time-series collection and are skipped.
+    The batch after the checkpoint may have been (partly) written by a run that stopped before
+    checkpointing it, so it is checked against `target` first; re-running is idempotent.
+    `rewind_seconds` re-reads ObjectIds that much older than the checkpoint (and checks them
+    against `target` too), for sources written concurrently while the copy runs.
+    """
+    await ensure_timeseries_collection(db, target)
+    state_id = f"{source}->{target}"
+    state = await db[COLLECTION_MIGRATIONS].find_one({"_id": state_id}) or {}
+    last_id = state.get("last_id")
+
+    start_id = last_id
+    if rewind_seconds and isinstance(last_id, ObjectId):
+        start_id = ObjectId.from_datetime(last_id.generation_time - timedelta(seconds=rewind_seconds))
+    query = {"_id": {"$gt": start_id}} if start_id is not None else {}
+    cursor = db[source].find(query).sort("_id", 1).batch_size(batch_size)
+
+    copied = skipped = 0
+    batch = []
+    batch_first_id = batch_last_id = None
+    # batches up to the checkpoint (when rewinding) and the first one after it, which an
+    # interrupted run may have written without checkpointing, are checked against `target`;
+    # checking goes on while it still finds copies
+    check_existing = True
+
+    async def flush():
+        nonlocal copied, batch, check_existing
+        if batch and check_existing:
+            fresh = await drop_already_stored(db, target, batch)
+            check_existing = len(fresh) < len(batch) or (last_id is not None and batch_first_id <= last_id)
+            batch = fresh
+        inserted = len(batch)
+        if batch:
+            await db[target].insert_many(batch, ordered=False)
+            copied += inserted
+            batch = []
+        if batch_last_id is not None:
+            await db[COLLECTION_MIGRATIONS].update_one(
+                {"_id": state_id},
+                # $max: a rewound pass never moves the checkpoint back
+                {"$max": {"last_id": batch_last_id},
+                 "$set": {"updated_at": datetime.now(timezone.utc)},
+                 "$inc": {"copied": inserted}},
+                upsert=True,
+            )
+
+    async for doc in cursor:
+        batch_last_id = doc["_id"]
+        if not isinstance(doc.get("timestamp"), datetime) or not doc.get("stationICAO"):
+            skipped += 1
+            continue
+        if not batch:
+            batch_first_id = doc["_id"]
+        batch.append(to_timeseries_document(doc))
+        if len(batch) >= batch_size:
+            await flush()
+            logger.info(f"Migrated {copied} METAR documents so far")
+    await flush()
+
+    logger.info(f"Time-series migration complete: {copied} copied, {skipped} skipped")
+    return copied
+
+
+async def timeseries_sync_loop(db, source: str, target: str = COLLECTION_METAR_TS,
+                               interval_seconds: int = TS_SYNC_SECONDS) -> None:
+    """Background task: keep copying new reports from `source` into the time-series `target`."""
+    while True:
+        try:
+            await migrate_to_timeseries(db, source, target, rewind_seconds=TS_SYNC_REWIND_SECONDS)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Time-series sync from {source} failed: {e}", exc_info=True)
+        await asyncio.sleep(interval_seconds)
+
+
+async def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv()
+    client = AsyncIOMotorClient(os.getenv("MONGODB_URL", "mongodb://localhost:27017"))
+    db = client[os.getenv("DATABASE_NAME", "metar_data")]
+    try:
+        await migrate_to_timeseries(db, os.getenv("COLLECTION_METAR", "metar_data"))
+        await ensure_metar_indexes(db[COLLECTION_METAR_TS])
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,142 @@
+"""
+Prompt-cache benchmark for the weather gateway message layout.
+
+Replays a short synthetic session twice through `run_call` from the
+PromptCaching harness:
+  - legacy: system + airport TOON + schema + history + summary + user, no cache key
+  - stable: prompt_layout.build_chat_messages + PROMPT_CACHE_KEY
+and reports cache hit rate, cached-token ratio and latency for each.
+
+Both layouts start from the same airport/schema content, so a pass would
+otherwise find the cache already warmed by the other one. Each pass gets
+its own namespace, a run-unique marker at the very start of the prompt
+plus its own cache key for the stable layout, so the two never share
+cached prefixes. Each pass is warmed with one untimed call before it is
+measured, and the order of the passes is random (it is printed).
+
+Usage:
+    python prompt_cache_benchmark.py [turns]
+"""
+import importlib.util
+import os
+import random
+import sys
+import uuid
+from importlib.machinery import SourceFileLoader
+
+from toon import encode
+
+from variables import weather_schema, toon_payload, msg
+from prompt_layout import build_static_prefix, build_chat_messages, PROMPT_CACHE_KEY
+
+
+def load_harness():
+    """Import the extension-less PromptCaching script as a module."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "PromptCaching")
+    loader = SourceFileLoader("prompt_caching_harness", path)
+    spec = importlib.util.spec_from_loader(loader.name, loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+
+QUESTIONS = [
+    "What is the current weather at VIDP?",
+    "Any thunderstorms reported at VABB in the last 3 hours?",
+    "Compare visibility at VOBL and VOMM.",
+    "Is fog expected at VIDP tonight?",
+    "Summarise wind conditions at VECC.",
+    "Which stations reported CB clouds today?",
+]
+
+
+def build_legacy_messages(history, user_prompt, summary):
+    messages = [
+        {"role": "system", "content": msg},
+        {"role": "system", "content": "key Value pairs of airport:\n" + toon_payload},
+        {"role": "system", "content": "Schema (JSON):\n" + encode(weather_schema)},
+    ]
+    messages.extend(history)
+    if summary:
+        messages.append({"role": "system", "content": "The summary of older messages:\n" + summary})
+    messages.append({"role": "user", "content": "The User prompt is as follows:\n" + user_prompt})
+    return messages
+
+
+def build_messages(layout, static_prefix, history, question, summary, namespace):
+    if layout == "legacy":
+        messages = build_legacy_messages(history, question, summary)
+    else:
+        messages = build_chat_messages(static_prefix, history, question, summary)
+    # the namespace leads the prompt, so cached prefixes of the two passes never match
+    messages[0] = {**messages[0], "content": f"[benchmark {namespace}]\n" + messages[0]["content"]}
+    return messages
+
+
+def replay(harness, layout, turns, namespace):
+    history = []
+    summary = None
+    stats = {"calls": 0, "hits": 0, "cached": 0, "prompt": 0, "latency": []}
+    static_prefix = build_static_prefix(msg, toon_payload, weather_schema)
+    cache_key = None if layout == "legacy" else f"{PROMPT_CACHE_KEY}-{namespace}"
+
+    # warm-up: pay this pass's cold-cache miss outside the measurement
+    harness.run_call(f"{layout} warm-up", build_messages(layout, static_prefix, [], QUESTIONS[0], None, namespace),
+                     cache_key=cache_key)
+
+    for turn in range(turns):
+        question = QUESTIONS[turn % len(QUESTIONS)]
+        # the summary changes once, half way through, like a summarisation pass would
+        if turn == turns // 2:
+            summary = f"User asked about {turn} stations so far; focus on Indian metro airports."
+
+        messages = build_messages(layout, static_prefix, history, question, summary, namespace)
+        resp, dt, cached, prompt_tokens = harness.run_call(f"{layout} turn {turn + 1}", messages, cache_key=cache_key)
+        answer = resp.choices[0].message.content or ""
+
+        stats["calls"] += 1
+        stats["hits"] += 1 if cached else 0
+        stats["cached"] += cached or 0
+        stats["prompt"] += prompt_tokens or 0
+        stats["latency"].append(dt)
+
+        history.append({"role": "user", "content": question})
+        history.append({"role": "assistant", "content": answer})
+
+    return stats
+
+
+def report(layout, stats):
+    calls = stats["calls"] or 1
+    latency = stats["latency"]
+    avg_ms = 1000 * sum(latency) / len(latency) if latency else 0.0
+    print(f"\n=== {layout} ===")
+    print(f"Hit rate: {stats['hits']}/{stats['calls']} ({100.0 * stats['hits'] / calls:.0f}%)")
+    print(f"Cached tokens: {stats['cached']} / {stats['prompt']} prompt tokens")
+    print(f"Avg latency: {avg_ms:.0f} ms")
+    return avg_ms
+
+
+def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    harness = load_harness()
+
+    run_id = uuid.uuid4().hex[:8]
+    order = random.sample(["legacy", "stable"], 2)
+    print(f"Pass order: {' -> '.join(order)} (run {run_id})")
+    stats = {layout: replay(harness, layout, turns, f"{run_id}-{layout}") for layout in order}
+    legacy, stable = stats["legacy"], stats["stable"]
+
+    legacy_ms = report("legacy", legacy)
+    stable_ms = report("stable", stable)
+
+    print("\n=== Comparison ===")
+    print(f"Hit rate delta: {legacy['hits']} -> {stable['hits']} of {turns} turns")
+    print(
+        f"Latency delta: {legacy_ms:.0f} ms -> {stable_ms:.0f} ms "
+        f"({harness.pct(legacy_ms - stable_ms, legacy_ms):.1f}% faster)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Message assembly for the weather gateway, laid out for provider-side prompt caching.
+
+Azure OpenAI reuses the processed prefix of a prompt when the first 1,024+
+tokens are byte-identical to a recent request routed with the same
+`prompt_cache_key`. So the request is ordered from most to least stable:
+
+    [system prompt][airport TOON][schema TOON]   <- static, built once per process
+    [summary of older messages]                  <- changes only after summarisation
+    [history ... ]                               <- append-only within a session
+    [current user prompt]                        <- always new
+
+The per-user summary used to sit after the history, which changed the
+prefix on every turn.
+"""
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from toon import encode
+
+logger = logging.getLogger(__name__)
+
+# Stable per deployment: same key => same cache routing for the shared prefix
+PROMPT_CACHE_KEY = os.getenv(
+    "PROMPT_CACHE_KEY",
+    f"weather-gateway-{os.getenv('deployment', 'default')}-prefix-v1",
+)
+
+_static_prefix_cache: Dict[tuple, List[Dict[str, str]]] = {}
+
+
+def build_static_prefix(sys_msg: str, toon: str, schema: Any) -> List[Dict[str, str]]:
+    """
+    Return the cacheable prefix messages. Built once per (sys_msg, toon, schema)
+    so the bytes sent are identical on every request.
+    """
+    schema_toon = schema if isinstance(schema, str) else encode(schema)
+    key = (sys_msg, toon, schema_toon)
+    prefix = _static_prefix_cache.get(key)
+    if prefix is None:
+        prefix = [
+            {"role": "system", "content": sys_msg},
+            {"role": "system", "content": "key Value pairs of airport:\n" + toon},
+            {"role": "system", "content": "Schema (JSON):\n" + schema_toon},
+        ]
+        _static_prefix_cache[key] = prefix
+    return prefix
+
+
+def build_chat_messages(
+    static_prefix: List[Dict[str, str]],
+    history_messages: List[Dict[str, str]],
+    user_prompt: str,
+    summary: Optional[str] = None,
+) -> List[Dict[str, str]]:
+    """Assemble a request: static prefix, summary, history, then the user prompt."""
+    # copy the prefix dicts: later turns append to this list, never to the cached prefix
+    messages = [dict(m) for m in static_prefix]
+
+    if summary:
+        messages.append({
+            "role": "system",
+            "content": "The summary of older messages:\n" + summary,
+        })
+
+    messages.extend(history_messages)
+    messages.append({
+        "role": "user",
+        "content": "The User prompt is as follows:\n" + user_prompt,
+    })
+    return messages
+
+
+# ----------------- usage metrics -----------------
+
+def _get(obj, key):
+    """Read a field from a dict or a pydantic model (same as PromptCaching.run_call)."""
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(key)
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump().get(key)
+    return getattr(obj, key, None)
+
+
+class PromptCacheMetrics:
+    """Process-wide counters of prompt tokens vs. cached prompt tokens."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.cache_hit_requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def record(self, response) -> Optional[int]:
+        """Record usage from a chat completion; returns cached_tokens for that call."""
+        usage = _get(response, "usage")
+        if not usage:
+            return None
+        details = _get(usage, "prompt_tokens_details") or {}
+        cached = _get(details, "cached_tokens") or 0
+        prompt = _get(usage, "prompt_tokens") or 0
+
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt
+            self.cached_tokens += cached
+            if cached > 0:
+                self.cache_hit_requests += 1
+
+        logger.info("Prompt cache: cached_tokens=%s prompt_tokens=%s", cached, prompt)
+        return cached
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "prompt_cache_key": PROMPT_CACHE_KEY,
+                "requests": self.requests,
+                "cache_hit_requests": self.cache_hit_requests,
+                "hit_rate": (self.cache_hit_requests / self.requests) if self.requests else 0.0,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "cached_token_ratio": (self.cached_tokens / self.prompt_tokens) if self.prompt_tokens else 0.0,
+            }
+
+
+prompt_cache_metrics = PromptCacheMetrics()
@@ -21,7 +21,7 @@ from azure.eventhub.aio import EventHubProducerClient
 # >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
 #  IMPORT YOUR EMAIL-EXTRACTOR LOGIC HERE
 # >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
-from test2 import (
+from email_extraction import (
     get_all_messages,
     process_single_email,
 )
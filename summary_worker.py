@@ -0,0 +1,127 @@
+"""
+Background conversation summarisation for the weather gateway.
+
+After each turn the gateway schedules its user + session here. The worker
+measures the context that session would send next time and, once it
+crosses SUMMARY_TRIGGER_RATIO of the context limit (i.e. *before* the hard
+limit is hit), it rolls the previous summary and the history into a new
+summary, stores it through mongoDB.insert_weather_summary and trims the
+history it summarised (turns added meanwhile are kept). The request path only ever reads the latest stored summary.
+"""
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_TRIGGER_RATIO = float(os.getenv("SUMMARY_TRIGGER_RATIO", "0.75"))
+SUMMARY_KEEP_RECENT = int(os.getenv("SUMMARY_KEEP_RECENT", "5"))
+
+
+class SummaryWorker:
+    """
+    Queue of (user_id, session_id) pairs, drained by background tasks.
+    A session is queued at most once at a time.
+    """
+
+    def __init__(
+        self,
+        load_history: Callable[[str, str], Awaitable[List[Dict]]],
+        get_summary: Callable[[str, str], Awaitable[Optional[str]]],
+        save_summary: Callable[[str, str, str], Awaitable[None]],
+        trim_history: Callable[[str, str, int], Awaitable[bool]],
+        summarize: Callable[[List[Dict]], Awaitable[str]],
+        context_tokens: Callable[[List[Dict], Optional[str]], int],
+        trigger_tokens: int,
+        keep_recent: int = SUMMARY_KEEP_RECENT,
+        workers: int = 1,
+    ):
+        self.load_history = load_history
+        self.get_summary = get_summary
+        self.save_summary = save_summary
+        self.trim_history = trim_history
+        self.summarize = summarize
+        self.context_tokens = context_tokens
+        self.trigger_tokens = trigger_tokens
+        self.keep_recent = keep_recent
+        self.workers = max(1, workers)
+
+        self._queue: "asyncio.Queue[Tuple[str, str]]" = asyncio.Queue()
+        self._pending: Set[Tuple[str, str]] = set()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+        logger.info("Summary worker started (trigger=%d tokens)", self.trigger_tokens)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def schedule(self, user_id: str, session_id: str) -> None:
+        """Non-blocking: queue a size check for this session."""
+        item = (user_id, session_id)
+        if item in self._pending:
+            return
+        self._pending.add(item)
+        self._queue.put_nowait(item)
+
+    async def _run(self) -> None:
+        while True:
+            user_id, session_id = await self._queue.get()
+            try:
+                await self.summarize_if_needed(user_id, session_id)
+            except Exception as e:
+                logger.error("Background summary failed for user=%s session=%s: %s", user_id, session_id, e, exc_info=True)
+            finally:
+                self._pending.discard((user_id, session_id))
+                self._queue.task_done()
+
+    async def summarize_if_needed(self, user_id: str, session_id: str) -> bool:
+        history = await self.load_history(user_id, session_id)
+        if len(history) <= self.keep_recent:
+            return False
+
+        previous_summary = await self.get_summary(user_id, session_id)
+        tokens = self.context_tokens(history, previous_summary)
+        if tokens < self.trigger_tokens:
+            return False
+
+        logger.info(
+            "Context for user=%s session=%s at %d tokens (trigger %d), summarising in background",
+            user_id, session_id, tokens, self.trigger_tokens,
+        )
+        messages = []
+        if previous_summary:
+            messages.append({"role": "system", "content": "The summary of older messages:\n" + previous_summary})
+        messages.extend(history)
+
+        summary = await self.summarize(messages)
+        await self.save_summary(user_id, session_id, summary)
+
+        # turns may have landed while summarising; keep them on top of keep_recent
+        appended = _appended_since(history, await self.load_history(user_id, session_id))
+        if appended is None:
+            logger.warning("History for user=%s session=%s changed during summarising, not trimmed", user_id, session_id)
+            return True
+        await self.trim_history(user_id, session_id, self.keep_recent + appended)
+        return True
+
+
+def _appended_since(snapshot: List[Dict], current: List[Dict]) -> Optional[int]:
+    """
+    Number of messages appended to `current` after `snapshot` was loaded: the
+    smallest n for which current[:-n] ends with the snapshot's tail. None when
+    the snapshot's last message is no longer there (history deleted or rolled over).
+    """
+    for appended in range(len(current)):
+        end = len(current) - appended
+        overlap = min(len(snapshot), end)
+        if current[end - overlap:end] == snapshot[len(snapshot) - overlap:]:
+            return appended
+    return None
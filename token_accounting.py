@@ -0,0 +1,95 @@
+"""
+Token accounting for the chat context sent to Azure OpenAI.
+
+The tiktoken encoder is loaded once per model and token counts are cached
+per message content, so the system prompt, the airport TOON payload and
+each history entry are encoded once per process instead of every turn.
+Context size is then the sum of cached per-message counts.
+"""
+import json
+import logging
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+# pip install tiktoken
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gpt-4o"
+CONTEXT_TOKEN_LIMIT = 128000
+
+# Chat format overhead (see OpenAI cookbook "How to count tokens with tiktoken")
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+
+@lru_cache(maxsize=8)
+def get_encoding(model: str = DEFAULT_MODEL):
+    """Load (once) the encoding for a model. Falls back to cl100k_base."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+class TokenCounter:
+    """
+    Caches token counts by message text.
+
+    Message contents are treated as immutable: the same string always has
+    the same count, so a bounded LRU keyed on the text is enough.
+    """
+
+    def __init__(self, model: str = DEFAULT_MODEL, max_entries: int = 4096):
+        self.model = model
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def count_text(self, text: Optional[str]) -> int:
+        if not text:
+            return 0
+        cached = self._cache.get(text)
+        if cached is not None:
+            self._cache.move_to_end(text)
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        count = len(get_encoding(self.model).encode(text))
+        self._cache[text] = count
+        if len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return count
+
+    def count_message(self, message: Dict) -> int:
+        total = TOKENS_PER_MESSAGE
+        total += self.count_text(message.get("role"))
+
+        content = message.get("content")
+        if isinstance(content, list):
+            # content parts: [{"type": "text", "text": ...}, ...]
+            for part in content:
+                if isinstance(part, dict):
+                    total += self.count_text(part.get("text"))
+        elif content is not None:
+            total += self.count_text(str(content))
+
+        if message.get("tool_calls"):
+            total += self.count_text(json.dumps(message["tool_calls"], ensure_ascii=False))
+        if message.get("tool_call_id"):
+            total += self.count_text(message["tool_call_id"])
+        return total
+
+    def count_messages(self, messages: List[Dict]) -> int:
+        """Context size of a chat request: sum of cached per-message counts."""
+        return sum(self.count_message(m) for m in messages) + TOKENS_PER_REPLY
+
+    def exceeds_limit(self, messages: List[Dict], limit: int = CONTEXT_TOKEN_LIMIT) -> bool:
+        return self.count_messages(messages) > limit
+
+
+token_counter = TokenCounter()
@@ -0,0 +1,119 @@
+"""
+Concurrent execution of LLM tool calls against the MCP server.
+
+When the model asks for several tools in one turn (e.g. METAR for a few
+stations) the calls are independent, so we fire them together over the
+already-open MCP client session instead of awaiting them one by one.
+Outcomes are yielded as soon as each call finishes (so the gateway can
+stream AG-UI events early) and carry their original index so the tool
+messages can be appended back in the order the model asked for them.
+"""
+import asyncio
+import logging
+import os
+import time
+import traceback
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Per-turn cap on in-flight tool calls and per-call timeout (seconds)
+MAX_TOOL_CONCURRENCY = int(os.getenv("MAX_TOOL_CONCURRENCY", "4"))
+TOOL_CALL_TIMEOUT_SECONDS = float(os.getenv("TOOL_CALL_TIMEOUT_SECONDS", "60"))
+
+
+@dataclass
+class ToolCallOutcome:
+    index: int
+    tool_call_id: str
+    tool_name: str
+    tool_args: Optional[dict]
+    content: str
+    ok: bool
+    elapsed: float
+
+
+def tool_result_to_text(result: Any) -> str:
+    """Normalise a fastmcp CallToolResult (or raw value) into plain text."""
+    if hasattr(result, "data"):
+        result_data = result.data
+    else:
+        result_data = result
+
+    if isinstance(result_data, dict):
+        return result_data.get("content", str(result_data))
+    return str(result_data)
+
+
+class ToolCallScheduler:
+    """
+    Runs a batch of tool calls concurrently on one MCP client.
+
+    MCP multiplexes requests over a session by request id, so a single
+    connected client can carry several in-flight `call_tool` requests.
+    """
+
+    def __init__(
+        self,
+        client,
+        max_concurrency: int = MAX_TOOL_CONCURRENCY,
+        call_timeout: float = TOOL_CALL_TIMEOUT_SECONDS,
+    ):
+        self.client = client
+        self.max_concurrency = max(1, max_concurrency)
+        self.call_timeout = call_timeout
+
+    async def _execute(self, semaphore: asyncio.Semaphore, index: int, tool_call, tool_args) -> ToolCallOutcome:
+        tool_name = tool_call.function.name
+        async with semaphore:
+            t0 = time.perf_counter()
+            try:
+                print(f"  📡 Executing authenticated tool call on MCP server: {tool_name}")
+                result = await asyncio.wait_for(
+                    self.client.call_tool(tool_name, tool_args),
+                    timeout=self.call_timeout,
+                )
+                content = tool_result_to_text(result)
+                ok = True
+                print(f"  ✅ Tool result ({tool_name}): {content[:200]}{'...' if len(content) > 200 else ''}")
+            except asyncio.TimeoutError:
+                content = f"Tool call failed: timed out after {self.call_timeout:g}s"
+                ok = False
+                print(f"  ⏰ Tool call timed out: {tool_name}")
+            except Exception as tool_error:
+                content = f"Tool call failed: {str(tool_error)}"
+                ok = False
+                print(f"  ❌ Tool call failed: {tool_error}")
+                traceback.print_exc()
+            elapsed = time.perf_counter() - t0
+
+        logger.info("Tool %s finished in %.0f ms (ok=%s)", tool_name, elapsed * 1000, ok)
+        return ToolCallOutcome(
+            index=index,
+            tool_call_id=tool_call.id,
+            tool_name=tool_name,
+            tool_args=tool_args,
+            content=content,
+            ok=ok,
+            elapsed=elapsed,
+        )
+
+    async def run(self, calls: List[Tuple[Any, Optional[dict]]]) -> AsyncIterator[ToolCallOutcome]:
+        """
+        Execute (tool_call, tool_args) pairs concurrently.
+        Yields outcomes in completion order; use `outcome.index` to restore call order.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks = [
+            asyncio.create_task(self._execute(semaphore, i, tool_call, tool_args))
+            for i, (tool_call, tool_args) in enumerate(calls)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # client disconnected mid-turn -> don't leave calls running
+            for task in tasks:
+                if not task.done():
+                    task.cancel()